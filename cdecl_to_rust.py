@@ -13,16 +13,40 @@ bsd_signal: fn(int, *fn(int) -> void) -> *fn(int) -> void
 ```
 测试使用的 cdecl 版本为 2.5-3
 注意: 目前发现变量名 func 在 cdecl 会触发语法错误
+
+也可以使用 c_to_rs 在进程内直接解析 C 声明, 不经过 cdecl
 """
 
+import os
 import re
+import sys
 
-from typing import Any, Callable, Generic, Self, Optional, TypeVar
-from re import Pattern, findall, escape
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from getopt import gnu_getopt, GetoptError
+from hashlib import sha256
+from shlex import split as shell_split
+from shutil import which
+from string import Formatter
+from subprocess import Popen, PIPE, STDOUT
+from sys import intern
+from tempfile import mkstemp
+from typing import (
+        Any, Callable, Generic, NamedTuple, Self, Optional, TypeVar)
+from re import Pattern, escape
 
 
 class FmtNode:
-    """格式化树, 格式化一整个树形结构"""
+    """格式化树, 格式化一整个树形结构
+
+    渲染使用显式栈, 写入同一个输出缓冲, 所以很深的树也不会递归过深.
+    格式串仅支持自动编号的 `{}`
+    """
+    __slots__ = ("fmtter", "args")
+
     @classmethod
     def new(cls, *args, **kw) -> Self:
         """use init
@@ -33,10 +57,18 @@ class FmtNode:
         self.fmtter = fmtter
         self.args = args
 
+    def parts(self) -> Iterator[Any]:
+        """依次产出字面量与参数"""
+        args = iter(self.args)
+        for literal, has_field in parse_fmt(self.fmtter):
+            yield literal
+            if has_field:
+                yield next(args)
+
     def __str__(self) -> str:
         """__str__
         """
-        return self.fmtter.format(*self.args)
+        return render(self)
 
     def __repr__(self) -> str:
         """__repr__
@@ -44,27 +76,57 @@ class FmtNode:
         return f"{self.__class__.__name__}({self.fmtter!r}, {self.args})"
 
 
-class LazyStr:
-    """惰性初始化的字符串"""
-    def __init__(self, data: Callable[[], str]):
-        self.initer = data
-        self.__inited = False
-        self.__dataed: Optional[str] = None
+class FmtJoin:
+    """以分隔符连接的一组节点"""
+    __slots__ = ("sep", "items")
+
+    def __init__(self, sep: str, items: list[Any]):
+        self.sep = sep
+        self.items = items
+
+    def parts(self) -> Iterator[Any]:
+        """依次产出各项与分隔符"""
+        for i, item in enumerate(self.items):
+            if i:
+                yield self.sep
+            yield item
 
     def __str__(self) -> str:
         """__str__"""
-        if not self.__inited:
-            self.__dataed = self.initer()
-            self.__inited = True
-        return self.__dataed  # type: ignore
+        return render(self)
 
     def __repr__(self) -> str:
         """__repr__"""
-        if self.__inited:
-            value = f"inited: {self.__dataed!r}"
+        return f"{self.__class__.__name__}({self.sep!r}, {self.items})"
+
+
+@lru_cache(maxsize=None)
+def parse_fmt(fmtter: str) -> tuple[tuple[str, bool], ...]:
+    """将格式串切分为 (字面量, 之后是否有字段)"""
+    result = []
+    for literal, field, spec, conv in Formatter().parse(fmtter):
+        if field or spec or conv:
+            raise ValueError(f"only support auto field: {fmtter!r}")
+        result.append((literal, field is not None))
+    return tuple(result)
+
+
+def render(root: FmtNode | FmtJoin) -> str:
+    """以显式栈渲染整个树, 线性时间"""
+    out: list[str] = []
+    stack = [root.parts()]
+    while stack:
+        for part in stack[-1]:
+            if isinstance(part, str):
+                out.append(part)
+            elif isinstance(part, (FmtNode, FmtJoin)):
+                stack.append(part.parts())
+                break
+            else:
+                out.append(str(part))
         else:
-            value = f"noinit: {self.initer!r}"
-        return f"{self.__class__.__name__}({value})"
+            stack.pop()
+    return "".join(out)
 
 
 EMPTYS = r" \t\r\n"
@@ -74,18 +136,44 @@ LONG_SPLIT_INLINE_REGEX = "|".join(map(escape, LONG_SPLITS))
 LONG_SPLIT_REGEX = fr"(?:{LONG_SPLIT_INLINE_REGEX})"
 SPLIT_CHARS = escape(r""""#$%&'()*+,-./:;<=>?@[\]^`{|}~""")
 IDENT_PAT = f"[^{EMPTYS}{SPLIT_CHARS}]+"
-# 根据 findall 返回 [(str, str)] 仅取元素 1 以跳过空匹配
+# 前导空白并入匹配, 仅一个分组, 以免 findall 产出空白元组
 SPLIT_FIND_REGEX = (
-        fr"([{EMPTYS}]+)|({LONG_SPLIT_REGEX}"
-        fr"|[{SPLIT_CHARS}]|{IDENT_PAT})")
+        fr"[{EMPTYS}]*({LONG_SPLIT_REGEX}|[{SPLIT_CHARS}]|{IDENT_PAT})")
 SPLIT_FIND_REGEX_OBJ: Pattern[str] = re.compile(SPLIT_FIND_REGEX)
+# 同上, 以命名分组区分种类, lastgroup 即种类
+TOKEN_REGEX = (
+        fr"[{EMPTYS}]*(?:(?P<punct>{LONG_SPLIT_REGEX}|[{SPLIT_CHARS}])"
+        fr"|(?P<ident>{IDENT_PAT}))")
+TOKEN_REGEX_OBJ: Pattern[str] = re.compile(TOKEN_REGEX)
+Span = tuple[str, int, int]
+
+
+def iter_spans(
+        source: str,
+        pos: int = 0,
+        endpos: Optional[int] = None,
+        ) -> Iterator[Span]:
+    """惰性产出词法单元的 (种类, 开始, 结束), 不复制源字符串
+
+    种类为 punct 或 ident
+    """
+    if endpos is None:
+        endpos = len(source)
+    for match_ in TOKEN_REGEX_OBJ.finditer(source, pos, endpos):
+        kind = match_.lastgroup
+        yield kind, *match_.span(kind)
+
+
+def iter_tokens(source: str) -> Iterator[str]:
+    """惰性产出 source 的词法单元, 按 iter_spans 的位置切片"""
+    for _, start, end in iter_spans(source):
+        yield intern(source[start:end])
 
 
 def split_tokens(source: str) -> list[str]:
     """简单的通用词法分割 (基于单长分割字符与单长空白字符)
     """
-    find_res = SPLIT_FIND_REGEX_OBJ.findall(source)
-    return [i[1] for i in find_res if i[1]]
+    return list(map(intern, SPLIT_FIND_REGEX_OBJ.findall(source)))
 
 
 def assert_eq(val1: Any, val2: Any) -> None:
@@ -109,8 +197,8 @@ T = TypeVar("T")
 class Tokens(Generic[T]):
     """用于遍历及预查的类
     """
-    def __init__(self, data: list[T] | tuple[T]):
-        self.data: list[T] | tuple[T] = data
+    def __init__(self, data: list[T] | tuple[T, ...]):
+        self.data: list[T] | tuple[T, ...] = data
         self.idx: int = 0
 
     def get(self) -> T:
@@ -135,52 +223,323 @@ class Tokens(Generic[T]):
             raise raise_fun()
 
 
-def english_to_rs(input_tokens: list[str]) -> str:
-    """english_to_rs
-    input:
-    `declare <name> as <english>` or `cast <name> into <english>`
+class LazyTokens(Tokens[T]):
+    """包装惰性迭代器的 Tokens, 仅缓冲 get_next 预查所需的元素
+
+    data 为当前的预查缓冲, 仅用于错误信息; idx 为已取出的元素数
     """
-    length = len(input_tokens)
-    if length < 4:
-        raise ValueError(f"length < 4, {input_tokens}")
+    def __init__(self, data: Iterable[T]):  # pylint: disable=super-init-not-called
+        self.iter: Iterator[T] = iter(data)
+        self.buffer: deque[T] = deque()
+        self.idx = 0
 
-    tokens = Tokens(input_tokens)
+    @property
+    def data(self) -> tuple[T, ...]:  # type: ignore[override]
+        """预查缓冲"""
+        return tuple(self.buffer)
 
-    def get() -> str:
-        return tokens.get()
+    def fill(self, size: int) -> bool:
+        """将预查缓冲填至 size 个, 迭代器耗尽时返回 False"""
+        buffer = self.buffer
+        while len(buffer) < size:
+            try:
+                buffer.append(next(self.iter))
+            except StopIteration:
+                return False
+        return True
 
-    def build() -> FmtNode:
+    def get(self) -> T:
+        """get next value and index next
+        """
+        if self.buffer:
+            res = self.buffer.popleft()
+        else:
+            try:
+                res = next(self.iter)
+            except StopIteration:
+                raise IndexError("tokens exhausted") from None
+        self.idx += 1
+        return res
+
+    def get_next(self, step: int = 0) -> Optional[T]:
+        """get_next
+        """
+        if self.fill(step + 1):
+            return self.buffer[step]
+        return None
+
+    def check_to_end(self, raise_fun: Callable[[], BaseException]) -> None:
+        """check
+        """
+        if self.fill(1):
+            raise raise_fun()
+
+
+class FnNode(FmtNode):
+    """函数类型节点, 保留参数与返回类型以便生成 extern 块"""
+    __slots__ = ("params", "result")
+
+    def __init__(self, params: list[FmtNode], result: FmtNode):
+        super().__init__("fn({}) -> {}", FmtJoin(", ", params), result)
+        self.params = params
+        self.result = result
+
+
+def rs_fn(params: list[FmtNode], result: FmtNode) -> FmtNode:
+    """fn(<params>) -> <result>"""
+    return FnNode(params, result)
+
+
+def rs_pointer(to: FmtNode) -> FmtNode:
+    """*<to>"""
+    return FmtNode("*{}", to)
+
+
+def rs_array(of: FmtNode, num: Optional[int] = None) -> FmtNode:
+    """[<of>; <num>] 或无长度的 [<of>]"""
+    if num is None:
+        return FmtNode("[{}]", of)
+    return FmtNode("[{}; {}]", of, num)
+
+
+def rs_wrap(type_: str, value: FmtNode) -> FmtNode:
+    """带括号的结构, 如 const(<value>)"""
+    return FmtNode(f"{type_}({{}})", value)
+
+
+class CacheInfo(NamedTuple):
+    """与 functools 的 CacheInfo 相同"""
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class LruCache:
+    """有上限的 LRU 缓存, 查询与写入分开, 以便在显式栈解析中使用"""
+    __slots__ = ("maxsize", "data", "hits", "misses")
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.data: OrderedDict[Any, Any] = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key: Any) -> Any:
+        """未命中时返回 None"""
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Any, value: Any) -> None:
+        """put"""
+        self.data[key] = value
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def info(self) -> CacheInfo:
+        """info"""
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.data))
+
+    def clear(self) -> None:
+        """clear"""
+        self.data.clear()
+        self.hits = self.misses = 0
+
+
+FRAGMENT_CACHE_SIZE = 4096
+# 更长的片段几乎不会重复, 不缓存, 也避免深层嵌套时逐层复制片段
+FRAGMENT_MAX_TOKENS = 64
+ENGLISH_CACHE = LruCache(FRAGMENT_CACHE_SIZE)
+RS_CACHE = LruCache(FRAGMENT_CACHE_SIZE)
+OPEN_BRACKETS = frozenset("([")
+CLOSE_BRACKETS = frozenset(")]")
+
+
+def fragment_ends(data: list[str] | tuple[str, ...]) -> list[int]:
+    """每个下标所在层级中, 其后第一个 `,` 或闭括号的下标, 线性时间
+
+    用于在解析前就确定一个参数的词法片段
+    """
+    ends = [0] * len(data)
+    stack = [len(data)]
+    for i in range(len(data) - 1, -1, -1):
+        token = data[i]
+        ends[i] = stack[-1]
+        if token in CLOSE_BRACKETS:
+            stack.append(i)
+        elif token == ",":
+            stack[-1] = i
+        elif token in OPEN_BRACKETS and len(stack) > 1:
+            stack.pop()
+            ends[i] = stack[-1]
+    return ends
+
+
+def cache_leaf(cache: LruCache, key: tuple[str, ...], node: FmtNode) -> FmtNode:
+    """渲染为字符串后包装为叶节点并缓存, 以便共享"""
+    leaf = FmtNode("{}", str(node))
+    cache.put(key, leaf)
+    return leaf
+
+
+# 等待子节点的续体: 接收子节点, 返回完成的节点, 或在压入新续体后返回 None
+Cont = Callable[[FmtNode], Optional[FmtNode]]
+
+
+class StackBuilder(ABC):
+    """显式栈构建树的公共部分, 函数参数以词法片段为键查询缓存"""
+    def __init__(self, tokens: Tokens[str], cache: LruCache):
+        self.tokens = tokens
+        self.cache = cache
+        self.stack: list[Cont] = []
+        self.ends: Optional[list[int]] = None
+
+    def get(self) -> str:
+        """get"""
+        return self.tokens.get()
+
+    def push(self, cont: Cont) -> None:
+        """push"""
+        self.stack.append(cont)
+
+    @abstractmethod
+    def start(self) -> Optional[FmtNode]:
+        """解析一个节点的开头, 叶节点直接返回, 否则压入续体并返回 None"""
+
+    def build(self) -> FmtNode:
+        """build"""
+        base = len(self.stack)
+        while True:
+            node = self.start()
+            while node is not None:
+                if len(self.stack) == base:
+                    return node
+                node = self.stack.pop()(node)
+
+    def params(
+            self,
+            close: str,
+            done: Callable[[list[FmtNode]], Optional[FmtNode]],
+            ) -> Optional[FmtNode]:
+        """解析函数参数直到 close, 之后以参数列表调用 done
+
+        命中缓存的参数直接跳过, 未命中的参数压入续体等待解析完成
+        """
+        params: list[FmtNode] = []
+        tokens = self.tokens
+
+        def next_param() -> Optional[FmtNode]:
+            while tokens.get_next() != close:
+                if self.ends is None:
+                    self.ends = fragment_ends(tokens.data)
+                start, end = tokens.idx, self.ends[tokens.idx]
+                if end - start > FRAGMENT_MAX_TOKENS:
+                    self.push(lambda node: finish_param(node, start, end, False))
+                    return None
+                key = tuple(tokens.data[start:end])
+                if (leaf := self.cache.get(key)) is None:
+                    self.push(lambda node: finish_param(node, start, end, True))
+                    return None
+                tokens.idx = end
+                params.append(leaf)
+                skip_comma()
+            assert_eq(self.get(), close)
+            return done(params)
+
+        def finish_param(node: FmtNode, start: int, end: int, cached: bool,
+                         ) -> Optional[FmtNode]:
+            # 参数必须恰好占满其词法片段, 否则以片段为键的缓存与结果不符
+            if tokens.idx != end:
+                raise AssertionError(f"Not fully build param: ({node}): "
+                                     f"{' '.join(tokens.data[start:end])!r}")
+            if cached:
+                node = cache_leaf(self.cache, tuple(tokens.data[start:end]), node)
+            params.append(node)
+            skip_comma()
+            return next_param()
+
+        def skip_comma() -> None:
+            if tokens.get_next() == ",":
+                assert_eq(tokens.get(), ",")
+
+        return next_param()
+
+
+def translate_fragment(
+        builder: type[StackBuilder],
+        cache: LruCache,
+        fragment: tuple[str, ...],
+        ) -> FmtNode:
+    """完整翻译一个片段, 结果以片段为键缓存"""
+    cached = len(fragment) <= FRAGMENT_MAX_TOKENS
+    if cached and (leaf := cache.get(fragment)) is not None:
+        return leaf
+    tokens = Tokens(fragment)
+    node = builder(tokens, cache).build()
+    tokens.check_to_end(lambda: AssertionError(
+        f"Not fully build: ({node}): {' '.join(fragment)!r}"))
+    return cache_leaf(cache, fragment, node) if cached else node
+
+
+def english_fragment(fragment: tuple[str, ...]) -> FmtNode:
+    """以词法片段为键缓存的 cdecl 描述句子树翻译"""
+    return translate_fragment(EnglishBuilder, ENGLISH_CACHE, fragment)
+
+
+def rs_fragment(fragment: tuple[str, ...]) -> FmtNode:
+    """以词法片段为键缓存的 rust 风格子树翻译"""
+    return translate_fragment(RsBuilder, RS_CACHE, fragment)
+
+
+def cache_info() -> dict[str, CacheInfo]:
+    """各子树缓存的命中统计"""
+    return {
+            "english_fragment": ENGLISH_CACHE.info(),
+            "rs_fragment": RS_CACHE.info(),
+            }
+
+
+def cache_clear() -> None:
+    """清空子树缓存"""
+    ENGLISH_CACHE.clear()
+    RS_CACHE.clear()
+
+
+class EnglishBuilder(StackBuilder):
+    """从 cdecl 描述句构建类型树"""
+    def start(self) -> Optional[FmtNode]:
+        get, tokens = self.get, self.tokens
         match get():
             case "function":
                 assert_eq(get(), "(")
-                params: list[FmtNode] = []
-                while tokens.get_next() != ")":
-                    params.append(build())
-                    if tokens.get_next() == ",":
-                        assert_eq(get(), ",")
-                assert_eq(get(), ")")
-                assert_eq(get(), "returning")
-                result = FmtNode(
-                        "fn({}) -> {}",
-                        LazyStr(lambda: ", ".join(map(str, params))),
-                        build())
+
+                def returning(params: list[FmtNode]) -> None:
+                    assert_eq(get(), "returning")
+                    self.push(lambda result: rs_fn(params, result))
+                return self.params(")", returning)
             case "pointer":
                 assert_eq(get(), "to")
-                result = FmtNode("*{}", build())
+                self.push(rs_pointer)
             case "array":
                 num_text = get()
                 if num_text == "of":
                     # non size array
-                    return FmtNode("[{}]", build())
+                    self.push(rs_array)
+                    return None
                 num: int = int(num_text)
                 assert_eq(get(), "of")
-                result = FmtNode("[{}; {}]", build(), num)
+                self.push(lambda of: rs_array(of, num))
             case ("struct" | "union" | "enum"
                   | "const" | "volatile" | "noalias"
                   | "signed" | "unsigned" | "register"
                   | "static") as type_:
                 # 带括号的结构
-                result = FmtNode(f"{type_}({{}})", build())
+                self.push(lambda value: rs_wrap(type_, value))
             case ("long" | "short") as type_:
                 # 整数修饰类
                 count = 1
@@ -193,15 +552,41 @@ def english_to_rs(input_tokens: list[str]) -> str:
                     if next_ == "int":
                         get()
                         return FmtNode(f"{' '.join((type_,) * count)} int")
-                    result = FmtNode(f"{' '.join((type_,) * count)}")
+                    return FmtNode(f"{' '.join((type_,) * count)}")
             case token:
-                result = FmtNode("{}", token)
-        return result
+                return FmtNode("{}", token)
+        return None
+
+
+def build_english(tokens: Tokens[str]) -> FmtNode:
+    """从 cdecl 描述句构建类型树, 函数参数经由缓存翻译"""
+    return EnglishBuilder(tokens, ENGLISH_CACHE).build()
+
+
+def english_to_rs(input_tokens: list[str]) -> str:
+    """english_to_rs
+    input:
+    `declare <name> as <english>` or `cast <name> into <english>`
+    """
+    length = len(input_tokens)
+    if length < 4:
+        raise ValueError(f"length < 4, {input_tokens}")
+
+    tokens = Tokens(input_tokens)
+
+    def get() -> str:
+        return tokens.get()
 
     def check_builded(root: FmtNode) -> None:
         tokens.check_to_end(lambda: AssertionError(
             f"Not fully build: ({root}): {' '.join(tokens.data)!r}"))
 
+    def build() -> FmtNode:
+        # 整个类型也是一个可缓存的片段
+        type_ = english_fragment(tuple(tokens.data[tokens.idx:]))
+        tokens.idx = len(tokens.data)
+        return type_
+
     match get():
         case "declare":
             var_name: str = get()
@@ -219,64 +604,267 @@ def english_to_rs(input_tokens: list[str]) -> str:
     return str(root)
 
 
-def rs_to_english(input_tokens: list[str]) -> str:
-    """rs to english
+C_TYPEDEF = "typedef"
+C_IGNORES = ("extern", "inline", "restrict",
+             "__inline", "__restrict", "__extension__")
+C_STORAGES = ("static", "register")
+C_QUALIFIERS = ("const", "volatile")
+C_SIGNS = ("signed", "unsigned")
+C_SIZES = ("long", "short")
+C_TAGS = ("struct", "union", "enum")
+C_TYPES = ("void", "char", "int", "float", "double", "_Bool", "bool")
+C_KEYWORDS = frozenset((C_TYPEDEF, *C_IGNORES, *C_STORAGES, *C_QUALIFIERS,
+                        *C_SIGNS, *C_SIZES, *C_TAGS, *C_TYPES))
+
+Wrapper = Callable[[FmtNode], FmtNode]
+
+
+def is_c_ident(token: Optional[str]) -> bool:
+    """是否为非关键字的标识符"""
+    return token is not None and (token[0].isalpha() or token[0] == "_") \
+            and token not in C_KEYWORDS
+
+
+class CParser:
+    """C 声明的解析器, 仅在函数参数处递归
+
+    直接构建与 english_to_rs 相同的树, 不再需要经由 cdecl 转为描述句.
+    参数名会被丢弃, 数组长度只支持整数字面量
     """
-    length = len(input_tokens)
-    if length < 3:
-        raise ValueError(f"length < 3, {input_tokens}")
-    tokens = Tokens(input_tokens)
+    def __init__(self, input_tokens: list[str]):
+        self.tokens = Tokens(input_tokens)
 
-    def check_builded(root: FmtNode) -> None:
-        tokens.check_to_end(lambda: AssertionError(
-            f"Not fully build: ({root}): {' '.join(tokens.data)!r}"))
+    def get(self) -> str:
+        """get"""
+        return self.tokens.get()
 
-    def get() -> str:
-        return tokens.get()
+    def peek(self, step: int = 0) -> Optional[str]:
+        """peek"""
+        return self.tokens.get_next(step)
 
-    def build() -> FmtNode:
+    def specifiers(self) -> tuple[bool, FmtNode]:
+        """解析声明说明符, 返回 (是否为 typedef, 基础类型)
+
+        按 cdecl 描述句的顺序排列各说明符后交给 build_english 构建
+        """
+        is_typedef = False
+        storages: list[str] = []
+        quals: list[str] = []
+        signs: list[str] = []
+        sizes: list[str] = []
+        base: list[str] = []
+        while (token := self.peek()) is not None:
+            if token == C_TYPEDEF:
+                is_typedef = True
+            elif token in C_IGNORES:
+                pass
+            elif token in C_STORAGES:
+                storages.append(token)
+            elif token in C_QUALIFIERS:
+                if token not in quals:
+                    quals.append(token)
+            elif token in C_SIGNS:
+                signs.append(token)
+            elif token in C_SIZES:
+                sizes.append(token)
+            elif token in C_TAGS:
+                base.append(self.get())
+                if not is_c_ident(token := self.peek()):
+                    raise AssertionError(
+                            f"{base[-1]} need name, found {token!r}")
+                base.append(token)  # type: ignore
+            elif token in C_TYPES \
+                    or not (base or signs or sizes) and is_c_ident(token):
+                # 在未出现类型时的标识符视为 typedef 的类型名
+                base.append(token)
+            else:
+                break
+            self.get()
+
+        if not (base or signs or sizes):
+            raise AssertionError(f"no type specifier, found {self.peek()!r}")
+        if not (base or sizes):
+            base.append("int")
+
+        words = Tokens([*storages, *quals, *signs, *sizes, *base])
+        result = build_english(words)
+        words.check_to_end(lambda: AssertionError(
+            f"invalid type specifiers: {' '.join(words.data)!r}"))
+        return is_typedef, result
+
+    def is_group(self) -> bool:
+        """左括号是否为分组而非函数参数"""
+        return self.peek() == "(" and (
+                self.peek(1) in ("*", "(", "[") or is_c_ident(self.peek(1)))
+
+    def declarator(self) -> tuple[Optional[str], Wrapper]:
+        """解析 (抽象) 声明符, 返回 (名字, 由基础类型构建完整类型的函数)
+
+        每层分组括号内先是指针前缀, 之后是数组或函数后缀,
+        按层记录后统一生成作用于基础类型的操作序列, 不随嵌套深度递归
+        """
+        prefixes: list[list[tuple[str, Any]]] = [[]]
+        while True:
+            if self.peek() == "*":
+                self.get()
+                quals: list[str] = []
+                while (token := self.peek()) in C_QUALIFIERS \
+                        or token in C_IGNORES:
+                    if self.get() in C_QUALIFIERS:
+                        quals.append(token)  # type: ignore
+                prefixes[-1].append(("*", quals))
+            elif self.is_group():
+                self.get()
+                prefixes.append([])
+            else:
+                break
+        name = self.get() if is_c_ident(self.peek()) else None
+
+        suffixes: list[list[tuple[str, Any]]] = []
+        for level in range(len(prefixes) - 1, -1, -1):
+            suffixes.append(self.suffixes())
+            if level:
+                assert_eq(self.get(), ")")
+        suffixes.reverse()
+
+        # 由外层到内层, 每层先指针后由后向前的后缀
+        ops: list[tuple[str, Any]] = []
+        for prefix, suffix in zip(prefixes, suffixes):
+            ops.extend(prefix)
+            ops.extend(reversed(suffix))
+
+        def wrap(base: FmtNode) -> FmtNode:
+            for op, arg in ops:
+                if op == "*":
+                    base = rs_pointer(base)
+                    for qual in reversed(arg):
+                        base = rs_wrap(qual, base)
+                elif op == "[":
+                    base = rs_array(base, arg)
+                else:
+                    base = rs_fn(arg, base)
+            return base
+        return name, wrap
+
+    def suffixes(self) -> list[tuple[str, Any]]:
+        """数组或函数后缀"""
+        suffixes: list[tuple[str, Any]] = []
+        while (token := self.peek()) in ("[", "("):
+            self.get()
+            if token == "[":
+                num = None
+                if self.peek() != "]":
+                    num = int(self.get())
+                assert_eq(self.get(), "]")
+                suffixes.append(("[", num))
+            else:
+                suffixes.append(("(", self.params()))
+        return suffixes
+
+    def params(self) -> list[FmtNode]:
+        """函数参数列表, 左括号已被消耗"""
+        params: list[FmtNode] = []
+        while self.peek() not in (")", None):
+            if self.peek() == ".":
+                for _ in range(3):
+                    assert_eq(self.get(), ".")
+                params.append(FmtNode("{}", "..."))
+            else:
+                _, base = self.specifiers()
+                _, wrap = self.declarator()
+                params.append(wrap(base))
+            if self.peek() == ",":
+                self.get()
+        assert_eq(self.get(), ")")
+        return params
+
+    def declaration(self) -> list[tuple[bool, str, FmtNode]]:
+        """解析一条声明, 可有多个以逗号分隔的声明符与结尾的分号
+
+        返回 [(是否为 typedef, 名字, 类型)]
+        """
+        is_typedef, base = self.specifiers()
+        result = []
+        while True:
+            name, wrap = self.declarator()
+            if name is None:
+                raise AssertionError(
+                        f"declarator no name: {' '.join(self.tokens.data)!r}")
+            result.append((is_typedef, name, wrap(base)))
+            if self.peek() != ",":
+                break
+            self.get()
+        if self.peek() == ";":
+            self.get()
+        self.tokens.check_to_end(lambda: AssertionError(
+            f"Not fully parse: {' '.join(self.tokens.data)!r}"))
+        return result
+
+
+def c_to_rs(source: str) -> str:
+    """在进程内将 C 声明转换为 rust 风格, 每个声明符一行
+
+    >>> c_to_rs("void(*bsd_signal(int, void(*)(int)))(int)")
+    'bsd_signal: fn(int, *fn(int) -> void) -> *fn(int) -> void'
+    >>> c_to_rs("typedef const char *const names[4];")
+    'type names = [const(*const(char)); 4]'
+    """
+    return c_tokens_to_rs(split_tokens(source))
+
+
+def c_tokens_to_rs(input_tokens: list[str]) -> str:
+    """同 c_to_rs, 输入为已分割的词法单元"""
+    return "\n".join(
+            str(FmtNode("type {} = {}" if is_typedef else "{}: {}",
+                        name, node))
+            for is_typedef, name, node
+            in CParser(input_tokens).declaration())
+
+
+class RsBuilder(StackBuilder):
+    """从 rust 风格类型构建 cdecl 描述句树"""
+    def start(self) -> Optional[FmtNode]:
         """通用构建树"""
+        get, tokens = self.get, self.tokens
         match get():
             case "[":
                 # array
-                type_ = build()
-                match get():
-                    case ";":
-                        # sized array
-                        num = int(get())
-                        assert_eq(get(), "]")
-                        result = FmtNode("array {} of {}", num, type_)
-                    case "]":
-                        # non size array
-                        result = FmtNode("array of {}", type_)
-                    case end:
-                        raise AssertionError(
-                                "array format error, need ';' or ']', "
-                                f"found {end!r}")
+                def array(type_: FmtNode) -> FmtNode:
+                    match get():
+                        case ";":
+                            # sized array
+                            num = int(get())
+                            assert_eq(get(), "]")
+                            return FmtNode("array {} of {}", num, type_)
+                        case "]":
+                            # non size array
+                            return FmtNode("array of {}", type_)
+                        case end:
+                            raise AssertionError(
+                                    "array format error, need ';' or ']', "
+                                    f"found {end!r}")
+                self.push(array)
             case "*":
-                result = FmtNode("pointer to {}", build())
+                self.push(lambda to: FmtNode("pointer to {}", to))
             case "fn":
                 assert_eq(get(), "(")
-                params: list[FmtNode] = []
-                while tokens.get_next() != ")":
-                    # 循环代表未结束 (type[,])
-                    params.append(build())
-                    if tokens.get_next() == ",":
-                        # 消耗时顺便断言检测下是否内部出错
-                        assert_eq(tokens.get(), ",")
-                assert_eq(get(), ")")
-                assert_eq(get(), "->")
-                result = FmtNode(
+
+                def returning(params: list[FmtNode]) -> None:
+                    assert_eq(get(), "->")
+                    self.push(lambda result: FmtNode(
                         "function ({}) returning {}",
-                        LazyStr(lambda: ", ".join(map(str, params))),
-                        build())
+                        FmtJoin(", ", params),
+                        result))
+                return self.params(")", returning)
             case ("struct" | "union" | "enum" | "const"
                   | "volatile" | "noalias" | "signed" | "unsigned"
                   | "register" | "static") as type_:
                 assert_eq(get(), "(")
-                value = build()
-                assert_eq(get(), ")")
-                result = FmtNode(f"{type_} {{}}", value)
+
+                def wrap(value: FmtNode) -> FmtNode:
+                    assert_eq(get(), ")")
+                    return FmtNode(f"{type_} {{}}", value)
+                self.push(wrap)
             case ("long" | "short") as type_:
                 # 多个长或短前缀整数
                 count = 1
@@ -291,11 +879,37 @@ def rs_to_english(input_tokens: list[str]) -> str:
                         # end int
                         get()
                         return FmtNode(f"{' '.join((type_,) * count)} int")
-                    result = FmtNode(f"{' '.join((type_,) * count)}")
-                    break  # no end int
+                    return FmtNode(f"{' '.join((type_,) * count)}")
             case value:
-                result = FmtNode("{}", value)
-        return result
+                return FmtNode("{}", value)
+        return None
+
+
+def build_rs(tokens: Tokens[str]) -> FmtNode:
+    """从 rust 风格类型构建 cdecl 描述句树, 函数参数经由缓存翻译"""
+    return RsBuilder(tokens, RS_CACHE).build()
+
+
+def rs_to_english(input_tokens: list[str]) -> str:
+    """rs to english
+    """
+    length = len(input_tokens)
+    if length < 3:
+        raise ValueError(f"length < 3, {input_tokens}")
+    tokens = Tokens(input_tokens)
+
+    def check_builded(root: FmtNode) -> None:
+        tokens.check_to_end(lambda: AssertionError(
+            f"Not fully build: ({root}): {' '.join(tokens.data)!r}"))
+
+    def get() -> str:
+        return tokens.get()
+
+    def build() -> FmtNode:
+        # 整个类型也是一个可缓存的片段
+        type_ = rs_fragment(tuple(tokens.data[tokens.idx:]))
+        tokens.idx = len(tokens.data)
+        return type_
 
     var_name = get()
 
@@ -330,5 +944,487 @@ def test() -> None:
         print(cdecl_text, file=proc, flush=True)
 
 
+HEADER_TOKEN_REGEX_OBJ: Pattern[str] = re.compile(r"""
+    (?P<comment>/\*.*?\*/|//[^\n]*)
+    |(?P<pp>^[ \t]*\#(?:\\\n|[^\n])*)
+    |(?P<str>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+    |(?P<open>\{)|(?P<close>\})|(?P<semi>;)
+    |(?P<text>[^/"'{};\#\n]+|[/\#\n])
+    """, re.VERBOSE | re.MULTILINE | re.DOTALL)
+HEADER_NOISE_REGEX_OBJ: Pattern[str] = re.compile(
+        r"\b(?:__attribute__|__asm__|__declspec)\s*"
+        r"\((?:[^()]|\((?:[^()]|\([^()]*\))*\))*\)")
+EXTERN_C = 'extern "C"'
+
+
+def header_declarations(source: str) -> Iterator[str]:
+    """提取头文件中的顶层声明语句
+
+    去除注释与预处理行, 结构体等的定义体被丢弃而保留其后的声明符,
+    函数定义只保留原型, `extern "C" {}` 视为透明
+    """
+    parts: list[str] = []
+    depth = 0  # 被跳过的定义体的嵌套深度
+    is_fn_body = False
+    for match_ in HEADER_TOKEN_REGEX_OBJ.finditer(source):
+        kind = match_.lastgroup
+        if depth:
+            if kind == "open":
+                depth += 1
+            elif kind == "close":
+                depth -= 1
+                if depth == 0 and is_fn_body:
+                    yield "".join(parts).strip()
+                    parts.clear()
+            continue
+
+        match kind:
+            case "comment" | "pp":
+                parts.append(" ")
+            case "open":
+                stmt = " ".join("".join(parts).split())
+                if stmt == EXTERN_C:
+                    parts.clear()
+                    continue
+                depth = 1
+                is_fn_body = stmt.endswith(")")
+            case "close":
+                # extern "C" 块的结尾
+                parts.clear()
+            case "semi":
+                if stmt := "".join(parts).strip():
+                    yield stmt
+                parts.clear()
+            case _:
+                parts.append(match_[0])
+
+
+def header_to_rs(source: str) -> str:
+    """将头文件中的声明转换为 rust 风格的 type 与 extern "C" 块
+
+    无法转换的声明以注释的形式留在块中
+    """
+    types: list[str] = []
+    items: list[str] = []
+    for stmt in header_declarations(source):
+        stmt = " ".join(HEADER_NOISE_REGEX_OBJ.sub(" ", stmt).split())
+        tokens = split_tokens(stmt)
+        if len(tokens) == 2 and tokens[0] in C_TAGS or "static" in tokens:
+            # 仅声明结构体等的标签, 或无法链接的 static 声明
+            continue
+        try:
+            decls = CParser(tokens).declaration()
+        except (AssertionError, ValueError, IndexError):
+            items.append(f"    // skipped: {stmt}")
+            continue
+        for is_typedef, name, node in decls:
+            if is_typedef:
+                types.append(f"pub type {name} = {node};")
+            elif isinstance(node, FnNode):
+                params = [str(param) for param in node.params]
+                if params == ["void"]:
+                    params = []
+                params = [p if p == "..." else f"_: {p}" for p in params]
+                result = str(node.result)
+                ret = "" if result == "void" else f" -> {result}"
+                items.append(f"    pub fn {name}({', '.join(params)}){ret};")
+            else:
+                items.append(f"    pub static {name}: {node};")
+
+    lines = types
+    if items:
+        if lines:
+            lines.append("")
+        lines.extend(("extern \"C\" {", *items, "}"))
+    return "".join(f"{line}\n" for line in lines)
+
+
+HEADER_CACHE_VERSION = 1
+HEADER_WINDOW = 4  # 每个进程积压的头文件数
+HEADER_CACHE_DIR = os.path.join(
+        os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+        "cdecl_to_rust")
+
+
+def find_headers(paths: list[str]) -> list[str]:
+    """展开目录中的所有 .h 文件, 目录内按路径排序"""
+    result = []
+    for path in paths:
+        if not os.path.isdir(path):
+            result.append(path)
+            continue
+        found = []
+        for root, _, files in os.walk(path):
+            found.extend(os.path.join(root, name)
+                         for name in files if name.endswith(".h"))
+        result.extend(sorted(found))
+    return result
+
+
+def header_bytes_to_rs(data: bytes) -> str:
+    """header_to_rs, 供进程池调用"""
+    return header_to_rs(data.decode("utf-8", "replace"))
+
+
+def headers_to_rs(
+        paths: list[str],
+        jobs: int = 1,
+        cache_dir: Optional[str] = HEADER_CACHE_DIR,
+        ) -> Iterator[tuple[str, str]]:
+    """多进程转换多个头文件, 按输入顺序产出 (路径, 结果)
+
+    结果以文件内容的哈希为键缓存在 cache_dir, 未变的头文件不再解析
+    """
+    def cache_path(data: bytes) -> Optional[str]:
+        if cache_dir is None:
+            return None
+        key = sha256(data).hexdigest()
+        return os.path.join(cache_dir, f"{key}.v{HEADER_CACHE_VERSION}.rs")
+
+    def save(path: Optional[str], result: str) -> None:
+        if path is None:
+            return
+        try:
+            os.makedirs(cache_dir, exist_ok=True)  # type: ignore
+            fd, tmp = mkstemp(dir=cache_dir, prefix=".tmp.")
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                file.write(result)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"write cache failed: {e}", file=sys.stderr)
+
+    def load(path: str) -> tuple[Optional[str], str | Future[str]]:
+        with open(path, "rb") as file:
+            data = file.read()
+        cache = cache_path(data)
+        if cache is not None:
+            try:
+                with open(cache, encoding="utf-8") as file:
+                    return None, file.read()
+            except OSError:
+                pass
+        if pool is None:
+            return cache, header_bytes_to_rs(data)
+        return cache, pool.submit(header_bytes_to_rs, data)
+
+    def finish(path: str, cache: Optional[str], result: str | Future[str],
+               ) -> tuple[str, str]:
+        if isinstance(result, Future):
+            result = result.result()
+        save(cache, result)
+        return path, result
+
+    pool = ProcessPoolExecutor(jobs) if jobs > 1 else None
+    # 同时在途的头文件数, 边读边产出, 不必先读入全部头文件
+    limit = HEADER_WINDOW * jobs
+    try:
+        pending: deque[tuple[str, Optional[str], str | Future[str]]] = deque()
+        for path in find_headers(paths):
+            if len(pending) >= limit:
+                yield finish(*pending.popleft())
+            pending.append((path, *load(path)))
+        while pending:
+            yield finish(*pending.popleft())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+CDECL_BIN = "/bin/cdecl"
+
+
+class Cdecl:
+    """常驻的 cdecl 子进程, 通过管道逐句交互
+
+    每句之后追加一句已知输出的同步句, 读到它就说明这句的输出已读完,
+    所以出错的句子 (输出在 stderr) 也不会错位
+    """
+    SYNC_NAME = "cdecl_to_rust_sync"
+    SYNC = f"declare {SYNC_NAME} as int"
+
+    def __init__(self, cmd: list[str]):
+        self.proc = Popen(
+                cmd, stdin=PIPE, stdout=PIPE, stderr=STDOUT,
+                text=True, bufsize=1)
+
+    def send(self, line: str) -> None:
+        print(line, self.SYNC, sep="\n", file=self.proc.stdin, flush=True)
+
+    def recv(self) -> list[str]:
+        """读取最早一句未读的输出"""
+        result = []
+        while resp := self.proc.stdout.readline():  # type: ignore
+            if self.SYNC_NAME in resp:
+                return result
+            result.append(resp.rstrip("\n"))
+        raise EOFError(f"cdecl exited [code: {self.proc.wait()}]")
+
+    def close(self) -> None:
+        self.proc.stdin.close()  # type: ignore
+        self.proc.wait()
+
+
+def cdecl_cmd(cdecl: str = CDECL_BIN) -> list[str]:
+    """cdecl 输出到管道时是全缓冲的, 有 stdbuf 时用它改为行缓冲"""
+    cmd = shell_split(cdecl)
+    if (stdbuf := which("stdbuf")) is not None:
+        cmd = [stdbuf, "-oL", *cmd]
+    return cmd
+
+
+class CdeclPool:
+    """若干常驻 cdecl 进程, 轮流分派并按输入顺序取回结果"""
+    def __init__(self, cmd: list[str], procs: int = 1, window: int = 64):
+        self.procs = [Cdecl(cmd) for _ in range(procs)]
+        # 每个进程最多积压的句数, 防止双方都阻塞在写满的管道上
+        self.window = window
+
+    def map(self, lines: Iterable[str]) -> Iterator[list[str]]:
+        pending: deque[Cdecl] = deque()
+        limit = self.window * len(self.procs)
+        for i, line in enumerate(lines):
+            if len(pending) >= limit:
+                yield pending.popleft().recv()
+            proc = self.procs[i % len(self.procs)]
+            proc.send(line)
+            pending.append(proc)
+        while pending:
+            yield pending.popleft().recv()
+
+    def close(self) -> None:
+        for proc in self.procs:
+            proc.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+def convert_line(line: str, reverse: bool = False, c_decl: bool = False) -> str:
+    """转换一句, reverse 时为 rust 风格到 cdecl 描述句, c_decl 时输入为 C 声明"""
+    return convert_tokens(split_tokens(line), reverse, c_decl)
+
+
+def convert_tokens(
+        tokens: list[str],
+        reverse: bool = False,
+        c_decl: bool = False,
+        ) -> str:
+    """同 convert_line, 输入为已分割的词法单元"""
+    if c_decl:
+        return c_tokens_to_rs(tokens)
+    if reverse:
+        return rs_to_english(tokens)
+    return english_to_rs(tokens)
+
+
+def read_lines(paths: list[str]) -> Iterator[tuple[str, int, str]]:
+    """逐行读取各文件 (`-` 为 stdin), 产出 (文件, 行号, 去除空白的行)"""
+    for path in paths or ["-"]:
+        file = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        with file:
+            for lineno, line in enumerate(file, 1):
+                if line := line.strip():
+                    yield path, lineno, line
+
+
+Located = tuple[str, int, str]
+OPENS, CLOSES = frozenset("([{"), frozenset(")]}")
+
+
+def read_tokens(paths: list[str]) -> Iterator[Located]:
+    """逐行惰性分割各文件, 产出 (文件, 行号, 词法单元)"""
+    for path, lineno, line in read_lines(paths):
+        for token in iter_tokens(line):
+            yield path, lineno, token
+
+
+def stream_declarations(
+        paths: list[str],
+        reverse: bool = False,
+        c_decl: bool = False,
+        ) -> Iterator[tuple[str, int, list[str]]]:
+    """将各文件视为连续的词法流, 按声明边界分组, 声明可跨行
+
+    产出 (文件, 开始行号, 词法单元), 任一时刻只持有一句声明;
+    C 声明以顶层 `;` 结束, cdecl 描述句以 declare/cast 开始,
+    rust 风格以顶层的 `<name> :` 或 `<name> as` 开始
+    """
+    tokens: LazyTokens[Located] = LazyTokens(read_tokens(paths))
+    while (first := tokens.get_next()) is not None:
+        path, lineno, _ = first
+        group: list[str] = []
+        depth = 0
+        while (item := tokens.get_next()) is not None:
+            token = item[2]
+            if group and depth == 0 and not c_decl and (
+                    token in ("declare", "cast") if not reverse
+                    else is_c_ident(token)
+                    and (next_ := tokens.get_next(1)) is not None
+                    and next_[2] in (":", "as")):
+                break
+            group.append(tokens.get()[2])
+            if token in OPENS:
+                depth += 1
+            elif token in CLOSES:
+                depth -= 1
+            elif c_decl and token == ";" and depth == 0:
+                break
+        yield path, lineno, group
+
+
+def declare_tokens(result: str) -> list[str]:
+    """rust 风格结果的词法单元, typedef 的 type X = T 改写为 X: T
+
+    cdecl 的描述句没有 typedef, 改写后仍可校验其类型
+    """
+    tokens = split_tokens(result)
+    if tokens[:1] == ["type"] and tokens[2:3] == ["="]:
+        return [tokens[1], ":", *tokens[3:]]
+    return tokens
+
+
+def batch(
+        paths: list[str],
+        reverse: bool = False,
+        cdecl: Optional[CdeclPool] = None,
+        c_decl: bool = False,
+        stream: bool = False,
+        ) -> int:
+    """批量转换, 每行一句, 结果按输入顺序流式输出, 返回失败的句数
+
+    给出 cdecl 时将每句的 cdecl 描述句交给它校验, 并把其输出附在结果后;
+    stream 时按声明边界而非行分组, 见 stream_declarations
+    """
+    failed = 0
+    declarations = stream_declarations(paths, reverse, c_decl) if stream \
+        else ((path, lineno, split_tokens(line))
+              for path, lineno, line in read_lines(paths))
+
+    def converted() -> Iterator[tuple[str, str]]:
+        nonlocal failed
+        for path, lineno, tokens in declarations:
+            try:
+                results = convert_tokens(tokens, reverse, c_decl).split("\n")
+                englishs = results if reverse or cdecl is None else [
+                        rs_to_english(declare_tokens(result))
+                        for result in results]
+            except (AssertionError, ValueError, IndexError) as e:
+                failed += 1
+                print(f"{path}:{lineno}: {e!r}", file=sys.stderr)
+                continue
+            yield from zip(results, englishs)
+
+    if cdecl is None:
+        for result, _ in converted():
+            print(result)
+        return failed
+
+    pairs: deque[str] = deque()
+
+    def queries() -> Iterator[str]:
+        for result, english in converted():
+            pairs.append(result)
+            yield english
+
+    for resp in cdecl.map(queries()):
+        print(pairs.popleft(), *resp, sep="\t")
+    return failed
+
+
+HELP_MSG = f"""\
+Usage: {sys.argv[0]} <cdecl english...>
+       {sys.argv[0]} -b [Options] [FILE...]
+       {sys.argv[0]} -H [Options] <HEADER|DIR>...
+Convert cdecl english to rust style declaration
+
+Options:
+    -b, --batch         convert each line of FILE... (or stdin)
+    -r, --reverse       batch input is rust style, output cdecl english
+    -x, --c-decl        batch input is C declarations, parsed in process
+    -S, --stream        batch input is one token stream, declarations
+                        may span lines
+    -H, --headers       generate extern "C" blocks from C headers
+    -n, --no-cache      do not use the --headers result cache
+    -s, --stats         print subtree cache statistics to stderr
+    -c, --check         pass each result through cdecl, append its output
+    -C, --cdecl=<CMD>   cdecl command, default {CDECL_BIN}
+    -j, --procs=<N>     number of cdecl (--check) or parser (--headers)
+                        processes, default 1
+    -h, --help          show this help
+"""
+
+
+def main() -> None:
+    """main function"""
+    try:
+        opts, args = gnu_getopt(sys.argv[1:], "brxSHnscC:j:h", longopts=[
+            "batch",
+            "reverse",
+            "c-decl",
+            "stream",
+            "headers",
+            "no-cache",
+            "stats",
+            "check",
+            "cdecl=",
+            "procs=",
+            "help",
+        ])
+    except GetoptError as e:
+        print(f"ParseArg: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    is_batch = reverse = c_decl = stream = headers = stats = check = False
+    cdecl, procs = CDECL_BIN, 1
+    cache_dir: Optional[str] = HEADER_CACHE_DIR
+    for opt, value in opts:
+        match opt:
+            case "-h" | "--help":
+                print(end=HELP_MSG)
+                sys.exit()
+            case "-b" | "--batch":
+                is_batch = True
+            case "-r" | "--reverse":
+                reverse = True
+            case "-x" | "--c-decl":
+                c_decl = True
+            case "-S" | "--stream":
+                stream = True
+            case "-H" | "--headers":
+                headers = True
+            case "-n" | "--no-cache":
+                cache_dir = None
+            case "-s" | "--stats":
+                stats = True
+            case "-c" | "--check":
+                check = True
+            case "-C" | "--cdecl":
+                cdecl = value
+            case "-j" | "--procs":
+                procs = int(value)
+
+    if headers:
+        for path, result in headers_to_rs(args, procs, cache_dir):
+            print(f"// {path}", result, sep="\n")
+        return
+
+    if not is_batch:
+        test()
+        return
+
+    if not check:
+        failed = batch(args, reverse, c_decl=c_decl, stream=stream)
+    else:
+        with CdeclPool(cdecl_cmd(cdecl), procs) as pool:
+            failed = batch(args, reverse, pool, c_decl, stream)
+    if stats:
+        for name, info in cache_info().items():
+            print(f"{name}: {info}", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
 if __name__ == '__main__':
-    test()
+    main()
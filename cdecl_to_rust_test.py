@@ -0,0 +1,330 @@
+#!/usr/bin/python3
+# -*- coding: utf-8; -*-
+"""test file"""
+
+import os
+import sys
+import time
+
+import pytest
+
+import cdecl_to_rust
+from cdecl_to_rust import (
+        CDECL_BIN, CacheInfo, CdeclPool, LazyTokens, LruCache, batch, c_to_rs,
+        cache_clear, cache_info, cdecl_cmd, english_to_rs, header_to_rs,
+        headers_to_rs, iter_spans, iter_tokens, rs_to_english, split_tokens,
+        stream_declarations)
+from shlex import quote
+
+SIGNAL_EN = ("declare bsd_signal as function (int, pointer to function (int)"
+             " returning void) returning pointer to function (int)"
+             " returning void")
+SIGNAL_RS = "bsd_signal: fn(int, *fn(int) -> void) -> *fn(int) -> void"
+
+# 简单的假 cdecl: 同步句输出变量名, 其余原样回显, 含 error 时报错
+FAKE_CDECL = """\
+import sys
+for line in sys.stdin:
+    words = line.split()
+    if "error" in words:
+        print("syntax error", file=sys.stderr, flush=True)
+    elif words[:1] == ["declare"] and words[-1] == "int":
+        print("int", words[1], flush=True)
+    else:
+        print("echo", line.strip(), flush=True)
+"""
+
+
+# C 声明与 cdecl 对其 explain 的输出
+C_ENGLISH = [
+        ("void(*bsd_signal(int, void(*)(int)))(int)", SIGNAL_EN),
+        ("int x", "declare x as int"),
+        ("char *p;", "declare p as pointer to char"),
+        ("const char *p", "declare p as pointer to const char"),
+        ("char *const p", "declare p as const pointer to char"),
+        ("int *a[3]", "declare a as array 3 of pointer to int"),
+        ("int (*a)[3]", "declare a as pointer to array 3 of int"),
+        ("int a[2][3]", "declare a as array 2 of array 3 of int"),
+        ("char *argv[]", "declare argv as array of pointer to char"),
+        ("unsigned long long n", "declare n as unsigned long long"),
+        ("long int n", "declare n as long int"),
+        ("unsigned char c", "declare c as unsigned char"),
+        ("static volatile int v", "declare v as static volatile int"),
+        ("struct tm *t", "declare t as pointer to struct tm"),
+        ("int main(int, char **)",
+         "declare main as function (int, pointer to pointer to char)"
+         " returning int"),
+        ("int (*(*fp)(void))[4]",
+         "declare fp as pointer to function (void)"
+         " returning pointer to array 4 of int"),
+        ("void (*signal_table[8])(int)",
+         "declare signal_table as array 8 of pointer to function (int)"
+         " returning void"),
+]
+
+
+@pytest.mark.parametrize("c_src, english", C_ENGLISH)
+def test_c_parser_conformance(c_src, english):
+    assert c_to_rs(c_src) == english_to_rs(split_tokens(english))
+
+
+@pytest.mark.skipif(not os.access(CDECL_BIN, os.X_OK), reason="no cdecl")
+def test_c_parser_cdecl():
+    with CdeclPool(cdecl_cmd(CDECL_BIN)) as pool:
+        explained = pool.map(f"explain {c_src}" for c_src, _ in C_ENGLISH)
+        for (c_src, _), resp in zip(C_ENGLISH, explained):
+            assert c_to_rs(c_src) == english_to_rs(split_tokens(resp[0]))
+
+
+def test_round_trip():
+    assert english_to_rs(split_tokens(SIGNAL_EN)) == SIGNAL_RS
+    assert rs_to_english(split_tokens(SIGNAL_RS)) == SIGNAL_EN
+
+
+def test_lru_cache():
+    cache = LruCache(2)
+    assert cache.get("a") is None
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)  # 容量已满, 淘汰最久未用的 b
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.info() == CacheInfo(3, 2, 2, 2)
+    cache.clear()
+    assert cache.info() == CacheInfo(0, 0, 2, 0)
+
+
+@pytest.mark.parametrize("convert, text, name", [
+        (english_to_rs, SIGNAL_EN, "english_fragment"),
+        (rs_to_english, SIGNAL_RS, "rs_fragment"),
+])
+def test_fragment_cache(monkeypatch, convert, text, name):
+    cache_clear()
+    first = convert(split_tokens(text))
+    info = cache_info()[name]
+    assert info.misses > 0 and info.currsize > 0
+    assert convert(split_tokens(text)) == first
+    again = cache_info()[name]
+    assert again.hits > info.hits and again.misses == info.misses
+    assert again.currsize == info.currsize
+
+    # 关闭缓存后输出一致
+    cache_clear()
+    monkeypatch.setattr(cdecl_to_rust, "FRAGMENT_MAX_TOKENS", -1)
+    assert convert(split_tokens(text)) == first
+    assert cache_info()[name].currsize == 0
+
+
+def test_fragment_cache_eviction(monkeypatch):
+    cache_clear()
+    monkeypatch.setattr(cdecl_to_rust, "ENGLISH_CACHE", LruCache(2))
+    texts = [f"declare f as function ({arg}) returning int"
+             for arg in ("int", "char", "long", "int")]
+    outputs = [english_to_rs(split_tokens(text)) for text in texts]
+    assert outputs == [f"f: fn({arg}) -> int"
+                       for arg in ("int", "char", "long", "int")]
+    info = cache_info()["english_fragment"]
+    assert info.currsize == 2 and info.maxsize == 2
+    assert info.hits == 0  # 第一个片段已被淘汰, 重新解析
+
+
+@pytest.mark.parametrize("convert, texts", [
+        (english_to_rs, ["declare f as function (int int) returning void",
+                         "declare g as function (int int) returning char"]),
+        (rs_to_english, ["f: fn(int int) -> void", "g: fn(int int) -> char"]),
+])
+def test_fragment_cache_partial_param(convert, texts):
+    # 未占满片段的参数不能以整个片段为键缓存, 结果不依赖之前转换过什么
+    cache_clear()
+    for text in texts * 2:
+        with pytest.raises(AssertionError, match="'int int'"):
+            convert(split_tokens(text))
+    assert cache_info()["english_fragment"].hits == 0
+    assert cache_info()["rs_fragment"].hits == 0
+
+
+def test_fake_cdecl_pool(tmp_path):
+    fake = tmp_path / "fake_cdecl.py"
+    fake.write_text(FAKE_CDECL)
+    lines = [f"line {i}" if i % 7 else "error" for i in range(500)]
+
+    cmd = cdecl_cmd(f"{quote(sys.executable)} {quote(str(fake))}")
+    with CdeclPool(cmd, procs=3, window=4) as pool:
+        results = list(pool.map(lines))
+
+    assert results == [
+            [f"echo {line}"] if line != "error" else ["syntax error"]
+            for line in lines]
+
+
+def test_batch_typedef(tmp_path, capsys):
+    # typedef 的结果改写为声明形式后交给 cdecl 校验类型
+    fake = tmp_path / "fake_cdecl.py"
+    fake.write_text(FAKE_CDECL)
+    path = tmp_path / "decls.h"
+    path.write_text("typedef int myint;\nchar *p;\ntypedef char *str, num;\n")
+    cmd = cdecl_cmd(f"{quote(sys.executable)} {quote(str(fake))}")
+    with CdeclPool(cmd) as pool:
+        assert batch([str(path)], cdecl=pool, c_decl=True) == 0
+    assert capsys.readouterr().out.splitlines() == [
+            "type myint = int\tint myint",
+            "p: *char\techo declare p as pointer to char",
+            "type str = *char\techo declare str as pointer to char",
+            "type num = char\techo declare num as char",
+    ]
+
+
+HEADER = """\
+#ifdef __cplusplus
+extern "C" {
+#endif
+/* comment; { } */
+typedef struct foo { int a; } foo_t;
+struct bar;
+extern int errno;
+int printf(const char *fmt, ...) __attribute__((format(printf, 1, 2)));
+static inline int add(int a, int b) { return a + b; }
+void (*bsd_signal(int, void (*)(int)))(int);
+int f(void), g(int x);
+#ifdef __cplusplus
+}
+#endif
+"""
+HEADER_RS = """\
+pub type foo_t = struct(foo);
+
+extern "C" {
+    pub static errno: int;
+    pub fn printf(_: *const(char), ...) -> int;
+    pub fn bsd_signal(_: int, _: *fn(int) -> void) -> *fn(int) -> void;
+    pub fn f() -> int;
+    pub fn g(_: int) -> int;
+}
+"""
+
+
+def test_header_to_rs(tmp_path):
+    assert header_to_rs(HEADER) == HEADER_RS
+
+    (tmp_path / "inc").mkdir()
+    (tmp_path / "inc" / "a.h").write_text(HEADER)
+    (tmp_path / "inc" / "b.h").write_text("int x;")
+    cache = tmp_path / "cache"
+    expected = [(str(tmp_path / "inc" / "a.h"), HEADER_RS),
+                (str(tmp_path / "inc" / "b.h"),
+                 'extern "C" {\n    pub static x: int;\n}\n')]
+    assert list(headers_to_rs([str(tmp_path / "inc")], 2, str(cache))) \
+            == expected
+    assert len(list(cache.iterdir())) == 2
+    assert list(headers_to_rs([str(tmp_path / "inc")], 1, str(cache))) \
+            == expected
+
+
+def test_headers_to_rs_streaming(tmp_path, monkeypatch):
+    for i in range(20):
+        (tmp_path / f"{i:02}.h").write_text(f"int x{i};")
+    converted = []
+
+    def convert(data):
+        converted.append(data)
+        return data.decode()
+
+    monkeypatch.setattr(cdecl_to_rust, "header_bytes_to_rs", convert)
+    results = headers_to_rs([str(tmp_path)], 1, None)
+    assert next(results) == (str(tmp_path / "00.h"), "int x0;")
+    assert len(converted) <= cdecl_to_rust.HEADER_WINDOW + 1
+    assert [result for _, result in results] \
+            == [f"int x{i};" for i in range(1, 20)]
+
+
+def test_spans():
+    source = " int (*f)(char) -> x\n"
+    spans = list(iter_spans(source))
+    assert [source[start:end] for _, start, end in spans] \
+        == split_tokens(source) == ["int", "(", "*", "f", ")", "(", "char",
+                                    ")", "->", "x"]
+    assert [kind for kind, _, _ in spans[:3]] == ["ident", "punct", "punct"]
+    assert list(iter_tokens(source)) == split_tokens(source)
+
+
+def test_lazy_tokens():
+    consumed = []
+
+    def source():
+        for token in "a b c d".split():
+            consumed.append(token)
+            yield token
+
+    tokens = LazyTokens(source())
+    assert tokens.get_next(1) == "b" and consumed == ["a", "b"]
+    assert tokens.get() == "a" and tokens.get() == "b"
+    assert tokens.get_next(5) is None
+    with pytest.raises(AssertionError):
+        tokens.check_to_end(AssertionError)
+    assert tokens.get() == "c" and tokens.get() == "d" and tokens.idx == 4
+    tokens.check_to_end(AssertionError)
+    with pytest.raises(IndexError):
+        tokens.get()
+
+
+@pytest.mark.parametrize("reverse, c_decl, text, expected", [
+    (False, False, f"{SIGNAL_EN} declare x\nas int cast y into char",
+     [SIGNAL_EN, "declare x as int", "cast y into char"]),
+    (True, False, f"{SIGNAL_RS} x:\n[int; 3] y as *char",
+     [SIGNAL_RS, "x : [ int ; 3 ]", "y as * char"]),
+    (False, True, "int a,\nb[3]; char (*f)(int); void g(void)",
+     ["int a , b [ 3 ] ;", "char ( * f ) ( int ) ;", "void g ( void )"]),
+])
+def test_stream_declarations(tmp_path, reverse, c_decl, text, expected):
+    path = tmp_path / "decls.txt"
+    path.write_text(text)
+    groups = list(stream_declarations([str(path)], reverse, c_decl))
+    assert [" ".join(tokens) for _, _, tokens in groups] \
+        == [" ".join(split_tokens(i)) for i in expected]
+    assert groups[0][1] == 1 and groups[-1][1] == 2
+
+
+DEPTH = 10000
+# (名称, 转换函数, 输入, 输出) 各层嵌套 DEPTH 次
+DEEP_CASES = [
+        ("english pointer", lambda s: english_to_rs(split_tokens(s)),
+         "declare x as " + "pointer to " * DEPTH + "int",
+         "x: " + "*" * DEPTH + "int"),
+        ("english function param", lambda s: english_to_rs(split_tokens(s)),
+         "declare x as " + "function (" * DEPTH + "int"
+         + ") returning int" * DEPTH,
+         "x: " + "fn(" * DEPTH + "int" + ") -> int" * DEPTH),
+        ("english function result", lambda s: english_to_rs(split_tokens(s)),
+         "declare x as " + "function (int) returning " * DEPTH + "int",
+         "x: " + "fn(int) -> " * DEPTH + "int"),
+        ("rust array", lambda s: rs_to_english(split_tokens(s)),
+         "x: " + "[" * DEPTH + "int" + "; 2]" * DEPTH,
+         "declare x as " + "array 2 of " * DEPTH + "int"),
+        ("rust function param", lambda s: rs_to_english(split_tokens(s)),
+         "x: " + "fn(" * DEPTH + "int" + ") -> int" * DEPTH,
+         "declare x as " + "function (" * DEPTH + "int" + ") returning int" * DEPTH),
+        ("c pointer", c_to_rs, "int " + "*" * DEPTH + "x",
+         "x: " + "*" * DEPTH + "int"),
+        ("c function pointer", c_to_rs,
+         "int " + "(*" * DEPTH + "x" + ")(int)" * DEPTH,
+         "x: " + "*fn(int) -> " * DEPTH + "int"),
+]
+
+
+@pytest.mark.parametrize("name, convert, source, expected", DEEP_CASES)
+def test_deep_nesting(name, convert, source, expected):
+    assert convert(source) == expected, name
+
+
+def bench_nesting() -> None:
+    """benchmark"""
+    for name, convert, source, _ in DEEP_CASES:
+        start = time.perf_counter()
+        result = convert(source)
+        print(f"{name:<24} depth {DEPTH}: "
+              f"{time.perf_counter() - start:.3f}s, {len(result)} chars")
+
+
+if __name__ == '__main__':
+    bench_nesting()
@@ -2,11 +2,25 @@
 # -*- coding: utf-8; -*-
 """双向映射字典"""
 
-from typing import Generic, TypeVar
-from collections.abc import Iterable, Iterator, MappingView, MutableMapping, Hashable
+import os
+import sys
+from array import array
+from contextlib import contextmanager
+from itertools import chain
+from math import isqrt
+from mmap import mmap, ACCESS_READ
+from struct import Struct
+from tempfile import mkstemp
+from threading import RLock
+from zlib import crc32
+from typing import Any, Generic, TypeVar
+from collections.abc import Iterable, Iterator, ItemsView, Mapping, MappingView, MutableMapping, Hashable
 
 KT = TypeVar('KT', bound=Hashable)
 VT = TypeVar('VT', bound=Hashable)
+T = TypeVar('T')
+
+_MISSING: Any = object()
 
 class DoubleDict(Generic[KT, VT], MutableMapping[KT, VT], MappingView):
     """
@@ -28,22 +42,32 @@ class DoubleDict(Generic[KT, VT], MutableMapping[KT, VT], MappingView):
     >>> d[2] = 2
     >>> d, d.inverse()
     ({2: 2}, {2: 2})
+    >>> d.update({2: 3, 5: 3}, b=4)
+    >>> d, d.inverse() is d.inverse(), d.inverse().inverse() is d
+    ({5: 3, 'b': 4}, True, True)
+    >>> d.pop(5), d.popitem(), d
+    (3, ('b', 4), {})
     """
+    __slots__ = ("_forward", "_backward", "_inverse")
     _forward:  dict[KT, VT]
     _backward: dict[VT, KT]
+    _inverse:  "DoubleDict[VT, KT] | None"
 
-    def __init__(self, iterable: Iterable[tuple[KT, VT]] | dict[KT, VT] = ()) -> None:
-        self._forward = dict(iterable)
+    def __init__(self, iterable: Iterable[tuple[KT, VT]] | Mapping[KT, VT] = ()) -> None:
+        self._forward = {}
         self._backward = {}
-
-        for k, v in self._forward.items():
-            self._backward[v] = k
+        self._inverse = None
+        self.update(iterable)
 
     def inverse(self) -> "DoubleDict[VT, KT]":
-        res = DoubleDict.__new__(DoubleDict)
-        res._forward = self._backward
-        res._backward = self._forward
-        return res
+        """共享存储的反向视图, 只创建一次"""
+        if self._inverse is None:
+            res = DoubleDict.__new__(DoubleDict)
+            res._forward = self._backward
+            res._backward = self._forward
+            res._inverse = self
+            self._inverse = res
+        return self._inverse
 
     def contains_value(self, value: VT) -> bool:
         return value in self._backward
@@ -55,20 +79,69 @@ class DoubleDict(Generic[KT, VT], MutableMapping[KT, VT], MappingView):
         return self._forward[key]
 
     def __setitem__(self, key: KT, value: VT) -> None:
-        if key in self and value == self[key]: return
-
-        if key in self._forward:
-            del self._backward[self._forward[key]]
-        if value in self._backward:
-            del self._forward[self._backward[value]]
+        forward, backward = self._forward, self._backward
+        if (old := forward.get(key, _MISSING)) is not _MISSING:
+            if value == old: return
+            del backward[old]
+        if (other := backward.get(value, _MISSING)) is not _MISSING:
+            del forward[other]
 
-        self._forward[key] = value
-        self._backward[value] = key
+        forward[key] = value
+        backward[value] = key
 
     def __delitem__(self, key: KT) -> None:
-        value = self._forward[key]
-        del self._forward[key]
+        del self._backward[self._forward.pop(key)]
+
+    def update(self, other: Iterable[tuple[KT, VT]] | Mapping[KT, VT] = (), /, **kwds: VT) -> None:
+        """与逐个 __setitem__ 结果相同, 空字典批量载入时直接构建两个字典"""
+        forward, backward = self._forward, self._backward
+        if isinstance(other, DoubleDict):
+            other = other._forward
+        if isinstance(other, dict):
+            items: Iterable[tuple[KT, VT]] = other.items()
+        elif isinstance(other, Mapping):
+            items = [(key, other[key]) for key in other]
+        else:
+            items = other
+        if kwds:
+            items = chain(items, kwds.items())  # type: ignore[arg-type]
+
+        if not forward:
+            if not isinstance(items, (list, tuple, ItemsView)):
+                items = list(items)
+            new_forward = dict(items)
+            new_backward = {v: k for k, v in items}
+            if len(new_forward) == len(new_backward) == len(items):
+                forward.update(new_forward)
+                backward.update(new_backward)
+                return
+
+        for key, value in items:
+            if (old := forward.get(key, _MISSING)) is not _MISSING:
+                if value == old: continue
+                del backward[old]
+            if (other_key := backward.get(value, _MISSING)) is not _MISSING:
+                del forward[other_key]
+            forward[key] = value
+            backward[value] = key
+
+    def pop(self, key: KT, default: T = _MISSING) -> VT | T:
+        if key not in self._forward:
+            if default is _MISSING: raise KeyError(key)
+            return default
+        value = self._forward.pop(key)
+        del self._backward[value]
+        return value
+
+    def popitem(self) -> tuple[KT, VT]:
+        """同 dict, 后进先出"""
+        key, value = self._forward.popitem()
         del self._backward[value]
+        return key, value
+
+    def clear(self) -> None:
+        self._forward.clear()
+        self._backward.clear()
 
     def __iter__(self) -> Iterator[KT]:
         return iter(self._forward)
@@ -81,3 +154,829 @@ class DoubleDict(Generic[KT, VT], MutableMapping[KT, VT], MappingView):
 
     def __repr__(self) -> str:
         return repr(self._forward)
+
+
+_EMPTY, _DUMMY = -1, -2
+
+
+def _to_array(view: memoryview, typecode: str = "q") -> array:
+    res = array(typecode)
+    res.frombytes(view.cast("B"))
+    return res
+_HASH_MUL, _MASK64 = 0x9E3779B97F4A7C15, (1 << 64) - 1
+
+
+class _IntColumn:
+    """64 位有符号整数列"""
+    __slots__ = ("data",)
+    kind = b"i"
+
+    def __init__(self, data: Any = None) -> None:
+        self.data = array("q") if data is None else data
+
+    @staticmethod
+    def encode(obj: Any) -> int:
+        if type(obj) is not int: raise TypeError(f"int required, not {obj!r}")
+        if not -1 << 63 <= obj < 1 << 63: raise OverflowError(f"{obj} out of 64-bit range")
+        return obj
+
+    @staticmethod
+    def hash(raw: int) -> int:
+        # 与进程无关, 保存的索引表可直接复用; 取乘积高位以打散连续 ID
+        return ((raw * _HASH_MUL) & _MASK64) >> 32
+
+    def raw(self, entry: int) -> int:
+        return self.data[entry]
+
+    def get(self, entry: int) -> int:
+        return self.data[entry]
+
+    def equals(self, entry: int, raw: int) -> bool:
+        return self.data[entry] == raw
+
+    def append(self, raw: int) -> None:
+        self.data.append(raw)
+
+    def set(self, entry: int, raw: int) -> None:
+        self.data[entry] = raw
+
+    def take(self, entries: Iterable[int]) -> "_IntColumn":
+        data = self.data
+        return _IntColumn(array("q", [data[e] for e in entries]))
+
+    def buffers(self) -> list[Any]:
+        return [self.data]
+
+    @classmethod
+    def from_buffers(cls, views: list[memoryview]) -> "_IntColumn":
+        return cls(views[0].cast("q"))
+
+    def writable(self) -> None:
+        if isinstance(self.data, memoryview):
+            self.data = _to_array(self.data)
+
+
+class _StrColumn:
+    """UTF-8 字符串列, 变长数据存于一块 blob, 以起止偏移定位"""
+    __slots__ = ("starts", "ends", "blob")
+    kind = b"s"
+
+    def __init__(self, starts: Any = None, ends: Any = None, blob: Any = None) -> None:
+        self.starts = array("q") if starts is None else starts
+        self.ends = array("q") if ends is None else ends
+        self.blob = bytearray() if blob is None else blob
+
+    @staticmethod
+    def encode(obj: Any) -> bytes:
+        if type(obj) is not str: raise TypeError(f"str required, not {obj!r}")
+        return obj.encode("utf-8", "surrogatepass")
+
+    hash = staticmethod(crc32)
+
+    def raw(self, entry: int) -> bytes:
+        return bytes(self.blob[self.starts[entry]:self.ends[entry]])
+
+    def get(self, entry: int) -> str:
+        return str(self.blob[self.starts[entry]:self.ends[entry]], "utf-8", "surrogatepass")
+
+    def equals(self, entry: int, raw: bytes) -> bool:
+        start = self.starts[entry]
+        return self.ends[entry] - start == len(raw) and self.blob[start:start+len(raw)] == raw
+
+    def append(self, raw: bytes) -> None:
+        self.starts.append(len(self.blob))
+        self.blob += raw
+        self.ends.append(len(self.blob))
+
+    def set(self, entry: int, raw: bytes) -> None:
+        # 旧数据留在 blob 中, 重建时回收
+        self.starts[entry] = len(self.blob)
+        self.blob += raw
+        self.ends[entry] = len(self.blob)
+
+    def take(self, entries: Iterable[int]) -> "_StrColumn":
+        res = _StrColumn()
+        for e in entries:
+            res.append(self.blob[self.starts[e]:self.ends[e]])
+        return res
+
+    def buffers(self) -> list[Any]:
+        return [self.starts, self.ends, self.blob]
+
+    @classmethod
+    def from_buffers(cls, views: list[memoryview]) -> "_StrColumn":
+        return cls(views[0].cast("q"), views[1].cast("q"), views[2])
+
+    def writable(self) -> None:
+        if isinstance(self.blob, memoryview):
+            self.starts = _to_array(self.starts)
+            self.ends = _to_array(self.ends)
+            self.blob = bytearray(self.blob)
+
+
+_COLUMNS: dict[Any, Any] = {int: _IntColumn, str: _StrColumn}
+_COLUMN_KINDS = {column.kind: column for column in _COLUMNS.values()}
+
+
+class _Store:
+    """CompactDoubleDict 与其反向视图共享的存储
+
+    条目按插入顺序追加到两列中, 删除只清除 alive 标记;
+    两个方向各有一个开放寻址 (线性探测) 索引表, 槽中为条目序号
+    """
+    __slots__ = ("columns", "tables", "fills", "limit", "alive", "size", "stale", "mapped")
+
+    def __init__(self, columns: list[Any]) -> None:
+        self.clear(columns)
+
+    def clear(self, columns: list[Any]) -> None:
+        self.columns = columns
+        self.tables = [array("i", [_EMPTY]) * 8, array("i", [_EMPTY]) * 8]
+        self.fills = [0, 0]
+        self.limit = 5
+        self.alive = bytearray()
+        self.size = 0
+        self.stale = 0
+        self.mapped: Any = None
+
+    def find(self, side: int, raw: Any) -> tuple[int, int]:
+        """查找 raw, 返回 (槽, 条目), 未找到时条目为 -1, 槽为可插入的位置"""
+        table, column = self.tables[side], self.columns[side]
+        mask = len(table) - 1
+        slot = column.hash(raw) & mask
+        free = -1
+        while True:
+            entry = table[slot]
+            if entry == _EMPTY:
+                return (slot if free < 0 else free), -1
+            if entry == _DUMMY:
+                if free < 0: free = slot
+            elif column.equals(entry, raw):
+                return slot, entry
+            slot = (slot + 1) & mask
+
+    def put(self, side: int, slot: int, entry: int) -> None:
+        table = self.tables[side]
+        if table[slot] == _EMPTY:
+            self.fills[side] += 1
+        table[slot] = entry
+
+    def unlink(self, side: int, entry: int) -> None:
+        """将条目在 side 方向的槽置为 DUMMY"""
+        slot, _ = self.find(side, self.columns[side].raw(entry))
+        self.tables[side][slot] = _DUMMY
+
+    def remove(self, entry: int) -> None:
+        self.unlink(0, entry)
+        self.unlink(1, entry)
+        self.alive[entry] = 0
+        self.size -= 1
+
+    def append(self, key_side: int, key_raw: Any, key_slot: int, value_raw: Any, value_slot: int) -> None:
+        entry = len(self.alive)
+        self.columns[key_side].append(key_raw)
+        self.columns[1-key_side].append(value_raw)
+        self.alive.append(1)
+        self.size += 1
+        self.put(key_side, key_slot, entry)
+        self.put(1-key_side, value_slot, entry)
+
+    def entries(self) -> Iterator[int]:
+        alive = self.alive
+        return (entry for entry in range(len(alive)) if alive[entry])
+
+    def writable(self) -> None:
+        """从文件映射载入的存储在首次写入时复制到内存"""
+        if self.mapped is None: return
+        for column in self.columns:
+            column.writable()
+        self.tables = [_to_array(table, "i") for table in self.tables]
+        self.alive = bytearray(self.alive)
+        self.mapped = None
+
+    def need_rebuild(self) -> bool:
+        """任一索引表的已用槽 (含 DUMMY) 超过 2/3, 或已删除的条目与被覆盖的旧值多于存活条目
+
+        插入会复用 DUMMY 槽而不增加 fills, 只看 fills 时反复增删会使列无限增长
+        """
+        return (max(self.fills) > self.limit
+                or len(self.alive) - self.size + self.stale > max(self.size, 8))
+
+    def rebuild(self) -> None:
+        """丢弃已删除的条目与 blob 中的旧数据, 按当前大小重建索引表"""
+        live = array("q", self.entries())
+        self.columns = [column.take(live) for column in self.columns]
+        self.alive = bytearray(b"\1") * len(live)
+        capacity = 8
+        while capacity < self.size * 2 + 2:
+            capacity *= 2
+        self.tables = []
+        for column in self.columns:
+            table = array("i", [_EMPTY]) * capacity
+            mask = capacity - 1
+            for entry in range(self.size):
+                slot = column.hash(column.raw(entry)) & mask
+                while table[slot] != _EMPTY:
+                    slot = (slot + 1) & mask
+                table[slot] = entry
+            self.tables.append(table)
+        self.fills = [self.size, self.size]
+        self.limit = capacity * 2 // 3
+        self.stale = 0
+
+    def buffers(self) -> list[Any]:
+        return [*self.columns[0].buffers(), *self.columns[1].buffers(), self.alive, *self.tables]
+
+
+# 魔数, 字节序, 两列种类, 保存的方向, 条目数, 两个表的已用槽数, 段数; 之后为各段字节长度
+_HEADER = Struct("=8sc2sB4xqqqq")
+_MAGIC = b"DDICTv1\0"
+
+
+def _aligned(size: int) -> int:
+    return (size + 7) & ~7
+
+
+class CompactDoubleDict(Generic[KT, VT], MutableMapping[KT, VT]):
+    """以类型化数组存储的 DoubleDict, 键与值只能为 int (64 位) 或 str
+
+    语义同 DoubleDict, 可 save 到文件后由多个进程 load 以只读内存映射共享,
+    首次写入时复制到内存
+
+    >>> d = CompactDoubleDict([(1, "a"), (2, "b")])
+    >>> d, d.inverse()
+    ({1: 'a', 2: 'b'}, {'a': 1, 'b': 2})
+    >>> d[1] = "b"
+    >>> d, d.inverse()
+    ({1: 'b'}, {'b': 1})
+    >>> d.inverse()["c"] = 4
+    >>> d, d.inverse(), d.inverse().inverse() is d
+    ({1: 'b', 4: 'c'}, {'b': 1, 'c': 4}, True)
+    >>> del d[1]
+    >>> d, len(d), d.contains_value("c")
+    ({4: 'c'}, 1, True)
+    >>> d["x"] = "y"
+    Traceback (most recent call last):
+    ...
+    TypeError: int required, not 'x'
+    """
+    __slots__ = ("_store", "_side", "_inverse")
+    _store:   _Store
+    _side:    int
+    _inverse: "CompactDoubleDict[VT, KT] | None"
+
+    def __init__(
+            self,
+            iterable: Iterable[tuple[KT, VT]] | Mapping[KT, VT] = (),
+            key_type: type = int,
+            value_type: type = str) -> None:
+        try:
+            columns = [_COLUMNS[key_type](), _COLUMNS[value_type]()]
+        except KeyError:
+            raise TypeError(f"unsupported column types: {key_type!r}, {value_type!r}") from None
+        self._store = _Store(columns)
+        self._side = 0
+        self._inverse = None
+        self.update(iterable)
+
+    def inverse(self) -> "CompactDoubleDict[VT, KT]":
+        """共享存储的反向视图, 只创建一次"""
+        if self._inverse is None:
+            res = CompactDoubleDict.__new__(CompactDoubleDict)
+            res._store = self._store
+            res._side = 1 - self._side
+            res._inverse = self
+            self._inverse = res
+        return self._inverse
+
+    def contains_value(self, value: VT) -> bool:
+        return value in self.inverse()
+
+    def _find(self, side: int, obj: Any) -> tuple[Any, int, int]:
+        raw = self._store.columns[side].encode(obj)
+        return raw, *self._store.find(side, raw)
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            return self._find(self._side, key)[2] >= 0
+        except (TypeError, OverflowError):
+            return False
+
+    def __getitem__(self, key: KT) -> VT:
+        try:
+            _, _, entry = self._find(self._side, key)
+        except (TypeError, OverflowError):
+            raise KeyError(key) from None
+        if entry < 0: raise KeyError(key)
+        return self._store.columns[1-self._side].get(entry)
+
+    def __setitem__(self, key: KT, value: VT) -> None:
+        store, side = self._store, self._side
+        store.writable()
+        key_raw, key_slot, key_entry = self._find(side, key)
+        value_raw, value_slot, value_entry = self._find(1-side, value)
+        if key_entry >= 0 and key_entry == value_entry: return
+
+        if value_entry >= 0:
+            store.remove(value_entry)
+        if key_entry >= 0:
+            store.unlink(1-side, key_entry)
+            store.columns[1-side].set(key_entry, value_raw)
+            store.stale += 1
+            store.put(1-side, value_slot, key_entry)
+        else:
+            store.append(side, key_raw, key_slot, value_raw, value_slot)
+        if store.need_rebuild():
+            store.rebuild()
+
+    def __delitem__(self, key: KT) -> None:
+        try:
+            _, _, entry = self._find(self._side, key)
+        except (TypeError, OverflowError):
+            raise KeyError(key) from None
+        if entry < 0: raise KeyError(key)
+        self._store.writable()
+        self._store.remove(entry)
+
+    def clear(self) -> None:
+        store = self._store
+        store.clear([type(column)() for column in store.columns])
+
+    def __iter__(self) -> Iterator[KT]:
+        column = self._store.columns[self._side]
+        return (column.get(entry) for entry in self._store.entries())
+
+    def __len__(self) -> int:
+        return self._store.size
+
+    def __str__(self) -> str:
+        return str(dict(self.items()))
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+    def save(self, path: str) -> None:
+        """保存为可被 load 内存映射的文件, 先写临时文件再替换"""
+        store = self._store
+        if store.size != len(store.alive) or store.stale:
+            store.writable()
+            store.rebuild()
+        buffers = [memoryview(buf).cast("B") for buf in store.buffers()]
+        kinds = b"".join(column.kind for column in store.columns)
+        header = _HEADER.pack(
+                _MAGIC, sys.byteorder[0].encode(), kinds, self._side,
+                store.size, *store.fills, len(buffers))
+        header += array("q", map(len, buffers)).tobytes()
+        fd, tmp = mkstemp(dir=os.path.dirname(path) or ".")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(header.ljust(_aligned(len(header)), b"\0"))
+                for buf in buffers:
+                    file.write(buf)
+                    file.write(bytes(_aligned(len(buf)) - len(buf)))
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "CompactDoubleDict[Any, Any]":
+        """只读内存映射 save 保存的文件, 多个进程共享同一份页缓存"""
+        with open(path, "rb") as file:
+            mapped = mmap(file.fileno(), 0, access=ACCESS_READ)
+        view = memoryview(mapped)
+        magic, byteorder, kinds, side, size, fill0, fill1, count = _HEADER.unpack_from(view)
+        if magic != _MAGIC or byteorder != sys.byteorder[0].encode():
+            raise ValueError(f"not a CompactDoubleDict file for this machine: {path!r}")
+        lengths = view[_HEADER.size:_HEADER.size + count*8].cast("q")
+        offset = _aligned(_HEADER.size + count*8)
+        buffers = []
+        for length in lengths:
+            buffers.append(view[offset:offset+length])
+            offset += _aligned(length)
+
+        columns = []
+        for kind in kinds:
+            column = _COLUMN_KINDS[bytes([kind])]
+            width = len(column().buffers())
+            columns.append(column.from_buffers(buffers[:width]))
+            buffers = buffers[width:]
+        store = _Store(columns)
+        store.alive, table0, table1 = buffers
+        store.tables = [table0.cast("i"), table1.cast("i")]
+        store.fills = [fill0, fill1]
+        store.limit = len(store.tables[0]) * 2 // 3
+        store.size = size
+        store.mapped = mapped
+        res = cls.__new__(cls)
+        res._store = store
+        res._side = side
+        res._inverse = None
+        return res
+
+
+_DELETED: Any = object()
+
+
+class _Snapshot:
+    """ConcurrentDoubleDict 某次提交的内容: 两个方向的基础 dict 及其上的增量
+
+    增量中 _DELETED 表示删除. 基础 dict 在发布后不再修改, 写入时只复制增量,
+    增量超过约 sqrt(2n) 时合并为新的基础 dict, 写入的均摊开销为 O(sqrt(n))
+    """
+    __slots__ = ("base", "delta", "size", "merged", "views", "frozen", "cursors")
+
+    def __init__(self, base: tuple[dict[Any, Any], dict[Any, Any]], delta: tuple[dict[Any, Any], dict[Any, Any]], size: int) -> None:
+        self.base = base
+        self.delta = delta
+        self.size = size
+        self.merged: Any = None
+        self.views: list[Any] = [None, None]
+        self.frozen = False
+        self.cursors: list[Any] = [None, None]
+
+    def fork(self) -> "_Snapshot":
+        """供下一次提交修改的副本, 已合并时以合并结果为基础"""
+        if self.merged is not None:
+            return _Snapshot(self.merged, ({}, {}), self.size)
+        return _Snapshot(self.base, (dict(self.delta[0]), dict(self.delta[1])), self.size)
+
+    def get(self, side: int, key: Any) -> Any:
+        value = self.delta[side].get(key, _MISSING)
+        if value is _MISSING:
+            return self.base[side].get(key, _MISSING)
+        return _MISSING if value is _DELETED else value
+
+    def dicts(self) -> tuple[dict[Any, Any], dict[Any, Any]]:
+        """合并增量后的两个 dict, 首次调用时构建"""
+        if self.merged is None:
+            merged = []
+            for base, delta in zip(self.base, self.delta):
+                if delta:
+                    base = dict(base)
+                    for key, value in delta.items():
+                        if value is _DELETED:
+                            base.pop(key, None)
+                        else:
+                            base[key] = value
+                merged.append(base)
+            self.merged = tuple(merged)
+        return self.merged
+
+    def keys(self, side: int) -> Iterator[Any]:
+        """按合并后的顺序遍历存活的键, 未合并时不构建合并结果"""
+        if self.merged is not None:
+            return iter(self.merged[side])
+        return self._keys(side)
+
+    def _keys(self, side: int) -> Iterator[Any]:
+        base, delta = self.base[side], self.delta[side]
+        for key in base:
+            if delta.get(key) is not _DELETED:
+                yield key
+        for key, value in delta.items():
+            if value is not _DELETED and key not in base:
+                yield key
+
+    def writable(self) -> None:
+        if self.frozen: raise TypeError("snapshot is read-only")
+        self.merged = None
+
+    def set(self, side: int, key: Any, value: Any) -> None:
+        self.writable()
+        self.cursors = [None, None]
+        other = 1 - side
+        if (old := self.get(side, key)) is not _MISSING:
+            if value == old: return
+            self.delta[other][old] = _DELETED
+        else:
+            self.size += 1
+        if (other_key := self.get(other, value)) is not _MISSING:
+            self.delta[side][other_key] = _DELETED
+            self.size -= 1
+        self.delta[side][key] = value
+        self.delta[other][value] = key
+
+    def delete(self, side: int, key: Any) -> Any:
+        if (value := self.get(side, key)) is _MISSING: raise KeyError(key)
+        self.writable()
+        self.delta[side][key] = _DELETED
+        self.delta[1-side][value] = _DELETED
+        self.size -= 1
+        return value
+
+    def popitem(self, side: int) -> tuple[Any, Any]:
+        """先弹出增量再弹出基础 dict, 都从后往前
+
+        游标在同一快照内保留, 连续弹出均摊 O(1); 新快照的游标只需跳过增量中的删除标记
+        """
+        self.writable()
+        if self.cursors[side] is None:
+            self.cursors[side] = chain(reversed(list(self.delta[side])), reversed(self.base[side]))
+        for key in self.cursors[side]:
+            if self.get(side, key) is not _MISSING:
+                return key, self.delete(side, key)
+        raise KeyError("popitem(): dictionary is empty")
+
+    def clear(self) -> None:
+        self.writable()
+        self.cursors = [None, None]
+        self.base, self.delta, self.size = ({}, {}), ({}, {}), 0
+
+    def publish(self) -> None:
+        """冻结, 增量过大时先合并"""
+        if len(self.delta[0]) > max(64, isqrt(2 * len(self.base[0]))):
+            self.base, self.delta = self.dicts(), ({}, {})
+        self.frozen = True
+
+    def view(self, side: int) -> "DoubleDictSnapshot[Any, Any]":
+        if self.views[side] is None:
+            res = DoubleDictSnapshot.__new__(DoubleDictSnapshot)
+            res._snapshot = self
+            res._side = side
+            self.views[side] = res
+        return self.views[side]
+
+
+class DoubleDictSnapshot(Generic[KT, VT], MutableMapping[KT, VT]):
+    """ConcurrentDoubleDict 的快照视图, 发布后只读, 事务中为可写的工作副本"""
+    __slots__ = ("_snapshot", "_side")
+    _snapshot: _Snapshot
+    _side:     int
+
+    def inverse(self) -> "DoubleDictSnapshot[VT, KT]":
+        return self._snapshot.view(1 - self._side)
+
+    def contains_value(self, value: VT) -> bool:
+        return self._snapshot.get(1 - self._side, value) is not _MISSING
+
+    def __contains__(self, key: object) -> bool:
+        return self._snapshot.get(self._side, key) is not _MISSING
+
+    def __getitem__(self, key: KT) -> VT:
+        if (value := self._snapshot.get(self._side, key)) is _MISSING: raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: KT, value: VT) -> None:
+        self._snapshot.set(self._side, key, value)
+
+    def __delitem__(self, key: KT) -> None:
+        self._snapshot.delete(self._side, key)
+
+    def popitem(self) -> tuple[KT, VT]:
+        return self._snapshot.popitem(self._side)
+
+    def clear(self) -> None:
+        self._snapshot.clear()
+
+    def __iter__(self) -> Iterator[KT]:
+        return self._snapshot.keys(self._side)
+
+    def __len__(self) -> int:
+        return self._snapshot.size
+
+    def __str__(self) -> str:
+        return str(self._snapshot.dicts()[self._side])
+
+    def __repr__(self) -> str:
+        return repr(self._snapshot.dicts()[self._side])
+
+
+class _Published:
+    """ConcurrentDoubleDict 与其反向视图共享的状态, 读取 snapshot 无需加锁"""
+    __slots__ = ("snapshot", "lock", "working")
+
+    def __init__(self, snapshot: _Snapshot) -> None:
+        self.snapshot = snapshot
+        self.lock = RLock()
+        self.working = False
+
+
+class ConcurrentDoubleDict(Generic[KT, VT], MutableMapping[KT, VT]):
+    """线程安全的 DoubleDict
+
+    读取无锁, 总是看到某次提交后的完整内容; 写入持有唯一的写锁,
+    在新的快照上修改后整体发布. 需要一致地读取多项时使用 snapshot(),
+    多项写入应放在一个 transaction 中
+
+    >>> d = ConcurrentDoubleDict([(1, 2), (2, 3)])
+    >>> with d.transaction() as work:
+    ...     work[1] = 3
+    ...     work[4] = 5
+    >>> d, d.inverse(), d.inverse().inverse() is d
+    ({1: 3, 4: 5}, {3: 1, 5: 4}, True)
+    >>> snap = d.snapshot()
+    >>> d.inverse()[3] = 6
+    >>> snap, snap.inverse()[snap[1]], d
+    ({1: 3, 4: 5}, 1, {4: 5, 6: 3})
+    >>> snap[1] = 2
+    Traceback (most recent call last):
+    ...
+    TypeError: snapshot is read-only
+    """
+    __slots__ = ("_published", "_side", "_inverse")
+    _published: _Published
+    _side:      int
+    _inverse:   "ConcurrentDoubleDict[VT, KT] | None"
+
+    def __init__(self, iterable: Iterable[tuple[KT, VT]] | Mapping[KT, VT] = ()) -> None:
+        init: DoubleDict[KT, VT] = DoubleDict(iterable)
+        snapshot = _Snapshot((init._forward, init._backward), ({}, {}), len(init))
+        snapshot.publish()
+        self._published = _Published(snapshot)
+        self._side = 0
+        self._inverse = None
+
+    def inverse(self) -> "ConcurrentDoubleDict[VT, KT]":
+        """共享状态的反向视图, 只创建一次"""
+        if self._inverse is None:
+            res = ConcurrentDoubleDict.__new__(ConcurrentDoubleDict)
+            res._published = self._published
+            res._side = 1 - self._side
+            res._inverse = self
+            self._inverse = res
+        return self._inverse
+
+    def snapshot(self) -> DoubleDictSnapshot[KT, VT]:
+        """当前已发布内容的只读视图, 不复制"""
+        return self._published.snapshot.view(self._side)
+
+    @contextmanager
+    def transaction(self) -> Iterator[DoubleDictSnapshot[KT, VT]]:
+        """持有写锁, 产出可写的工作副本, 正常退出时整体发布
+
+        同一线程内不可嵌套, 事务中应只修改产出的副本
+        """
+        published = self._published
+        with published.lock:
+            if published.working:
+                raise RuntimeError("nested transaction")
+            work = published.snapshot.fork()
+            published.working = True
+            try:
+                yield work.view(self._side)
+                work.publish()
+                published.snapshot = work
+            finally:
+                work.frozen = True
+                published.working = False
+
+    def contains_value(self, value: VT) -> bool:
+        return self._published.snapshot.get(1 - self._side, value) is not _MISSING
+
+    def __contains__(self, key: object) -> bool:
+        return self._published.snapshot.get(self._side, key) is not _MISSING
+
+    def __getitem__(self, key: KT) -> VT:
+        if (value := self._published.snapshot.get(self._side, key)) is _MISSING: raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: KT, value: VT) -> None:
+        with self.transaction() as work:
+            work[key] = value
+
+    def __delitem__(self, key: KT) -> None:
+        with self.transaction() as work:
+            del work[key]
+
+    def update(self, other: Iterable[tuple[KT, VT]] | Mapping[KT, VT] = (), /, **kwds: VT) -> None:
+        with self.transaction() as work:
+            work.update(other, **kwds)
+
+    def pop(self, key: KT, default: Any = _MISSING) -> Any:
+        with self.transaction() as work:
+            if default is _MISSING:
+                return work.pop(key)
+            return work.pop(key, default)
+
+    def popitem(self) -> tuple[KT, VT]:
+        with self.transaction() as work:
+            return work.popitem()
+
+    def setdefault(self, key: KT, default: Any = None) -> Any:
+        if (value := self._published.snapshot.get(self._side, key)) is not _MISSING:
+            return value
+        with self.transaction() as work:
+            return work.setdefault(key, default)
+
+    def clear(self) -> None:
+        with self.transaction() as work:
+            work.clear()
+
+    def __iter__(self) -> Iterator[KT]:
+        return iter(self.snapshot())
+
+    def __len__(self) -> int:
+        return self._published.snapshot.size
+
+    def __str__(self) -> str:
+        return str(self.snapshot())
+
+    def __repr__(self) -> str:
+        return repr(self.snapshot())
+
+
+def bench(n: int = 1_000_000) -> None:
+    """与一对 dict 对比批量载入, 逐个写入, 反向视图及清空的耗时"""
+    from time import perf_counter  # pylint: disable=import-outside-toplevel
+
+    pairs = [(i, str(i)) for i in range(n)]
+
+    def timeit(name: str, fn: Any) -> None:
+        start = perf_counter()
+        fn()
+        print(f"{name:<28}{perf_counter() - start:.3f}s")
+
+    def dicts_set() -> None:
+        forward: dict[int, str] = {}
+        backward: dict[str, int] = {}
+        for k, v in pairs:
+            forward[k] = v
+            backward[v] = k
+
+    def double_set() -> None:
+        d: DoubleDict[int, str] = DoubleDict()
+        for k, v in pairs:
+            d[k] = v
+
+    timeit("dicts bulk load", lambda: (dict(pairs), {v: k for k, v in pairs}))
+    timeit("DoubleDict(pairs)", lambda: DoubleDict(pairs))
+    d: DoubleDict[int, str] = DoubleDict(pairs[:1])
+    timeit("update (non-empty)", lambda: d.update(pairs))
+    timeit("dicts __setitem__", dicts_set)
+    timeit("DoubleDict __setitem__", double_set)
+    timeit(f"inverse() x{n}", lambda: [d.inverse() for _ in range(n)])
+    timeit("clear", d.clear)
+
+    import tracemalloc  # pylint: disable=import-outside-toplevel
+    from tempfile import TemporaryDirectory  # pylint: disable=import-outside-toplevel
+
+    tracemalloc.start()
+    timeit("DoubleDict int->str", lambda: DoubleDict((i, str(i)) for i in range(n)))
+    print(f"{'':<28}peak {tracemalloc.get_traced_memory()[1] >> 20}MiB")
+    tracemalloc.stop()
+    compact: CompactDoubleDict[int, str] = CompactDoubleDict()
+    timeit("CompactDoubleDict int->str", lambda: compact.update((i, str(i)) for i in range(n)))
+    print(f"{'':<28}{sum(memoryview(buf).nbytes for buf in compact._store.buffers()) >> 20}MiB")
+    with TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.ddict")
+        timeit("CompactDoubleDict.save", lambda: compact.save(path))
+        loaded = CompactDoubleDict.load(path)
+        timeit(f"lookup x{n} (mapped)", lambda: [loaded[i] for i in range(n)])
+        del loaded
+
+def bench_concurrent(n: int = 100_000, threads: int = 8, ops: int = 100_000, writes: float = 0.01) -> None:
+    """读多写少负载下, 与整体加锁的 DoubleDict 对比吞吐量"""
+    from random import Random  # pylint: disable=import-outside-toplevel
+    from threading import Lock, Thread  # pylint: disable=import-outside-toplevel
+    from time import perf_counter  # pylint: disable=import-outside-toplevel
+
+    def run(name: str, read: Any, write: Any) -> None:
+        def worker(seed: int) -> None:
+            rand = Random(seed)
+            for _ in range(ops):
+                k = rand.randrange(n)
+                if rand.random() < writes:
+                    write(k, -k)
+                else:
+                    read(k)
+
+        workers = [Thread(target=worker, args=(i,)) for i in range(threads)]
+        start = perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = perf_counter() - start
+        print(f"{name:<28}{threads * ops / elapsed / 1e3:.0f}k ops/s")
+
+    locked: DoubleDict[int, int] = DoubleDict((i, i) for i in range(n))
+    lock = Lock()
+
+    def locked_read(k: int) -> Any:
+        with lock:
+            v = locked[k]
+            return locked.inverse()[v]
+
+    def locked_write(k: int, v: int) -> None:
+        with lock:
+            locked[k] = v
+
+    concurrent: ConcurrentDoubleDict[int, int] = ConcurrentDoubleDict((i, i) for i in range(n))
+
+    def concurrent_read(k: int) -> Any:
+        snap = concurrent.snapshot()
+        return snap.inverse()[snap[k]]
+
+    def concurrent_write(k: int, v: int) -> None:
+        concurrent[k] = v
+
+    print(f"{threads} threads, {writes:.0%} writes, {n} pairs")
+    run("DoubleDict + Lock", locked_read, locked_write)
+    run("ConcurrentDoubleDict", concurrent_read, concurrent_write)
+    run("ConcurrentDoubleDict no write", concurrent_read, lambda k, v: None)
+
+
+if __name__ == '__main__':
+    bench(*map(int, sys.argv[1:]))
+    bench_concurrent()
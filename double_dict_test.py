@@ -0,0 +1,244 @@
+#!/usr/bin/python3
+# -*- coding: utf-8; -*-
+"""test file"""
+
+import random
+import threading
+
+import pytest
+
+from double_dict import CompactDoubleDict, ConcurrentDoubleDict, DoubleDict
+
+KEYS = 64
+WRITERS = 4
+READERS = 8
+WRITES = 2000
+
+
+def check_bijection(d: ConcurrentDoubleDict) -> None:
+    snap = d.snapshot()
+    inverse = snap.inverse()
+    assert len(snap) == len(inverse)
+    for k in snap:
+        assert inverse[snap[k]] == k
+
+
+def test_concurrent_stress():
+    d: ConcurrentDoubleDict[int, int] = ConcurrentDoubleDict(
+            (i, i) for i in range(KEYS))
+    stop = threading.Event()
+    errors: list[BaseException] = []
+
+    def writer(seed: int) -> None:
+        rand = random.Random(seed)
+        try:
+            for _ in range(WRITES):
+                k, v = rand.randrange(KEYS), rand.randrange(KEYS)
+                match rand.randrange(4):
+                    case 0:
+                        d[k] = v
+                    case 1:
+                        d.inverse()[v] = k
+                    case 2:
+                        d.pop(k, None)
+                    case 3:
+                        with d.transaction() as work:
+                            work[k] = v
+                            work[v] = k
+        except BaseException as e:  # pylint: disable=broad-except
+            errors.append(e)
+
+    def reader() -> None:
+        try:
+            while not stop.is_set():
+                check_bijection(d)
+                snap = d.snapshot()
+                for k in range(KEYS):
+                    if k in snap:
+                        assert snap.inverse()[snap[k]] == k
+        except BaseException as e:  # pylint: disable=broad-except
+            errors.append(e)
+            stop.set()
+
+    readers = [threading.Thread(target=reader) for _ in range(READERS)]
+    writers = [threading.Thread(target=writer, args=(i,))
+               for i in range(WRITERS)]
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    assert not errors, errors
+    check_bijection(d)
+
+
+def test_transaction_rollback():
+    d = ConcurrentDoubleDict({1: 2})
+    try:
+        with d.transaction() as work:
+            work[3] = 4
+            raise ValueError
+    except ValueError:
+        pass
+    assert dict(d) == {1: 2}
+    assert d.pop(5, None) is None and d.inverse().pop(2) == 1
+    assert not d and not d.inverse()
+
+
+def test_nested_transaction():
+    d = ConcurrentDoubleDict({1: 2})
+    with d.transaction():
+        try:
+            d[3] = 4
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("nested transaction allowed")
+    assert dict(d) == {1: 2}
+
+
+def test_compact_churn():
+    d = CompactDoubleDict()
+    for i in range(100_000):
+        d[1] = "a"
+        del d[1]
+    for i in range(100_000):
+        d[2] = str(i)
+    store = d._store  # pylint: disable=protected-access
+    assert len(d) == 1 and d.inverse()["99999"] == 2
+    assert len(store.alive) < 16 and len(store.columns[1].blob) < 100
+
+
+def test_compact_unencodable_key():
+    d = CompactDoubleDict([(1, "a")])
+    assert 2**70 not in d and "x" not in d
+    assert d.get(2**70) is None and d.inverse().get(5) is None
+    with pytest.raises(KeyError):
+        del d[2**70]
+    with pytest.raises(OverflowError):
+        d[2**70] = "b"
+    assert dict(d) == {1: "a"}
+
+
+def mutate(rand: random.Random, *dicts) -> None:
+    """对每个字典执行同一随机操作, 键为 int, 值为 str"""
+    k, v = rand.randrange(KEYS), str(rand.randrange(KEYS))
+    match rand.randrange(5):
+        case 0 | 1:
+            for d in dicts:
+                d[k] = v
+        case 2:
+            for d in dicts:
+                d.inverse()[v] = k
+        case 3:
+            for d in dicts:
+                d.pop(k, None)
+        case 4:
+            for d in dicts:
+                d.inverse().pop(v, None)
+
+
+def assert_same(compact: CompactDoubleDict, reference: DoubleDict) -> None:
+    assert dict(compact) == dict(reference)
+    assert dict(compact.inverse()) == dict(reference.inverse())
+    assert len(compact) == len(reference) == len(compact.inverse())
+
+
+def test_compact_matches_double_dict():
+    rand = random.Random(0)
+    compact: CompactDoubleDict[int, str] = CompactDoubleDict()
+    reference: DoubleDict[int, str] = DoubleDict()
+    for i in range(20_000):
+        mutate(rand, compact, reference)
+        if i % 500 == 0:
+            assert_same(compact, reference)
+    assert_same(compact, reference)
+    assert all(compact.contains_value(v) for v in reference.values())
+    compact.clear()
+    assert not compact and not compact.inverse()
+
+
+def test_compact_save_load(tmp_path):
+    rand = random.Random(1)
+    compact: CompactDoubleDict[int, str] = CompactDoubleDict()
+    reference: DoubleDict[int, str] = DoubleDict()
+    for _ in range(3000):
+        mutate(rand, compact, reference)
+    path = str(tmp_path / "d.ddict")
+    compact.inverse().save(path)
+    loaded = CompactDoubleDict.load(path)
+    assert_same(loaded.inverse(), reference)
+    for _ in range(3000):
+        mutate(rand, loaded.inverse(), reference)
+    assert_same(loaded.inverse(), reference)
+    # 写入复制到内存, 文件本身不变
+    assert len(CompactDoubleDict.load(path)) == len(compact)
+    assert_same(CompactDoubleDict.load(path).inverse(), DoubleDict(compact))
+
+
+def assert_consistent(d: DoubleDict) -> None:
+    assert d.inverse().inverse() is d
+    assert dict(d.inverse()) == {v: k for k, v in d.items()}
+    assert len(d) == len(d.inverse())
+
+
+@pytest.mark.parametrize("initial", [{}, {0: "x", 9: "a"}])
+@pytest.mark.parametrize("other", [
+    {1: "a", 2: "b"},
+    [(1, "a"), (2, "a"), (1, "b")],
+    {1: "a", 2: "a"},
+    [(3, "c"), (3, "c")],
+])
+def test_update_matches_setitem(initial, other):
+    d = DoubleDict(initial)
+    expected = DoubleDict(initial)
+    d.update(other, z="b")
+    for k, v in (other.items() if isinstance(other, dict) else other):
+        expected[k] = v
+    expected["z"] = "b"
+    assert dict(d) == dict(expected)
+    assert_consistent(d)
+
+
+def test_pop_popitem_clear():
+    d = DoubleDict((i, -i) for i in range(10))
+    assert d.pop(3) == -3 and d.pop(3, None) is None
+    with pytest.raises(KeyError):
+        d.pop(3)
+    assert d.inverse().pop(-4) == 4
+    assert d.popitem() == (9, -9) and d.inverse().popitem() == (-8, 8)
+    assert_consistent(d)
+    assert -3 not in d.inverse() and not d.contains_value(-9)
+    d.clear()
+    assert not d and not d.inverse()
+    with pytest.raises(KeyError):
+        d.popitem()
+    d[1] = 2
+    assert_consistent(d)
+
+
+def test_snapshot_popitem_and_iter():
+    d = ConcurrentDoubleDict((i, -i) for i in range(1000))
+    popped = {}
+    with d.transaction() as work:
+        for i in range(1000, 1100):
+            work[i] = -i
+        work[5] = 5000
+        del work[7]
+        assert sorted(work) == sorted(set(range(1100)) - {7})
+        assert list(work) == list(dict(work.items()))
+        for _ in range(600):
+            k, v = work.popitem()
+            assert k not in work and v not in work.inverse()
+            popped[k] = v
+        assert len(work) == 1099 - 600
+    while d:
+        k, v = d.inverse().popitem()
+        popped[v] = k
+    assert popped == {**{i: -i for i in range(1100) if i != 7}, 5: 5000}
+    check_bijection(d)
+    with pytest.raises(KeyError):
+        d.popitem()
@@ -0,0 +1,742 @@
+#!/usr/bin/python3
+# -*- coding: utf-8; -*-
+"""使用编辑器批量重命名的小工具, 比shell实现更快"""
+
+import os
+import re
+import json
+from sys import argv, stderr, stdin, exit
+from os import replace, remove, getenv, isatty, makedirs, scandir, fsdecode
+from os.path import dirname, join, lexists, isdir, normpath, split
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Executor, ThreadPoolExecutor, wait
+from errno import EEXIST, ENOENT, EXDEV, EINVAL, ENOSYS, EOPNOTSUPP
+from shutil import copystat, copytree, rmtree
+from stat import S_ISDIR, S_ISLNK, S_ISREG
+from itertools import count
+from getopt import gnu_getopt, GetoptError
+from tempfile import mkdtemp, mkstemp
+from subprocess import run
+from shlex import quote
+from threading import Lock
+from time import monotonic
+from typing import BinaryIO, NamedTuple, Optional
+
+ENCODING = "utf-8"
+RS = "\n"
+EDITOR = getenv("EDITOR") or "vim"
+ARROW = "\x1b[1;32m->\x1b[m" if isatty(1) else "->"
+TEMP_FORMAT = ".editor-mv.{}.tmp"
+PROGRESS_INTERVAL = 0.2
+JOURNAL_VERSION = 1
+COPY_JOBS = 4
+LARGE_FILE = 64 << 20
+RANGE_SIZE = 16 << 20
+COPY_CHUNK = 1 << 30
+# copy_file_range 不支持时退回 sendfile, 跨文件系统自 Linux 5.19 起为 EXDEV
+COPY_FALLBACK = {EXDEV, EINVAL, ENOSYS, EOPNOTSUPP}
+HELP_MSG = """\
+Usage: editor-mv [Options] <FILE>...
+       editor-mv [Options] -e <REGEX> [-t <TEMPLATE>] [-R] [-0] [FILE]...
+       editor-mv [Options] -J <FILE> --resume|--rollback
+Use the $EDITOR to batch edit the path of mv,
+or rename with a regex without the editor.
+Cross filesystem renames fall back to copy then delete.
+
+Options:
+    -e, --regex=REGEX       rename names matching REGEX, no editor
+    -t, --to=TEMPLATE       re.sub replacement of --regex, default is empty
+    -F, --full-path         apply --regex to the whole path, not the name
+    -R, --recursive         rename the files under directory arguments
+    -0, --null              read NUL separated paths from stdin, need --regex
+    -j, --jobs=N            rename threads, one directory per thread
+    -J, --journal=FILE      record completed renames to FILE
+        --resume            finish the run recorded in --journal
+        --rollback          undo the run recorded in --journal
+        --copy-jobs=N       threads copying large files across filesystems
+    -n, --dry-run           print the plan, do not rename
+    -f, --force             overwrite existing files not being renamed
+    -v, --verbose           verbose mode
+    -h, --help              show help
+
+Exit: 1 some renames failed, 2 bad arguments, 3 editor failed,
+      4 edit aborted, 5 conflicting plan
+"""
+
+
+class Plan(NamedTuple):
+    """重命名计划
+
+    dirs 是需要先创建的目录, groups 中每组互不依赖, 组内必须按序执行,
+    前一步失败时后续步骤会覆盖文件, 所以必须放弃该组剩余部分
+    """
+    dirs: list[str]
+    groups: list[list[tuple[str, str]]]
+
+
+def temp_name(path: str, taken: set[str], counter: Iterator[int]) -> str:
+    """在 path 所在目录生成一个不存在的临时名, 保证 rename 不跨文件系统"""
+    for i in counter:
+        name = join(dirname(path), TEMP_FORMAT.format(i))
+        if name not in taken and not lexists(name):
+            taken.add(name)
+            return name
+    raise AssertionError("unreachable")
+
+
+def plan_renames(pairs: Iterable[tuple[str, str]], force: bool = False) -> Plan:
+    """将 (src, dst) 列表规划为不会覆盖文件的执行顺序
+
+    每个源只有一个目标且目标互不相同, 所以依赖图只由链和环组成:
+    链从末端往回执行, 环先把一个成员移到临时名再按链处理, 总体线性时间
+
+    冲突 (目标重复, 源不存在, 覆盖无关的已有文件) 会全部收集后以 ValueError 抛出
+    """
+    moves: dict[str, str] = {}
+    sources_of: dict[str, str] = {}
+    errors = []
+    for src, dst in pairs:
+        if not dst:
+            errors.append(f"empty target for {quote(src)}")
+            continue
+        src, dst = normpath(src), normpath(dst)
+        if src in moves:
+            if moves[src] != dst:
+                errors.append(f"{quote(src)} renamed twice")
+            continue
+        if src == dst:
+            continue
+        if dst in sources_of:
+            errors.append(f"{quote(sources_of[dst])} and {quote(src)} "
+                          f"both renamed to {quote(dst)}")
+            continue
+        moves[src] = dst
+        sources_of[dst] = src
+
+    dirs = []
+    dir_exists: dict[str, bool] = {}
+    for src, dst in moves.items():
+        if not lexists(src):
+            errors.append(f"{quote(src)} does not exist")
+        if dst not in moves and not force and lexists(dst):
+            errors.append(f"renaming {quote(src)} would overwrite {quote(dst)}")
+        parent = dirname(dst)
+        if parent and parent not in dir_exists:
+            dir_exists[parent] = isdir(parent)
+            if not dir_exists[parent]:
+                dirs.append(parent)
+    if errors:
+        raise ValueError("\n".join(errors))
+
+    groups = []
+    left = dict(moves)
+    for src, dst in moves.items():
+        if dst in moves:
+            continue
+        # 链的末端, 沿着移入者往回走
+        group = []
+        while True:
+            group.append((src, left.pop(src)))
+            if (prev := sources_of.get(src)) is None:
+                break
+            src = prev
+        groups.append(group)
+
+    taken = set(moves) | set(sources_of)
+    counter = count()
+    for start in moves:
+        if start not in left:
+            continue
+        # 剩下的都在环上, 先腾出 start 再把环当作链处理
+        tmp = temp_name(start, taken, counter)
+        group = [(start, tmp)]
+        target = start
+        src = sources_of[start]
+        while src != start:
+            group.append((src, target))
+            target = src
+            src = sources_of[src]
+        group.append((tmp, left.pop(start)))
+        for src, _ in group[1:-1]:
+            del left[src]
+        groups.append(group)
+
+    return Plan(dirs, groups)
+
+
+def print_plan(plan: Plan) -> None:
+    """以可以直接交给 shell 执行的形式输出计划"""
+    for path in plan.dirs:
+        print(f"mkdir -p -- {quote(path)}")
+    for group in plan.groups:
+        for src, dst in group:
+            print(f"mv -- {quote(src)} {quote(dst)}")
+
+
+class Failure(NamedTuple):
+    """失败的一步, skipped 是同组中因此放弃的后续重命名数"""
+    src: str
+    dst: str
+    error: OSError
+    skipped: int
+
+
+class Report(NamedTuple):
+    renamed: int
+    failures: list[Failure]
+
+
+class Journal:
+    """追加写入的日志, 记录已完成的步骤, 用于中断后继续 (--resume) 或回滚 (--rollback)
+
+    第一行是版本与计划, 之后每行是 [状态, 组, 步骤, *参数], 状态为
+    copy (开始跨设备复制, 参数为临时名, 目标原本不存在时再加 new),
+    copied (目标已就位, 源尚未删除), failed (复制失败, 临时名已删除), done 和 undone
+    每行以 O_APPEND 单次写入, 中断时最多留下一行残缺的尾行, 读取时忽略
+    """
+
+    def __init__(self, path: str, plan: Plan, states: dict[tuple[int, int], list],
+                 loaded: bool = False, torn: bool = False):
+        self.path = path
+        self.plan = plan
+        self.states = states
+        self.loaded = loaded
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+        if torn:
+            os.write(self.fd, b"\n")
+
+    @classmethod
+    def create(cls, path: str, plan: Plan) -> "Journal":
+        """新建日志, 文件已存在时抛出 FileExistsError, 避免覆盖未完成的记录"""
+        header = {"version": JOURNAL_VERSION, "dirs": plan.dirs, "groups": plan.groups}
+        with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600),
+                  "w", encoding=ENCODING, errors="surrogateescape") as file:
+            json.dump(header, file, ensure_ascii=False)
+            file.write("\n")
+        return cls(path, plan, {})
+
+    @classmethod
+    def load(cls, path: str) -> "Journal":
+        states: dict[tuple[int, int], list] = {}
+        with open(path, encoding=ENCODING, errors="surrogateescape") as file:
+            header = json.loads(file.readline())
+            if header.get("version") != JOURNAL_VERSION:
+                raise ValueError(f"{path}: unsupported journal version {header.get('version')}")
+            plan = Plan(header["dirs"],
+                        [[(src, dst) for src, dst in group] for group in header["groups"]])
+            line = ""
+            for line in file:
+                try:
+                    status, g, i, *args = json.loads(line)
+                except ValueError:
+                    continue
+                states[g, i] = [status, *args]
+        return cls(path, plan, states, True, torn=bool(line) and not line.endswith("\n"))
+
+    def record(self, status: str, g: int, i: int, *args: str) -> None:
+        os.write(self.fd, (json.dumps([status, g, i, *args], ensure_ascii=False) + "\n")
+                 .encode(ENCODING, "surrogateescape"))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def remove_path(path: str) -> None:
+    """删除文件或整个目录, 不存在时忽略"""
+    try:
+        if S_ISDIR(os.lstat(path).st_mode):
+            rmtree(path)
+        else:
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def copy_range(src_fd: int, dst: str, offset: int, end: int) -> None:
+    """把 src_fd 的 [offset, end) 复制到 dst 的相同位置, 数据不经过用户态
+
+    每段单独打开 dst, 使并行的各段拥有各自的写入位置
+    """
+    fd = os.open(dst, os.O_WRONLY)
+    try:
+        os.lseek(fd, offset, os.SEEK_SET)
+        use_range = hasattr(os, "copy_file_range")
+        while offset < end:
+            count = min(end - offset, COPY_CHUNK)
+            if use_range:
+                try:
+                    n = os.copy_file_range(src_fd, fd, count, offset)
+                except OSError as e:
+                    if e.errno not in COPY_FALLBACK:
+                        raise
+                    use_range = False
+                    continue
+            else:
+                n = os.sendfile(fd, src_fd, offset, count)
+            if not n:
+                break  # 复制期间文件变短
+            offset += n
+    finally:
+        os.close(fd)
+
+
+class Mover:
+    """rename, 跨文件系统 (EXDEV) 时退回复制到目标目录的临时名, 替换后再删除源
+
+    大文件按 RANGE_SIZE 分段, 交给有界的 pool 并行复制
+    """
+
+    def __init__(self, pool: Executor, journal: Optional[Journal] = None):
+        self.pool = pool
+        self.journal = journal
+        self.states = journal.states if journal is not None else {}
+        self.resuming = journal is not None and journal.loaded
+
+    def record(self, status: str, step: Optional[tuple[int, int]], *args: str) -> None:
+        if self.journal is not None and step is not None:
+            self.journal.record(status, *step, *args)
+
+    def step(self, g: int, i: int, src: str, dst: str) -> bool:
+        """执行计划中的一步并记入日志, 继续上次的运行时跳过已完成的步骤并返回 False
+
+        每步完成后才记录, 中断可能发生在两者之间, 所以继续时以磁盘上
+        源已不存在而目标存在判断为已完成.
+        跨设备复制只以 copied 记录为完成, 在此之前源完好, 重新复制即可
+        """
+        match self.states.get((g, i)):
+            case ["done"]:
+                return False
+            case ["copied", _] if lexists(dst):
+                # 临时名已替换到目标, 只差删除源
+                remove_path(src)
+                self.record("done", (g, i))
+                return True
+            case ["copy", tmp, *_]:
+                # 目标可能是副本, 也可能是 --force 要覆盖的原有文件, 不能据此判断
+                remove_path(tmp)
+            case None | ["failed"] if self.resuming and not lexists(src) and lexists(dst):
+                self.record("done", (g, i))
+                return False
+        self.move(src, dst, (g, i))
+        self.record("done", (g, i))
+        return True
+
+    def move(self, src: str, dst: str, step: Optional[tuple[int, int]] = None) -> None:
+        try:
+            replace(src, dst)
+        except OSError as e:
+            if e.errno != EXDEV:
+                raise
+            self.copy_move(src, dst, step, e)
+
+    def copy_move(self, src: str, dst: str, step: Optional[tuple[int, int]],
+                  error: OSError) -> None:
+        mode = os.lstat(src).st_mode
+        if not (S_ISREG(mode) or S_ISDIR(mode) or S_ISLNK(mode)):
+            raise error
+        parent = dirname(dst) or "."
+        if S_ISDIR(mode):
+            tmp = mkdtemp(prefix=".tmp.", dir=parent)
+        else:
+            fd, tmp = mkstemp(prefix=".tmp.", dir=parent)
+            os.close(fd)
+        self.record("copy", step, tmp, *([] if lexists(dst) else ["new"]))
+        try:
+            if S_ISLNK(mode):
+                os.unlink(tmp)
+                os.symlink(os.readlink(src), tmp)
+            elif S_ISDIR(mode):
+                copytree(src, tmp, symlinks=True, copy_function=self.copy_file,
+                         dirs_exist_ok=True)
+            else:
+                self.copy_file(src, tmp)
+            replace(tmp, dst)
+        except BaseException:
+            remove_path(tmp)
+            self.record("failed", step)
+            raise
+        self.record("copied", step, tmp)
+        remove_path(src)
+
+    def copy_file(self, src: str, dst: str) -> str:
+        """复制内容与权限时间, 删除源之前先 fsync"""
+        with open(src, "rb") as fin, open(dst, "wb") as fout:
+            size = os.fstat(fin.fileno()).st_size
+            if size < LARGE_FILE:
+                copy_range(fin.fileno(), dst, 0, size)
+            else:
+                os.ftruncate(fout.fileno(), size)
+                futures = [self.pool.submit(copy_range, fin.fileno(), dst,
+                                            offset, min(offset + RANGE_SIZE, size))
+                           for offset in range(0, size, RANGE_SIZE)]
+                wait(futures)
+                for future in futures:
+                    future.result()
+            os.fsync(fout.fileno())
+        copystat(src, dst)
+        return dst
+
+
+def apply_plan(plan: Plan, verbose: bool = False, jobs: int = 1,
+               progress: bool = False, journal: Optional[Journal] = None,
+               copy_jobs: int = COPY_JOBS) -> Report:
+    """执行计划, 失败只记录在返回值中, 不会中断其他组
+
+    组按第一个源所在目录分桶, 每个目录由一个线程处理,
+    同目录的 rename 在内核中本就互斥, 分桶避免了线程间争用目录锁
+    给出 journal 时记录每一步, 并跳过其中已完成的步骤
+    """
+    total = sum(map(len, plan.groups))
+    failures: list[Failure] = []
+    renamed = 0
+    last = 0.0
+    lock = Lock()
+
+    for path in plan.dirs:
+        try:
+            makedirs(path, exist_ok=True)
+        except OSError as e:
+            failures.append(Failure(path, path, e, 0))
+
+    def run_groups(groups: list[tuple[int, list[tuple[str, str]]]]) -> None:
+        nonlocal renamed, last
+        for g, group in groups:
+            done = 0
+            for i, (src, dst) in enumerate(group):
+                try:
+                    if not mover.step(g, i, src, dst):
+                        continue
+                except OSError as e:
+                    with lock:
+                        failures.append(Failure(src, dst, e, len(group) - i - 1))
+                    break
+                done += 1
+                if verbose:
+                    with lock:
+                        print(f"{quote(src)} {ARROW} {quote(dst)}")
+
+            with lock:
+                renamed += done
+                if progress and (now := monotonic()) - last >= PROGRESS_INTERVAL:
+                    last = now
+                    print(f"\r{renamed}/{total} renamed, {len(failures)} failed",
+                          end="", file=stderr, flush=True)
+
+    buckets: dict[str, list[tuple[int, list[tuple[str, str]]]]] = {}
+    for g, group in enumerate(plan.groups):
+        buckets.setdefault(dirname(group[0][0]), []).append((g, group))
+    # 线程只在第一次跨设备复制大文件时创建
+    with ThreadPoolExecutor(copy_jobs) as copy_pool:
+        mover = Mover(copy_pool, journal)
+        if jobs > 1 and len(buckets) > 1:
+            with ThreadPoolExecutor(jobs) as pool:
+                for _ in pool.map(run_groups, buckets.values()):
+                    pass
+        else:
+            run_groups(list(enumerate(plan.groups)))
+
+    if progress:
+        print(f"\r{renamed}/{total} renamed, {len(failures)} failed", file=stderr)
+    failures.sort(key=lambda failure: failure.src)
+    return Report(renamed, failures)
+
+
+def undo_ready(src: str, dst: str) -> bool:
+    """撤销 src -> dst 之前确认目标存在而源不存在, 回滚绝不覆盖文件
+
+    源存在而目标不存在时说明已经撤销过 (中断在撤销与记录之间), 返回 False
+    """
+    if lexists(src):
+        if not lexists(dst):
+            return False
+        raise FileExistsError(EEXIST, os.strerror(EEXIST), src)
+    if not lexists(dst):
+        raise FileNotFoundError(ENOENT, os.strerror(ENOENT), dst)
+    return True
+
+
+def rollback(journal: Journal, verbose: bool = False, copy_jobs: int = COPY_JOBS) -> Report:
+    """按相反顺序撤销日志中已完成的步骤
+
+    每步完成后才记录, 所以每组最后一条记录之后的一步也可能已经完成, 以磁盘状态判断,
+    撤销前确认目标存在而源不存在;
+    撤销也记入日志, 中断后可以再次回滚, 被 --force 覆盖的文件无法恢复
+    """
+    failures: list[Failure] = []
+    undone = 0
+    states = journal.states
+    with ThreadPoolExecutor(copy_jobs) as copy_pool:
+        mover = Mover(copy_pool)
+        for g in reversed(range(len(journal.plan.groups))):
+            group = journal.plan.groups[g]
+            recorded = [i for i in range(len(group)) if (g, i) in states]
+            if not recorded:
+                after = 0
+            elif states[g, recorded[-1]] == ["done"]:
+                after = recorded[-1] + 1
+            else:
+                # 最后记录的一步未完成, 之后的步骤不会执行;
+                # 或该组已回滚过, 当时可能未记录的那一步已处理并记为 undone
+                after = -1
+            for i in reversed(range(len(group))):
+                src, dst = group[i]
+                state = states.get((g, i))
+                if state is None:
+                    if i != after or lexists(src) or not lexists(dst):
+                        continue
+                    state = ["done"]
+                try:
+                    match state:
+                        case ["undone"]:
+                            continue
+                        case ["copy", tmp, *new]:
+                            # 未记录 copied, 源完好; 目标原本不存在时现有的目标才一定是副本,
+                            # 否则可能是 --force 要覆盖的文件, 保留
+                            remove_path(tmp)
+                            if new == ["new"] and lexists(src):
+                                remove_path(dst)
+                        case ["failed"] if lexists(src) or not lexists(dst):
+                            # 复制失败, 没有需要撤销的; 否则是重试成功但未记录
+                            pass
+                        case ["copied", _]:
+                            # 目标完整, 源可能已被删除一部分
+                            remove_path(src)
+                            mover.move(dst, src)
+                        case _:
+                            if undo_ready(src, dst):
+                                mover.move(dst, src)
+                except OSError as e:
+                    # 本组更早的步骤依赖这一步腾出的位置
+                    failures.append(Failure(dst, src, e, i))
+                    break
+                journal.record("undone", g, i)
+                undone += 1
+                if verbose:
+                    print(f"{quote(dst)} {ARROW} {quote(src)}")
+
+    for path in reversed(journal.plan.dirs):
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+    return Report(undone, failures)
+
+
+def print_report(report: Report) -> None:
+    """输出失败汇总, 没有失败时不输出"""
+    if not report.failures:
+        return
+    skipped = sum(failure.skipped for failure in report.failures)
+    print(f"{report.renamed} renamed, {len(report.failures)} failed, "
+          f"{skipped} skipped", file=stderr)
+    for failure in report.failures:
+        print(failure.error, file=stderr)
+        if failure.skipped:
+            print(f"  skip {failure.skipped} dependent renames after {quote(failure.src)}",
+                  file=stderr)
+
+
+def scan_files(root: str) -> Iterator[str]:
+    """递归列出 root 下的非目录项, 不跟随符号链接, 无法读取的目录报告后跳过"""
+    stack = [root]
+    while stack:
+        try:
+            with scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        yield entry.path
+        except OSError as e:
+            print(e, file=stderr)
+
+
+def read_null_paths(file: BinaryIO) -> list[str]:
+    """读取以 NUL 分隔的路径, 如 find -print0 的输出"""
+    return [fsdecode(path) for path in file.read().split(b"\0") if path]
+
+
+def regex_names(files: Iterable[str], pattern: re.Pattern[str], template: str,
+                full_path: bool = False) -> list[tuple[str, str]]:
+    """与 edit_names 相同的 (src, dst) 约定, 但以 re.sub 代替编辑器
+
+    默认只替换文件名部分, 替换结果为空时目标为空, 交由 plan_renames 报告
+    """
+    pairs = []
+    for path in files:
+        if full_path:
+            dst = pattern.sub(template, path)
+        else:
+            head, name = split(normpath(path))
+            dst = join(head, name) if (name := pattern.sub(template, name)) else ""
+        pairs.append((path, dst))
+    return pairs
+
+
+def edit_names(files: list[str], tmp: str, clear=True) -> list[tuple[str, str]]:
+    """在编辑器中修改路径, 返回与 files 一一对应的 (src, dst)"""
+    if clear:
+        with open(tmp, "w", encoding=ENCODING) as file:
+            print(*files, sep=RS, end=RS, file=file, flush=True)
+
+    if code := run([EDITOR, "--", tmp], check=False).returncode:
+        print(f"editor failed exit [code: {code}]", file=stderr)
+        exit(3)
+
+    with open(tmp, encoding=ENCODING) as file:
+        dst_files = list(map(lambda s: s.rstrip("\r\n"), file.readlines()))
+
+    if len(dst_files) != len(files):
+        inp = input(f"input {len(files)} files, "
+                    f"output {len(dst_files)} files, re edit?\n"
+                    f"enter is re edit, c is continue edit, other is exit.\n"
+                    f"> ").strip()
+        if inp not in ["", "c"]:
+            exit(4)
+        return edit_names(files, tmp, clear=inp != "c")
+
+    return list(zip(files, dst_files))
+
+
+def main() -> None:
+    verbose = dry_run = force = full_path = recursive = null = False
+    pattern: Optional[re.Pattern[str]] = None
+    template = ""
+    jobs, copy_jobs = 1, COPY_JOBS
+    journal_path: Optional[str] = None
+    action: Optional[str] = None
+
+    try:
+        opts, args = gnu_getopt(argv[1:], "hvnfe:t:FR0j:J:", longopts=[
+            "help",
+            "verbose",
+            "dry-run",
+            "force",
+            "regex=",
+            "to=",
+            "full-path",
+            "recursive",
+            "null",
+            "jobs=",
+            "journal=",
+            "resume",
+            "rollback",
+            "copy-jobs=",
+        ])
+        for opt, value in opts:
+            match opt:
+                case "-h" | "--help":
+                    print(end=HELP_MSG)
+                    exit()
+                case "-v" | "--verbose":
+                    verbose = True
+                case "-n" | "--dry-run":
+                    dry_run = True
+                case "-f" | "--force":
+                    force = True
+                case "-e" | "--regex":
+                    pattern = re.compile(value)
+                case "-t" | "--to":
+                    template = value
+                case "-F" | "--full-path":
+                    full_path = True
+                case "-R" | "--recursive":
+                    recursive = True
+                case "-0" | "--null":
+                    null = True
+                case "-j" | "--jobs":
+                    jobs = int(value)
+                    if jobs < 1:
+                        raise ValueError(f"jobs must be positive: {jobs}")
+                case "--copy-jobs":
+                    copy_jobs = int(value)
+                    if copy_jobs < 1:
+                        raise ValueError(f"copy jobs must be positive: {copy_jobs}")
+                case "-J" | "--journal":
+                    journal_path = value
+                case "--resume" | "--rollback":
+                    action = opt[2:]
+    except (GetoptError, re.error, ValueError) as e:
+        print(f"ParseArg: {e}", file=stderr)
+        exit(2)
+
+    if action is not None:
+        if journal_path is None or args or dry_run:
+            print(f"ParseArg: --{action} need --journal, and no FILE or --dry-run",
+                  file=stderr)
+            exit(2)
+        try:
+            journal = Journal.load(journal_path)
+        except (OSError, ValueError) as e:
+            print(e, file=stderr)
+            exit(2)
+        try:
+            if action == "resume":
+                report = apply_plan(journal.plan, verbose, jobs, isatty(2), journal, copy_jobs)
+            else:
+                report = rollback(journal, verbose, copy_jobs)
+        finally:
+            journal.close()
+        print_report(report)
+        exit(1 if report.failures else 0)
+
+    if journal_path is not None and lexists(journal_path):
+        print(f"ParseArg: journal {quote(journal_path)} exists, "
+              f"use --resume or --rollback", file=stderr)
+        exit(2)
+    if null and pattern is None:
+        print("ParseArg: --null need --regex, stdin is used by paths", file=stderr)
+        exit(2)
+    if null:
+        args += read_null_paths(stdin.buffer)
+    if not args:
+        print("ParseArg: FILE count by zero", file=stderr)
+        exit(2)
+    if recursive:
+        args = [path for arg in args
+                for path in (scan_files(arg) if isdir(arg) else [arg])]
+
+    if pattern is not None:
+        try:
+            pairs = regex_names(args, pattern, template, full_path)
+        except re.error as e:
+            print(f"ParseArg: {e}", file=stderr)
+            exit(2)
+        try:
+            plan = plan_renames(pairs, force)
+        except ValueError as e:
+            print(e, file=stderr)
+            exit(5)
+    else:
+        _, tmp = mkstemp(prefix="editor-mv.")
+        try:
+            clear = True
+            while True:
+                pairs = edit_names(args, tmp, clear)
+                try:
+                    plan = plan_renames(pairs, force)
+                    break
+                except ValueError as e:
+                    print(e, file=stderr)
+                    if input("enter is re edit, other is exit.\n> ").strip():
+                        exit(5)
+                    clear = False
+        finally:
+            remove(tmp)
+
+    if dry_run:
+        print_plan(plan)
+        exit()
+    journal = Journal.create(journal_path, plan) if journal_path is not None else None
+    try:
+        report = apply_plan(plan, verbose, jobs, pattern is not None and isatty(2),
+                            journal, copy_jobs)
+    finally:
+        if journal is not None:
+            journal.close()
+    print_report(report)
+    exit(1 if report.failures else 0)
+
+
+if __name__ == "__main__":
+    main()
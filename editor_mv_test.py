@@ -0,0 +1,325 @@
+#!/usr/bin/python3
+# -*- coding: utf-8; -*-
+"""test file"""
+
+import io
+import os
+import random
+import re
+from errno import ENOSPC, EXDEV
+
+import pytest
+
+import editor_mv
+from editor_mv import (Journal, apply_plan, plan_renames, print_plan, read_null_paths,
+                       regex_names, rollback, scan_files)
+
+
+def make_files(root, names: list[str]) -> None:
+    for name in names:
+        (root / name).write_text(name)
+
+
+def contents(root) -> dict[str, str]:
+    return {path.name: path.read_text() for path in root.iterdir()}
+
+
+@pytest.mark.parametrize("pairs, expected", [
+    ([("a", "b"), ("b", "a")], {"a": "b", "b": "a"}),
+    ([("a", "b"), ("b", "c"), ("c", "a")], {"b": "a", "c": "b", "a": "c"}),
+    ([("a", "b"), ("b", "c"), ("c", "d")], {"b": "a", "c": "b", "d": "c"}),
+    ([("c", "d"), ("x", "x"), ("a", "b"), ("b", "c")], {"b": "a", "c": "b", "d": "c", "x": "x"}),
+])
+def test_apply(tmp_path, monkeypatch, pairs, expected):
+    make_files(tmp_path, sorted({src for src, _ in pairs}))
+    monkeypatch.chdir(tmp_path)
+    assert apply_plan(plan_renames(pairs)).failures == []
+    assert contents(tmp_path) == expected
+
+
+def test_dirs_and_dry_run(tmp_path, monkeypatch, capsys):
+    make_files(tmp_path, ["a", "b"])
+    monkeypatch.chdir(tmp_path)
+    plan = plan_renames([("a", "x/y/a"), ("b", "x/b")])
+    assert plan.dirs == ["x/y", "x"]
+    print_plan(plan)
+    assert capsys.readouterr().out == \
+        "mkdir -p -- x/y\nmkdir -p -- x\nmv -- a x/y/a\nmv -- b x/b\n"
+    assert contents(tmp_path) == {"a": "a", "b": "b"}
+    assert apply_plan(plan).renamed == 2
+    assert (tmp_path / "x" / "y" / "a").read_text() == "a"
+
+
+@pytest.mark.parametrize("pairs", [
+    [("a", "c"), ("b", "c")],
+    [("a", "b")],
+    [("a", "")],
+    [("a", "x"), ("a", "y")],
+    [("missing", "x")],
+])
+def test_conflicts(tmp_path, monkeypatch, pairs):
+    make_files(tmp_path, ["a", "b"])
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ValueError):
+        plan_renames(pairs)
+    assert contents(tmp_path) == {"a": "a", "b": "b"}
+
+
+def test_force(tmp_path, monkeypatch):
+    make_files(tmp_path, ["a", "b"])
+    monkeypatch.chdir(tmp_path)
+    assert apply_plan(plan_renames([("a", "b")], force=True)).failures == []
+    assert contents(tmp_path) == {"b": "a"}
+
+
+def test_permutation(tmp_path, monkeypatch):
+    names = [str(i) for i in range(300)]
+    make_files(tmp_path, names)
+    monkeypatch.chdir(tmp_path)
+    targets = names[:]
+    random.Random(0).shuffle(targets)
+    targets[:10] = [f"new{i}" for i in range(10)]
+    plan = plan_renames(zip(names, targets))
+    assert sum(map(len, plan.groups)) <= len(names) + len(plan.groups)
+    assert apply_plan(plan).renamed == sum(map(len, plan.groups))
+    assert contents(tmp_path) == dict(zip(targets, names))
+
+
+def test_regex_names():
+    pattern = re.compile(r"(\w+)\.jpeg$")
+    files = ["d.jpeg/a.jpeg", "b.txt", "c.jpeg"]
+    assert regex_names(files, pattern, r"\1.jpg") == \
+        [("d.jpeg/a.jpeg", "d.jpeg/a.jpg"), ("b.txt", "b.txt"), ("c.jpeg", "c.jpg")]
+    assert regex_names(["d/a.jpeg"], re.compile("jpeg"), "jpg", full_path=True) == \
+        [("d/a.jpeg", "d/a.jpg")]
+    assert regex_names(["d/a"], re.compile("a"), "") == [("d/a", "")]
+
+
+def test_batch(tmp_path, monkeypatch):
+    for i in range(20):
+        (tmp_path / f"d{i % 4}" / "sub").mkdir(parents=True, exist_ok=True)
+        (tmp_path / f"d{i % 4}" / "sub" / f"{i}.txt").write_text(str(i))
+    monkeypatch.chdir(tmp_path)
+    files = sorted(scan_files("."))
+    assert len(files) == 20
+    assert read_null_paths(io.BytesIO("\0".join(files).encode() + b"\0")) == files
+
+    # d0 中 0.txt -> 4.txt -> ... -> 20.txt 是一条链, 多线程时依然不能覆盖
+    pairs = regex_names(files, re.compile(r"^(\d+)"), r"x\1")
+    pairs = [(src, re.sub(r"\d+(?=\.txt)", lambda m: str(int(m[0]) + 4), src) if "d0" in src else dst)
+             for src, dst in pairs]
+    report = apply_plan(plan_renames(pairs), jobs=4)
+    assert report == (20, [])
+    assert sorted(p.name for p in (tmp_path / "d0" / "sub").iterdir()) == \
+        ["12.txt", "16.txt", "20.txt", "4.txt", "8.txt"]
+    assert (tmp_path / "d0" / "sub" / "20.txt").read_text() == "16"
+    assert (tmp_path / "d1" / "sub" / "x5.txt").read_text() == "5"
+
+
+def test_failure_report(tmp_path, monkeypatch):
+    make_files(tmp_path, ["a", "b", "c"])
+    monkeypatch.chdir(tmp_path)
+    plan = plan_renames([("a", "b"), ("b", "c"), ("c", "d")])
+    (tmp_path / "c").unlink()
+    report = apply_plan(plan)
+    assert report.renamed == 0
+    assert [(f.src, f.dst, f.skipped) for f in report.failures] == [("c", "d", 2)]
+    assert contents(tmp_path) == {"a": "a", "b": "b"}
+
+
+@pytest.fixture(name="devices")
+def fixture_devices(tmp_path, monkeypatch):
+    """dev1 与 dev2 之间的 rename 模拟为跨文件系统"""
+    real_replace = os.replace
+
+    def device(path) -> str:
+        return os.path.relpath(path, tmp_path).split("/")[0]
+
+    def replace(src, dst):
+        if device(src) != device(dst):
+            raise OSError(EXDEV, os.strerror(EXDEV), src, dst)
+        real_replace(src, dst)
+
+    monkeypatch.setattr(editor_mv, "replace", replace)
+    monkeypatch.setattr(editor_mv, "LARGE_FILE", 1000)
+    monkeypatch.setattr(editor_mv, "RANGE_SIZE", 300)
+    monkeypatch.chdir(tmp_path)
+    for name in ["dev1/d/sub", "dev2"]:
+        os.makedirs(name)
+    data = random.Random(0).randbytes(5000)
+    (tmp_path / "dev1" / "big").write_bytes(data)
+    (tmp_path / "dev1" / "small").write_text("small")
+    (tmp_path / "dev1" / "d" / "sub" / "f").write_bytes(data)
+    os.symlink("small", "dev1/link")
+    os.chmod("dev1/big", 0o640)
+    return data
+
+
+def test_cross_device(tmp_path, devices):
+    plan = plan_renames([(f"dev1/{name}", f"dev2/{name}") for name in ["big", "small", "d", "link"]])
+    assert apply_plan(plan, copy_jobs=3) == (4, [])
+    assert sorted(os.listdir("dev1")) == []
+    assert (tmp_path / "dev2" / "big").read_bytes() == devices
+    assert os.stat("dev2/big").st_mode & 0o777 == 0o640
+    assert (tmp_path / "dev2" / "d" / "sub" / "f").read_bytes() == devices
+    assert os.readlink("dev2/link") == "small"
+    assert [name for name in os.listdir("dev2") if name.startswith(".tmp")] == []
+
+
+def test_resume_and_rollback(tmp_path, devices, monkeypatch):
+    pairs = [("dev1/big", "dev2/big"), ("dev1/small", "dev1/s"), ("dev1/d", "dev2/new/d")]
+    plan = plan_renames(pairs)
+    journal = Journal.create("journal", plan)
+    calls = 0
+    real_copy_file = editor_mv.Mover.copy_file
+
+    def interrupt(self, src, dst):
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise KeyboardInterrupt
+        return real_copy_file(self, src, dst)
+
+    monkeypatch.setattr(editor_mv.Mover, "copy_file", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        apply_plan(plan, journal=journal)
+    journal.close()
+    monkeypatch.setattr(editor_mv.Mover, "copy_file", real_copy_file)
+    assert os.path.exists("dev2/big") and os.path.exists("dev1/d/sub/f")
+
+    # 再次继续: 已完成的步骤跳过
+    journal = Journal.load("journal")
+    assert journal.plan == plan
+    assert apply_plan(plan, journal=journal).renamed == 1
+    journal.close()
+    assert sorted(os.listdir("dev1")) == ["link", "s"]
+    assert (tmp_path / "dev2" / "new" / "d" / "sub" / "f").read_bytes() == devices
+
+    journal = Journal.load("journal")
+    assert rollback(journal) == (3, [])
+    journal.close()
+    assert sorted(os.listdir("dev1")) == ["big", "d", "link", "small"]
+    assert sorted(os.listdir("dev2")) == []
+    assert (tmp_path / "dev1" / "big").read_bytes() == devices
+    journal = Journal.load("journal")
+    assert rollback(journal) == (0, [])
+    journal.close()
+
+
+def crash_before_record(monkeypatch, status: str, step: tuple[int, int]) -> None:
+    """操作已完成但在写入日志前中断"""
+    real_record = Journal.record
+
+    def record(self, status_, g, i, *args):
+        if (status_, (g, i)) == (status, step):
+            raise KeyboardInterrupt
+        real_record(self, status_, g, i, *args)
+
+    monkeypatch.setattr(Journal, "record", record)
+
+
+def run_interrupted(plan, monkeypatch, status: str, step: tuple[int, int]) -> None:
+    journal = Journal.create("journal", plan)
+    with monkeypatch.context() as patch:
+        crash_before_record(patch, status, step)
+        with pytest.raises(KeyboardInterrupt):
+            apply_plan(plan, journal=journal)
+    journal.close()
+
+
+def test_rollback_unrecorded_step(tmp_path, monkeypatch):
+    make_files(tmp_path, ["a", "b"])
+    monkeypatch.chdir(tmp_path)
+    plan = plan_renames([("a", "b"), ("b", "a")])
+    # a -> tmp, b -> a, tmp -> b; b -> a 完成后中断
+    run_interrupted(plan, monkeypatch, "done", (0, 1))
+    journal = Journal.load("journal")
+    assert rollback(journal).failures == []
+    journal.close()
+    assert contents(tmp_path) == {"a": "a", "b": "b", "journal": (tmp_path / "journal").read_text()}
+    journal = Journal.load("journal")
+    assert rollback(journal) == (0, [])
+    journal.close()
+
+
+def test_rollback_never_overwrites(tmp_path, monkeypatch):
+    make_files(tmp_path, ["a"])
+    monkeypatch.chdir(tmp_path)
+    plan = plan_renames([("a", "b")])
+    journal = Journal.create("journal", plan)
+    assert apply_plan(plan, journal=journal).renamed == 1
+    journal.close()
+    (tmp_path / "a").write_text("new")
+    journal = Journal.load("journal")
+    [failure] = rollback(journal).failures
+    journal.close()
+    assert isinstance(failure.error, FileExistsError)
+    assert (tmp_path / "a").read_text() == "new" and (tmp_path / "b").read_text() == "a"
+
+
+def test_resume_unrecorded_step(tmp_path, monkeypatch):
+    make_files(tmp_path, ["a", "b", "c"])
+    monkeypatch.chdir(tmp_path)
+    plan = plan_renames([("a", "b"), ("b", "c"), ("c", "d")])
+    # 执行顺序 c -> d, b -> c, a -> b; b -> c 完成后中断
+    run_interrupted(plan, monkeypatch, "done", (0, 1))
+    journal = Journal.load("journal")
+    assert apply_plan(plan, journal=journal) == (1, [])
+    journal.close()
+    assert {name: text for name, text in contents(tmp_path).items() if name != "journal"} == \
+        {"b": "a", "c": "b", "d": "c"}
+
+
+@pytest.mark.parametrize("action", ["resume", "rollback"])
+def test_interrupted_copy(tmp_path, devices, monkeypatch, action):
+    plan = plan_renames([("dev1/big", "dev2/big")])
+    # 副本已替换到目标, 记录 copied 前中断
+    run_interrupted(plan, monkeypatch, "copied", (0, 0))
+    assert os.path.exists("dev1/big") and os.path.exists("dev2/big")
+    journal = Journal.load("journal")
+    if action == "resume":
+        assert apply_plan(plan, journal=journal) == (1, [])
+        assert sorted(os.listdir("dev2")) == ["big"]
+    else:
+        assert rollback(journal) == (1, [])
+        assert os.listdir("dev2") == []
+    journal.close()
+    assert [name for name in os.listdir("dev1") if "big" in name] == \
+        (["big"] if action == "rollback" else [])
+    assert (tmp_path / ("dev1" if action == "rollback" else "dev2") / "big").read_bytes() == devices
+
+
+@pytest.mark.parametrize("action", ["resume", "rollback"])
+@pytest.mark.parametrize("crash", ["failed", "interrupted"])
+def test_forced_copy_not_completed(tmp_path, devices, monkeypatch, action, crash):
+    (tmp_path / "dev2" / "big").write_text("old")
+    plan = plan_renames([("dev1/big", "dev2/big")], force=True)
+    if crash == "failed":
+        # 复制失败, 目标是原有文件而不是副本
+        def copy_file(self, src, dst):
+            raise OSError(ENOSPC, os.strerror(ENOSPC), dst)
+
+        journal = Journal.create("journal", plan)
+        with monkeypatch.context() as patch:
+            patch.setattr(editor_mv.Mover, "copy_file", copy_file)
+            [failure] = apply_plan(plan, journal=journal).failures
+        journal.close()
+        assert failure.error.errno == ENOSPC
+        assert (tmp_path / "dev2" / "big").read_text() == "old"
+    else:
+        # 副本已替换到目标, 记录 copied 前中断, 无法区分目标是否为副本
+        run_interrupted(plan, monkeypatch, "copied", (0, 0))
+
+    journal = Journal.load("journal")
+    if action == "resume":
+        assert apply_plan(plan, journal=journal) == (1, [])
+        assert not os.path.exists("dev1/big")
+        assert (tmp_path / "dev2" / "big").read_bytes() == devices
+    else:
+        assert rollback(journal).failures == []
+        assert (tmp_path / "dev1" / "big").read_bytes() == devices
+        assert os.path.exists("dev2/big")
+        if crash == "failed":
+            assert (tmp_path / "dev2" / "big").read_text() == "old"
+    journal.close()
+    assert [name for name in os.listdir("dev2") if name.startswith(".tmp")] == []
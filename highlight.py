@@ -4,29 +4,55 @@
 随便写的, 类型检查都没开就别管那么多了
 """
 
+import os
+import sys
+import json
+import pickle
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache, cached_property
+from getopt import gnu_getopt, GetoptError
+from hashlib import sha256
+from tempfile import mkstemp
+
+import regex
 from regex import match
 
 
 class ColorStr:
+    """输出缓冲, 以片段列表收集输出, 读取 s 时才拼接"""
     def __init__(self):
-        self.s = ""
+        self.parts: list[str] = []
         self.colors = [0]
 
+    @property
+    def s(self) -> str:
+        if len(self.parts) > 1:
+            self.parts[:] = ["".join(self.parts)]
+        return self.parts[0] if self.parts else ""
+
+    def take(self) -> str:
+        """取出目前为止的输出并清空, 颜色栈保持不变"""
+        s = "".join(self.parts)
+        self.parts.clear()
+        return s
+
     def enter(self, color: int) -> None:
         self.colors.append(color)
         if color >= 0:
-            self.s += f"\x1b[{color}m"
+            self.parts.append(f"\x1b[{color}m")
 
     def exit(self) -> int:
         poped = self.colors.pop()
         for i in range(len(self.colors)-1, -1, -1):
             if self.colors[i] >= 0:
                 color = self.colors
-        self.s += f"\x1b[{self.colors[-1]}m"
+        self.parts.append(f"\x1b[{self.colors[-1]}m")
         return poped
 
     def add(self, s: str):
-        self.s += s
+        self.parts.append(s)
 
     def word(self, color: int, s: str):
         self.enter(color)
@@ -45,11 +71,18 @@ class MatchPat(Pat):
         self.pat = pat
         self.color = color
 
+    @property
+    def head(self):
+        return self.pat
+
     def run(self, s, ctx: "Ctx"):
         if res := match(self.pat, s):
             ctx.word_to(self.color, res.span()[1])
             return True
 
+    def apply(self, ctx, res):
+        ctx.word_until(self.color, res.end())
+
     def __repr__(self):
         return f"MatchPat({self.pat!r}, {self.color})"
 
@@ -69,16 +102,56 @@ class RegionPat(Pat):
             ctx.word_to(self.color, res.span()[1])
             return True
 
+    @property
+    def head(self):
+        return self.start
+
+    @cached_property
+    def dispatch_src(self):
+        """内部 Env 的分派正则源码, 之后不要再修改 contains"""
+        return dispatch_source(self.contains, self.end)
+
+    @cached_property
+    def dispatch(self):
+        """首次进入区域时才编译分派正则"""
+        return None if self.dispatch_src is None \
+                else _compile(self.dispatch_src)
+
+    def __getstate__(self):
+        # 编译后的正则 pickle 后仍要重新编译, 不如只保存源码
+        state = self.__dict__.copy()
+        state.pop("dispatch", None)
+        return state
+
+    def new_env(self, parent: "State" = ()) -> "Env":
+        return Env(self.contains, color=self.color, end=self.end,
+                   dispatch=self.dispatch, state=(parent, self))
+
+    def apply(self, ctx, res):
+        ctx.envs.append(self.new_env(ctx.envs[-1].state))
+        ctx.out.enter(self.color)
+
+        ctx.word_until(self.color, res.end())
+
     def __repr__(self):
         return f"RegionPat({self.start!r}, {self.end!r}, " \
                 f"+{len(self.contains)})"
 
 
 class Env:
-    def __init__(self, pats: list[Pat], color=-1, end=None):
+    def __init__(self, pats: list[Pat], color=-1, end=None, dispatch=None,
+                 state: "State" = ()):
         self.end = end
         self.pats = pats
         self.color = color
+        self.state = state
+        self._dispatch = dispatch
+
+    @property
+    def dispatch(self):
+        if self._dispatch is None:
+            self._dispatch = build_dispatch(self.pats, self.end)
+        return self._dispatch
 
     def __repr__(self):
         return f"Env({self.pats}, end={self.end})"
@@ -105,8 +178,7 @@ class Ctx:
             if pat.run(self.s, self):
                 return True
 
-        if (end := self.envs[-1].end) and end is not None \
-                and (res := match(end, self.s)):
+        if (end := self.envs[-1].end) and (res := match(end, self.s)):
             last = self.envs.pop()
             self.out.exit()
             self.word_to(last.color, res.span()[1])
@@ -117,11 +189,320 @@ class Ctx:
         return bool(self.s)
 
 
-def mini_test():
-    src = r'"abc\ndef" to "abcdef" to "abc\"d\\e\\\\f\\\g" end' "\n"\
-            r'(0) 0 (0(0)0)0 {0}0 {0{0}0}0 {0(0)0}0 {0(0(0)0)0}0' "\n"\
-            r'{"nohi"0("hi"0{"nohi"0}"hi"0)"nohi"0}0' "\n"
+@cache
+def _compile(pat: str):
+    return regex.compile(pat)
+
+
+END_GROUP = "end"
+
+
+def dispatch_source(pats: list[Pat], end=None) -> str | None:
+    """将各规则与结束正则拼接为一个具名分组的选择分支
+
+    分支顺序即声明顺序, 结束正则在最后, 所以同一位置的优先级与 Ctx.do 一致.
+    与 Ctx.do 相同, 空的结束正则视为没有结束.
+    规则中不要使用编号反向引用, 拼接后编号会偏移
+    """
+    alts = [f"(?P<p{i}>{pat.head})" for i, pat in enumerate(pats)]
+    if end:
+        alts.append(f"(?P<{END_GROUP}>{end})")
+    return "|".join(alts) if alts else None
+
+
+def build_dispatch(pats: list[Pat], end=None):
+    src = dispatch_source(pats, end)
+    return None if src is None else _compile(src)
+
 
+class PosCtx:
+    """与 Ctx 输出一致, 但只在原字符串上移动下标, 整体为线性时间
+
+    注意: 匹配在原字符串上进行, 所以 `^` 与后视断言能看到前文,
+    这点与每次切片后匹配的 Ctx 不同
+    """
+    def __init__(self, s, pats: list[Pat]):
+        self.text = s
+        self.pos = 0
+        self.out = ColorStr()
+        self.envs = [Env(pats, color=0)]
+
+    @property
+    def s(self) -> str:
+        """剩余未处理的输入"""
+        return self.text[self.pos:]
+
+    def word_until(self, color: int, end: int) -> None:
+        self.out.word(color, self.text[self.pos:end])
+        self.pos = end
+
+    def do(self) -> bool:
+        text, pos = self.text, self.pos
+        env = self.envs[-1]
+        if (dispatch := env.dispatch) is None \
+                or (res := dispatch.search(text, pos)) is None:
+            # 之后没有任何规则会匹配
+            self.out.add(text[pos:])
+            self.pos = len(text)
+            return False
+
+        if (start := res.start()) != pos:
+            # 整段跳过中间的普通文本
+            self.out.add(text[pos:start])
+            self.pos = start
+
+        if (name := res.lastgroup) == END_GROUP:
+            last = self.envs.pop()
+            self.out.exit()
+            self.word_until(last.color, res.end())
+        else:
+            env.pats[int(name[1:])].apply(self, res)
+        return True
+
+    def run(self) -> str:
+        while self.do(): pass
+        return self.out.s
+
+    def state(self) -> "State":
+        """当前 envs 栈的快照, 可哈希, 可交给 restore 恢复"""
+        return self.envs[-1].state
+
+    def restore(self, state: "State") -> None:
+        regions = state_regions(state)
+        del self.envs[1:]
+        for region in regions:
+            self.envs.append(region.new_env(self.envs[-1].state))
+        self.out.colors[1:] = [region.color for region in regions]
+
+    def feed(self, text: str) -> str:
+        """以当前状态接着处理新的一段输入, 返回这一段的输出"""
+        self.text, self.pos = text, 0
+        self.run()
+        return self.out.take()
+
+    def skip(self, text: str) -> None:
+        """只推进 envs 栈而不产生输出, 用于预扫描"""
+        envs, pos = self.envs, 0
+        while (dispatch := envs[-1].dispatch) is not None \
+                and (res := dispatch.search(text, pos)) is not None:
+            if (name := res.lastgroup) == END_GROUP:
+                envs.pop()
+            elif isinstance(pat := envs[-1].pats[int(name[1:])], RegionPat):
+                envs.append(pat.new_env(envs[-1].state))
+            pos = res.end()
+
+
+# 嵌套的 (外层状态, 开启区域的规则), 顶层为 (), 入栈时构建, 取快照为 O(1)
+State = tuple
+
+
+def state_regions(state: State) -> list[RegionPat]:
+    """将状态展开为由外到内的区域规则列表"""
+    regions = []
+    while state:
+        state, region = state
+        regions.append(region)
+    regions.reverse()
+    return regions
+
+
+def split_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """将任意切分的输入重新按换行符切分为行, 行尾保留换行符"""
+    pending: list[str] = []
+    for chunk in chunks:
+        if (cut := chunk.rfind("\n") + 1) == 0:
+            pending.append(chunk)
+            continue
+        pending.append(chunk[:cut])
+        lines = "".join(pending).split("\n")
+        lines.pop()
+        for line in lines:
+            yield line + "\n"
+        pending = [chunk[cut:]]
+    if rest := "".join(pending):
+        yield rest
+
+
+def highlight_lines(
+        lines: Iterable[str],
+        pats: list[Pat],
+        state: State = (),
+        ) -> Iterator[tuple[State, str]]:
+    """逐行高亮, 产出 (行首状态, 该行输出)
+
+    envs 栈跨行保留, 行首状态可用于之后从此处重新开始高亮.
+    以行为单位匹配, 所以规则不能跨行匹配
+    """
+    ctx = PosCtx("", pats)
+    ctx.restore(state)
+    for line in lines:
+        state = ctx.state()
+        yield state, ctx.feed(line)
+
+
+def highlight_stream(
+        chunks: Iterable[str],
+        pats: list[Pat],
+        state: State = (),
+        ) -> Iterator[str]:
+    """流式高亮任意切分的输入, 每读完一行就产出该行的输出"""
+    for _, out in highlight_lines(split_lines(chunks), pats, state):
+        yield out
+
+
+ENCODING = "utf-8"
+ERRORS = "surrogateescape"
+CHUNK_SIZE = 4 << 20
+
+
+def scan_chunks(
+        path: str,
+        pats: list[Pat],
+        chunk_size: int = CHUNK_SIZE,
+        ) -> Iterator[tuple[int, int, list[RegionPat]]]:
+    """预扫描文件, 在行边界处切块, 产出 (起始偏移, 结束偏移, 块首区域列表)
+
+    只推进 envs 栈不产生输出, 所以各块从准确的状态开始高亮.
+    状态以展开的列表给出, 以免嵌套很深时 pickle 递归过深
+    """
+    ctx = PosCtx("", pats)
+    start = offset = 0
+    regions = []
+    with open(path, "rb") as file:
+        for line in file:
+            ctx.skip(line.decode(ENCODING, ERRORS))
+            offset += len(line)
+            if offset - start >= chunk_size:
+                yield start, offset, regions
+                start, regions = offset, state_regions(ctx.state())
+    if offset != start:
+        yield start, offset, regions
+
+
+def highlight_chunk(
+        path: str,
+        start: int,
+        end: int,
+        pats: list[Pat],
+        regions: list[RegionPat],
+        ) -> bytes:
+    """从块首状态开始高亮文件的一个块"""
+    state: State = ()
+    for region in regions:
+        state = (state, region)
+    with open(path, "rb") as file:
+        file.seek(start)
+        text = file.read(end - start).decode(ENCODING, ERRORS)
+    return "".join(highlight_stream((text,), pats, state)) \
+            .encode(ENCODING, ERRORS)
+
+
+def highlight_file_parallel(
+        path: str,
+        pats: list[Pat],
+        jobs: int,
+        chunk_size: int = CHUNK_SIZE,
+        ) -> Iterator[bytes]:
+    """多进程分块高亮文件, 按原顺序产出各块的输出
+
+    同时在途的块数量有上限, 所以内存占用与文件大小无关
+    """
+    with ProcessPoolExecutor(jobs) as pool:
+        pending = deque()
+        for start, end, regions in scan_chunks(path, pats, chunk_size):
+            if len(pending) >= jobs * 2:
+                yield pending.popleft().result()
+            pending.append(pool.submit(
+                highlight_chunk, path, start, end, pats, regions))
+        while pending:
+            yield pending.popleft().result()
+
+
+CACHE_VERSION = 1
+CACHE_DIR = os.path.join(
+        os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+        "highlight")
+
+
+def compile_syntax(data: dict) -> list[Pat]:
+    r"""将声明式的语法定义编译为顶层规则列表
+
+    规则以名字互相引用, 所以可以交叉递归, 例如 mini_test 的规则:
+    ```json
+    {
+        "main": ["str", "brace"],
+        "rules": {
+            "paren": {"start": "\\(", "end": "\\)", "color": 33,
+                      "contains": ["brace", "paren", "str"]},
+            "brace": {"start": "\\{", "end": "\\}", "color": 94,
+                      "contains": ["brace", "paren"]},
+            "str": {"start": "\"", "end": "\"", "color": 31,
+                    "contains": ["escape"]},
+            "escape": {"match": "\\\\.", "color": 32}
+        }
+    }
+    ```
+    """
+    rules: dict[str, Pat] = {}
+    for name, rule in data["rules"].items():
+        color = rule.get("color", -1)
+        if "match" in rule:
+            rules[name] = MatchPat(rule["match"], color)
+        else:
+            rules[name] = RegionPat(rule["start"], rule["end"], color)
+
+    def resolve(names: list[str]) -> list[Pat]:
+        try:
+            return [rules[name] for name in names]
+        except KeyError as e:
+            raise ValueError(f"unknown rule {e.args[0]!r}") from None
+
+    for name, rule in data["rules"].items():
+        if isinstance(pat := rules[name], RegionPat):
+            pat.contains = resolve(rule.get("contains", []))
+    pats = resolve(data["main"])
+
+    # 检查正则并预先拼好各区域的分派正则, 以便一并缓存
+    for pat in rules.values():
+        _compile(pat.head)
+        if isinstance(pat, RegionPat):
+            _compile(pat.end)
+            pat.dispatch_src
+    return pats
+
+
+def load_syntax(path: str, cache_dir: str | None = CACHE_DIR) -> list[Pat]:
+    """读取语法定义文件, 编译结果以文件内容的哈希为键缓存于 cache_dir
+
+    命中缓存时只需一次反序列化, 各分派正则在首次使用时才编译
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    if cache_dir is None:
+        return compile_syntax(json.loads(data))
+
+    key = sha256(data).hexdigest()
+    cache_path = os.path.join(cache_dir, f"{key}.v{CACHE_VERSION}.pickle")
+    try:
+        with open(cache_path, "rb") as file:
+            return pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+
+    pats = compile_syntax(json.loads(data))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp = mkstemp(dir=cache_dir, prefix=".tmp.")
+        with os.fdopen(fd, "wb") as file:
+            pickle.dump(pats, file)
+        os.replace(tmp, cache_path)
+    except OSError as e:
+        print(f"highlight: write cache failed: {e}", file=sys.stderr)
+    return pats
+
+
+def demo_pats() -> list[Pat]:
+    """mini_test 中使用的规则"""
     paren_pat = RegionPat(r'\(', r'\)', color=33)
     brace_pat = RegionPat(r'\{', r'\}', color=94)
     str_pat = RegionPat('"', '"', color=31, contains=[
@@ -133,10 +514,20 @@ def mini_test():
     # 在顶层高亮字符串和花括号
     # 在花括号内可以存在圆括号和花括号
     # 在圆括号内可以存在字符串圆括号和花括号
-    pats = [
+    return [
             str_pat,
             brace_pat]
 
+
+def mini_test():
+    src = r'"abc\ndef" to "abcdef" to "abc\"d\\e\\\\f\\\g" end' "\n"\
+            r'(0) 0 (0(0)0)0 {0}0 {0{0}0}0 {0(0)0}0 {0(0(0)0)0}0' "\n"\
+            r'{"nohi"0("hi"0{"nohi"0}"hi"0)"nohi"0}0' "\n"
+
+    pats = demo_pats()
+    str_pat, brace_pat = pats
+    paren_pat = brace_pat.contains[1]
+
     print(f"{pats=}")
     print(f"{str_pat=}")
     print(f"{brace_pat=}")
@@ -144,6 +535,8 @@ def mini_test():
 
     ctx = Ctx(src, pats)
     while ctx.do(): pass
+    assert PosCtx(src, pats).run() == ctx.out.s
+    assert "".join(highlight_stream(src, pats)) == ctx.out.s
     print(ctx.s, "\x1b[0m")
     print(ctx.out.s, "\x1b[0m")
     print(f"{ctx.envs=}")
@@ -153,5 +546,75 @@ def mini_test():
         print("  env_pats:", env.pats)
 
 
+HELP_MSG = f"""\
+Usage: {sys.argv[0]} [Options] [FILE]
+Highlight FILE (or stdin) with the mini_test rules
+
+Options:
+    -s, --syntax=<F>    load rules from syntax definition file F (json)
+    -n, --no-cache      do not use the compiled syntax cache
+    -j, --jobs=<N>      highlight chunks of FILE in N processes
+    -c, --chunk=<N>     chunk size in bytes for --jobs, default {CHUNK_SIZE}
+    -t, --test          run mini_test
+    -h, --help          show this help
+"""
+
+
+def main() -> None:
+    try:
+        opts, args = gnu_getopt(sys.argv[1:], "s:nj:c:th", longopts=[
+            "syntax=",
+            "no-cache",
+            "jobs=",
+            "chunk=",
+            "test",
+            "help",
+        ])
+    except GetoptError as e:
+        print(f"ParseArg: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    jobs, chunk_size = 1, CHUNK_SIZE
+    syntax, cache_dir = None, CACHE_DIR
+    for opt, value in opts:
+        match opt:
+            case "-h" | "--help":
+                print(end=HELP_MSG)
+                sys.exit()
+            case "-t" | "--test":
+                mini_test()
+                sys.exit()
+            case "-s" | "--syntax":
+                syntax = value
+            case "-n" | "--no-cache":
+                cache_dir = None
+            case "-j" | "--jobs":
+                jobs = int(value)
+            case "-c" | "--chunk":
+                chunk_size = int(value)
+
+    if len(args) > 1:
+        print(f"ParseArg: too many FILE ({args!r})", file=sys.stderr)
+        sys.exit(2)
+    path = args[0] if args else "-"
+    pats = demo_pats() if syntax is None else load_syntax(syntax, cache_dir)
+    out = sys.stdout.buffer
+
+    if jobs > 1 and path != "-":
+        for data in highlight_file_parallel(path, pats, jobs, chunk_size):
+            out.write(data)
+        out.flush()
+        return
+
+    file = sys.stdin.buffer if path == "-" else open(path, "rb")
+    with file:
+        lines = (line.decode(ENCODING, ERRORS) for line in file)
+        for _, line in highlight_lines(lines, pats):
+            out.write(line.encode(ENCODING, ERRORS))
+            if path == "-":
+                out.flush()
+    out.flush()
+
+
 if __name__ == '__main__':
-    mini_test()
+    main()
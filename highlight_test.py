@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+# -*- coding: utf-8; -*-
+"""test file"""
+
+import json
+import random
+
+import pytest
+
+import highlight
+from highlight import (
+        Ctx, MatchPat, PosCtx, RegionPat, compile_syntax, demo_pats,
+        highlight_file_parallel, highlight_lines, highlight_stream,
+        load_syntax, scan_chunks, state_regions)
+
+# 与 demo_pats 相同的规则
+SYNTAX = {
+        "main": ["str", "brace"],
+        "rules": {
+            "paren": {"start": r"\(", "end": r"\)", "color": 33,
+                      "contains": ["brace", "paren", "str"]},
+            "brace": {"start": r"\{", "end": r"\}", "color": 94,
+                      "contains": ["brace", "paren"]},
+            "str": {"start": "\"", "end": "\"", "color": 31,
+                    "contains": ["escape"]},
+            "escape": {"match": r"\\.", "color": 32},
+        },
+}
+ALPHABET = '"(){}\\0a \n'
+
+
+def reference(src: str, pats) -> str:
+    ctx = Ctx(src, pats)
+    while ctx.do(): pass
+    return ctx.out.s
+
+
+def random_source(rand: random.Random, size: int = 200) -> str:
+    return "".join(rand.choices(ALPHABET, k=rand.randint(0, size)))
+
+
+def random_chunks(rand: random.Random, src: str) -> list[str]:
+    cuts = sorted(rand.sample(range(len(src) + 1), min(len(src) + 1, 5)))
+    return [src[i:j] for i, j in zip([0, *cuts], [*cuts, len(src)])]
+
+
+def test_matches_ctx():
+    rand = random.Random(0)
+    for _ in range(500):
+        pats = demo_pats()
+        src = random_source(rand)
+        expected = reference(src, pats)
+        assert PosCtx(src, pats).run() == expected, src
+        assert "".join(highlight_stream(random_chunks(rand, src), pats)) \
+            == expected, src
+
+
+def test_compile_syntax():
+    rand = random.Random(1)
+    pats = compile_syntax(json.loads(json.dumps(SYNTAX)))
+    for _ in range(100):
+        src = random_source(rand)
+        assert PosCtx(src, pats).run() == reference(src, demo_pats())
+
+    bad = {"main": ["str"], "rules": {"str": {"start": "\"", "end": "\"",
+                                              "contains": ["nope"]}}}
+    with pytest.raises(ValueError, match="nope"):
+        compile_syntax(bad)
+
+
+def test_empty_end():
+    # 空的结束正则视为没有结束, 与 Ctx 一致
+    pats = [RegionPat("<", "", color=31, contains=[MatchPat("a", 32)])]
+    src = "x<a>b<a\nc"
+    assert PosCtx(src, pats).run() == reference(src, pats)
+    assert "".join(highlight_stream((src,), pats)) == reference(src, pats)
+
+
+def test_load_syntax(tmp_path, monkeypatch):
+    path = tmp_path / "syntax.json"
+    path.write_text(json.dumps(SYNTAX))
+    cache = tmp_path / "cache"
+    src = '{("a\\"b")}"c" ({x})\n'
+    expected = reference(src, demo_pats())
+
+    assert load_syntax(str(path), None) is not None
+    assert not cache.exists()
+    assert PosCtx(src, load_syntax(str(path), str(cache))).run() == expected
+    assert len(list(cache.iterdir())) == 1
+
+    # 命中缓存时不再编译
+    def fail(_):
+        raise AssertionError("compiled again")
+    monkeypatch.setattr(highlight, "compile_syntax", fail)
+    assert PosCtx(src, load_syntax(str(path), str(cache))).run() == expected
+
+    # 内容变化后缓存失效
+    path.write_text(json.dumps({**SYNTAX, "main": ["brace"]}))
+    with pytest.raises(AssertionError, match="compiled again"):
+        load_syntax(str(path), str(cache))
+
+
+def test_scan_chunks(tmp_path):
+    rand = random.Random(2)
+    src = random_source(rand, 5000)
+    path = tmp_path / "src.txt"
+    path.write_bytes(src.encode())
+    pats = demo_pats()
+
+    # 各行行首的状态
+    lines = src.splitlines(keepends=True)
+    states, offset = {}, 0
+    for line, (state, _) in zip(lines, highlight_lines(lines, pats)):
+        states[offset] = state_regions(state)
+        offset += len(line)
+    chunks = list(scan_chunks(str(path), pats, 64))
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(src)
+    for (_, end, _), (start, _, _) in zip(chunks, chunks[1:]):
+        assert end == start
+    for start, end, regions in chunks:
+        assert end - start >= 64 or end == len(src)
+        assert regions == states[start]
+    assert any(regions for _, _, regions in chunks)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 64, 1 << 20])
+def test_highlight_file_parallel(tmp_path, chunk_size):
+    rand = random.Random(3)
+    src = random_source(rand, 3000)
+    path = tmp_path / "src.txt"
+    path.write_bytes(src.encode())
+    pats = demo_pats()
+    out = b"".join(highlight_file_parallel(str(path), pats, 2, chunk_size))
+    assert out.decode() == reference(src, pats)
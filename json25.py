@@ -0,0 +1,740 @@
+#!/usr/bin/python3
+# -*- coding: utf-8; -*-
+"""Convert json5 to json"""
+
+import os
+import re
+import sys
+import getopt
+import json
+from codecs import getincrementaldecoder
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob, has_magic
+from hashlib import sha256
+from io import StringIO
+from itertools import repeat
+from json.encoder import encode_basestring, encode_basestring_ascii
+from tempfile import mkstemp
+from typing import IO, Any, NamedTuple, Optional, Union
+
+help_msg = """\
+json25 [Option...] [--] [FILE|DIR|GLOB...]
+
+Convert each FILE (or - for stdin) to stdout. Directories are searched
+recursively for *.json files (*.json5 with --reverse).
+
+Option:
+    -r, --reverse       convert json5 to json, default json to json5
+    -m, --minimal       show minimal format
+    -i, --indent=<N>    indent width
+    -t, --tab           use tab indent char
+    -s, --stream        convert token by token with bounded memory,
+                        duplicate keys are kept as is
+    -l, --lines         line-delimited input and output (NDJSON / JSON5 lines),
+                        one value per output line, implies --stream
+    -j, --jobs=<N>      convert files in N processes, default 1
+    -o, --out-dir=<DIR> write each result to DIR, mirroring the input tree
+                        relative to the inputs' common directory, with
+                        .json5 and .json suffixes swapped
+    -I, --in-place      atomically replace each file with its result
+    -n, --no-manifest   with -o or -I, convert files even if unchanged since
+                        the last run (by content hash of input and output)
+    -v, --verbose       report which parser handled each file:
+                        json, normalised (json5 rewritten to json) or json5
+    --bench [SIZE_KB]   benchmark the parsers on generated inputs
+    -h, --help          show this help
+"""
+
+MANIFEST_VERSION = 1
+CACHE_DIR = os.path.join(
+        os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+        "json25")
+
+Separators = Optional[tuple[str, str]]
+
+
+class Options(NamedTuple):
+    to_json5: bool = False
+    indent: Optional[str] = "  "
+    sep: Separators = None
+    stream: bool = False
+    lines: bool = False
+
+
+def json2json5(file, indent: Optional[str] = None, sep: Separators = None,
+               out: Optional[IO] = None) -> None:
+    import json5  # pylint: disable=import-outside-toplevel
+    obj = json.load(file)
+    json5.dump(obj, out or sys.stdout, indent=indent, separators=sep)
+
+
+def json52json(file, indent: Optional[str] = None, sep: Separators = None,
+               out: Optional[IO] = None) -> str:
+    """返回 load_json5 所用的方式"""
+    obj, tier = load_json5(file)
+    json.dump(obj, out or sys.stdout, indent=indent, separators=sep)
+    return tier
+
+
+CHUNK_SIZE = 1 << 16
+
+# 每个记号连同其前的空白与注释一起匹配, 无法识别的字符为 error.
+# JSON5 的空白包括 ECMAScript 的行结束符, \s 已覆盖
+TOKEN_REGEX = re.compile(r"""
+    (?:\s+|//[^\n\r\u2028\u2029]*|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/)*
+    (?:(?P<punct>[][{}:,])
+      |(?P<string>"[^"\\\n\r]*(?:\\(?:\r\n|[\s\S])[^"\\\n\r]*)*"
+                 |'[^'\\\n\r]*(?:\\(?:\r\n|[\s\S])[^'\\\n\r]*)*')
+      |(?P<number>[+-]?(?:0[xX][0-9a-fA-F]+|Infinity|NaN
+                         |(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?))
+      |(?P<ident>(?:[^\W\d]|[$]|\\u[0-9a-fA-F]{4})(?:[\w$]|\\u[0-9a-fA-F]{4})*)
+      |(?P<error>[\s\S])
+      |\Z)
+""", re.X)
+# 可能需要更多输入才能组成记号的开头字符
+PARTIAL_STARTS = "\"'/+-.\\"
+# 记号之后至少还需读入的字符数, 以确定记号不会更长 (如 \u0041 转义)
+LOOKAHEAD = 8
+# 未完成的记号 (连同其前的空白与注释) 最多缓冲的字符数, 超过即报错
+MAX_PARTIAL = 1 << 26
+# 尚未结束但仍可能合法的字符串, 遇到未转义的换行则不可能再合法
+PARTIAL_STRINGS = {
+    quote: re.compile(fr"{quote}[^{quote}\\\n\r]*(?:\\(?:\r\n|[\s\S])[^{quote}\\\n\r]*)*\\?\Z")
+    for quote in "\"'"
+}
+
+ESCAPE_REGEX = re.compile(r"\\(?:x([0-9a-fA-F]{2})|u([0-9a-fA-F]{4})|(\r\n|[\s\S]))")
+ESCAPES = {
+    "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "v": "\v", "0": "\0",
+    "\n": "", "\r": "", "\r\n": "", "\u2028": "", "\u2029": "",
+}
+# 不完整的 \x 与 \u, 以及除 \0 外的数字转义都不合法, \0 之后也不能是数字
+INVALID_ESCAPES = frozenset("xu123456789")
+DIGITS = frozenset("0123456789")
+# ECMAScript 保留字不能作为 JSON5 的无引号键
+RESERVED_WORDS = frozenset("""
+    break case catch class const continue debugger default delete do else enum
+    export extends false finally for function if import in instanceof new null
+    return super switch this throw true try typeof var void while with
+""".split())
+
+
+class Tokens:
+    """逐块读取 JSON5 文本, 迭代时生成 (种类, 文本), 跳过空白与注释
+
+    同时只保留当前块与未完成的记号, 内存只与块大小和最长的单个记号有关.
+    未闭合的字符串在行尾即报错, 其余未完成的记号超过 max_partial 时报错,
+    不会缓冲文件的剩余部分
+    """
+    __slots__ = ("file", "chunk_size", "max_partial", "buf", "pos", "line")
+
+    def __init__(self, file: IO, chunk_size: int = CHUNK_SIZE,
+                 max_partial: int = MAX_PARTIAL):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.max_partial = max_partial
+        self.buf = ""
+        self.pos = 0
+        self.line = 1  # buf 开头所在的行
+
+    def __iter__(self) -> Iterator[tuple[str, str]]:
+        decode = getincrementaldecoder("utf-8-sig")().decode
+        finditer = TOKEN_REGEX.finditer
+        buf, pos, eof = "", 0, False
+        while True:
+            # 记号可能延续到下一块, 如 "-0" 之后的 "x1F" 或 "1e" 之后的 "+5"
+            limit = len(buf) + 1 if eof else len(buf) - LOOKAHEAD
+            for m in finditer(buf, pos):
+                kind = m.lastgroup
+                end = self.pos = m.end()
+                if end > limit or kind == "error" and not eof \
+                        and m.group(kind) in PARTIAL_STARTS:
+                    pos = m.start()
+                    if kind == "error" and (quote := m.group(kind)) in PARTIAL_STRINGS \
+                            and not PARTIAL_STRINGS[quote].match(buf, m.start(kind)):
+                        self.pos = m.start(kind)
+                        raise self.error("unterminated string")
+                    if len(buf) - pos > self.max_partial:
+                        self.pos = m.start(kind) if kind else pos
+                        raise self.error("token too long")
+                    break
+                if kind is None:
+                    return
+                if kind == "error":
+                    self.pos = m.start(kind)
+                    raise self.error(f"invalid token {buf[self.pos:self.pos + 10]!r}")
+                yield kind, m.group(kind)  # type: ignore[misc]
+
+            # 未完成的记号很长时按其长度读入, 避免反复从头匹配
+            chunk = self.file.read(max(self.chunk_size, len(buf) - pos))
+            if isinstance(chunk, bytes):
+                chunk = decode(chunk, not chunk)
+            eof = not chunk
+            self.line += buf.count("\n", 0, pos)
+            buf = self.buf = buf[pos:] + chunk
+            pos = self.pos = 0
+
+    def error(self, msg: str) -> ValueError:
+        """当前位置的错误, 行列号从 1 开始"""
+        line = self.line + self.buf.count("\n", 0, self.pos)
+        column = self.pos - self.buf.rfind("\n", 0, self.pos)
+        return ValueError(f"line {line} column {column}: {msg}")
+
+
+def decode_string(token: str) -> str:
+    """单引号或双引号的 JSON5 字符串记号的值"""
+    body = token[1:-1]
+    if "\\" in body:
+        body = ESCAPE_REGEX.sub(_unescape, body)
+    return body
+
+
+def _unescape(m: re.Match) -> str:
+    code = m.group(1) or m.group(2)
+    if code:
+        return chr(int(code, 16))
+    char = m.group(3)
+    if char in INVALID_ESCAPES or char == "0" \
+            and m.string[m.end():m.end() + 1] in DIGITS:
+        raise ValueError(f"invalid escape {m.group()!r}")
+    return ESCAPES.get(char, char)
+
+
+def dump_number(token: str) -> str:
+    """JSON5 数字记号以 json.dump 的格式输出, 与先解析再输出的结果相同"""
+    body = token.lstrip("+-")
+    negative = token[0] == "-"
+    if body == "NaN":
+        return body
+    if body == "Infinity":
+        return "-Infinity" if negative else body
+    if body[:2] in ("0x", "0X"):
+        value: Union[int, float] = int(body, 16)
+    elif "." in body or "e" in body or "E" in body:
+        value = float(body)
+        if value == float("inf"):
+            return "-Infinity" if negative else "Infinity"
+    else:
+        value = int(body)
+    return repr(-value if negative else value)
+
+
+def dump_key(key: str, json5: bool) -> str:
+    if json5 and key.isidentifier() and key.isascii() and key not in RESERVED_WORDS:
+        return key
+    return encode_basestring_ascii(key)
+
+
+# 只匹配需要改写之处, 其余部分 (包括双引号字符串) 整段保留, 以减少回调次数.
+# (?=(...))\1 相当于占有匹配, 避免标识符回溯后被误认为不是键
+_GAP = r"(?:\s|//[^\n\r\u2028\u2029]*|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/)*"
+NORMALISE_REGEX = re.compile(fr"""
+    (?P<keep>(?:[^"'/,\w$]+
+               |"[^"\\\n\r]*(?:\\[\s\S][^"\\\n\r]*)*"
+               |(?=([\w$]+))\2(?!\s*:)
+               |,(?!{_GAP}[]}}])
+    )+)
+   |(?P<comment>//[^\n\r\u2028\u2029]*|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/)
+   |(?P<comma>,)
+   |(?P<key>[\w$]+)
+   |(?P<string>'[^'\\\n\r]*(?:\\(?:\r\n|[\s\S])[^'\\\n\r]*)*')
+""", re.X)
+
+
+def normalise(text: str) -> str:
+    """一次扫描将常见的 JSON5 改写为 JSON: 去除注释与尾随逗号, 为键加引号, 改写单引号字符串
+
+    其余 JSON5 语法 (十六进制数等) 保持不变, 交由 json 解析时报错.
+    改写会掩盖的不合法输入 (如数字键, [,]) 抛出 ValueError
+    """
+    last = ""  # 上一个输出的非空白字符
+
+    def replace(m: re.Match) -> str:
+        nonlocal last
+        match m.lastgroup:
+            case "comment":
+                # 注释分隔两侧的记号, 不能直接删除, 否则 1/*c*/1 会变成 11
+                return " "
+            case "comma":
+                # 尾随逗号之前必须有值
+                if not last or last in "[{,":
+                    raise ValueError("unexpected ','")
+                return ""
+            case "key":
+                if not m.group().replace("$", "_").isidentifier():
+                    raise ValueError(f"invalid key {m.group()!r}")
+                result = f'"{m.group()}"'
+            case "string":
+                result = encode_basestring(decode_string(m.group()))
+            case _:
+                result = m.group()
+        if stripped := result.rstrip():
+            last = stripped[-1]
+        return result
+
+    return NORMALISE_REGEX.sub(replace, text)
+
+
+def load_json5(file) -> tuple[Any, str]:
+    """分级解析 JSON5, 返回对象与所用的方式
+
+    依次尝试: "json" 为 C 实现的 json 直接解析, "normalised" 为 normalise 后再以 json 解析,
+    "json5" 为纯 Python 的 json5 解析, 比前两者慢一到两个数量级
+    """
+    text = file.read()
+    if isinstance(text, bytes):
+        text = text.decode("utf-8-sig")
+    try:
+        return json.loads(text), "json"
+    except ValueError:
+        pass
+    try:
+        return json.loads(normalise(text)), "normalised"
+    except ValueError as e:
+        error = e
+    try:
+        import json5  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        raise error from None
+    return json5.loads(text), "json5"
+
+
+def convert_stream(
+        file: IO, out: IO,
+        json5: bool = False,
+        indent: Optional[str] = None,
+        sep: Separators = None,
+        lines: bool = False,
+) -> None:
+    """逐个记号将 JSON5 (含 JSON) 转换为 JSON, json5 为真时转换为 JSON5
+
+    输出格式与 json.dump (或 json5.dump) 解析后再输出的结果相同, 但不合并重复的键.
+    lines 为真时输入为多个顶层值, 每个值输出为一行
+    """
+    if lines:
+        indent = None
+    item_sep, key_sep = sep or ((", ", ": ") if indent is None else (",", ": "))
+    newlines = ["\n"]  # 各层缩进
+    tokens = Tokens(file)
+
+    parts: list[str] = []
+    write = parts.append
+    objects: list[bool] = []  # 各层容器是否为对象
+    filled: list[bool] = []   # 各层容器是否已有元素
+    # 期望的下一个记号: 值, 键, 冒号, 或值之后的逗号与右括号
+    VALUE, KEY, COLON, AFTER = range(4)  # pylint: disable=invalid-name
+    state = VALUE
+    closable = False  # 是否可以直接出现右括号 (空容器或尾随逗号)
+    values = 0
+
+    def begin_item() -> None:
+        if filled[-1]:
+            write(item_sep)
+        else:
+            filled[-1] = True
+        if indent is not None:
+            depth = len(filled)
+            while len(newlines) <= depth:
+                newlines.append(newlines[-1] + indent)
+            write(newlines[depth])
+
+    for kind, text in tokens:
+        if kind == "punct" and text in "]}":
+            if not (state == AFTER or closable) or not objects \
+                    or objects[-1] != (text == "}"):
+                raise tokens.error(f"unexpected {text!r}")
+            objects.pop()
+            if filled.pop():
+                if json5 and indent is not None:
+                    write(",")
+                if indent is not None:
+                    write(newlines[len(filled)])
+            write(text)
+            state, closable = AFTER, False
+        elif state == AFTER:
+            if text != "," or not objects:
+                raise tokens.error(f"unexpected {text!r}")
+            state, closable = KEY if objects[-1] else VALUE, True
+            continue
+        elif state == KEY:
+            if kind == "string":
+                key = decode_string(text)
+            elif kind == "ident" or text.isidentifier():
+                key = ESCAPE_REGEX.sub(_unescape, text) if "\\" in text else text
+            else:
+                raise tokens.error(f"expected key, got {text!r}")
+            begin_item()
+            write(dump_key(key, json5))
+            write(key_sep)
+            state, closable = COLON, False
+            continue
+        elif state == COLON:
+            if text != ":":
+                raise tokens.error(f"expected ':', got {text!r}")
+            state = VALUE
+            continue
+        else:
+            if not objects and values and not lines:
+                raise tokens.error(f"extra data {text!r}")
+            if objects and not objects[-1]:
+                begin_item()
+            if kind == "string":
+                write(encode_basestring_ascii(decode_string(text)))
+            elif kind == "number":
+                write(dump_number(text))
+            elif text in ("true", "false", "null"):
+                write(text)
+            elif text in "[{" and kind == "punct":
+                write(text)
+                objects.append(text == "{")
+                filled.append(False)
+                state, closable = KEY if text == "{" else VALUE, True
+                continue
+            else:
+                raise tokens.error(f"unexpected {text!r}")
+            state, closable = AFTER, False
+
+        # 一个值已结束
+        if not objects:
+            values += 1
+            state = VALUE
+            if lines:
+                write("\n")
+        if len(parts) >= 4096:
+            out.write("".join(parts))
+            parts.clear()
+
+    if objects or state != VALUE:
+        raise tokens.error("unexpected end of input")
+    if not values and not lines:
+        raise tokens.error("no value")
+    if not lines:
+        write("\n")
+    out.write("".join(parts))
+    out.flush()
+
+
+def convert_json(file, to_json5: bool, indent: Optional[str], sep: Separators,
+                 out: Optional[IO] = None) -> str:
+    """返回解析所用的方式"""
+    out = out or sys.stdout
+    if to_json5:
+        json2json5(file, indent, sep, out)
+        tier = "json"
+    else:
+        tier = json52json(file, indent, sep, out)
+    out.write("\n")
+    out.flush()
+    return tier
+
+
+def convert(file, out: IO, options: Options) -> str:
+    """按 options 转换, 返回解析所用的方式, 流式转换时为 stream"""
+    if options.stream:
+        convert_stream(file, out, options.to_json5, options.indent, options.sep, options.lines)
+        return "stream"
+    return convert_json(file, options.to_json5, options.indent, options.sep, out)
+
+
+def expand_paths(args: list[str], suffix: str) -> list[str]:
+    """展开目录 (递归查找以 suffix 结尾的文件) 与通配符, 去重并保持顺序"""
+    paths: dict[str, None] = {}
+    for arg in args:
+        for path in sorted(glob(arg, recursive=True)) if has_magic(arg) else [arg]:
+            if not os.path.isdir(path):
+                paths[path] = None
+                continue
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith(suffix):
+                        paths[os.path.join(root, name)] = None
+    return list(paths)
+
+
+def output_paths(paths: list[str], out_dir: str, to_json5: bool,
+                 dirs: Iterable[str] = ()) -> list[str]:
+    """各输入在 out_dir 中的输出路径, 保持相对于所有输入与 dirs 的公共目录的结构"""
+    paths = [os.path.abspath(path) for path in paths]
+    root = os.path.commonpath([os.path.dirname(path) for path in paths]
+                              + [os.path.abspath(path) for path in dirs])
+    old, new = (".json", ".json5") if to_json5 else (".json5", ".json")
+    targets = []
+    for path in paths:
+        base, suffix = os.path.splitext(os.path.relpath(path, root))
+        targets.append(os.path.join(out_dir, base + (new if suffix == old else suffix)))
+    return targets
+
+
+def file_digest(path: str) -> str:
+    with open(path, "rb") as file:
+        digest = sha256()
+        while chunk := file.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Result(NamedTuple):
+    """convert_file 的结果, status 为 converted, unchanged 或 failed"""
+    status: str
+    tier: str = ""
+    # (输入 sha256, 输出 sha256), 用于下次运行时跳过未改变的文件
+    digests: Optional[tuple[str, str]] = None
+    # 没有输出路径时的输出文本, 或失败的原因
+    text: str = ""
+
+
+def convert_file(
+        path: str,
+        target: Optional[str],
+        options: Options,
+        known: Optional[tuple[str, str]] = None,
+        ) -> Result:
+    """转换 path 并写入 target, 先写同目录的临时文件再原子替换; target 为 None 时返回输出文本
+
+    known 为上次记录的 (输入哈希, 输出哈希), 输入与现有的输出都未改变时跳过.
+    错误不抛出而是作为结果返回, 以便按输入顺序报告
+    """
+    try:
+        if target is None:
+            out = StringIO()
+            with open(path, "rb") as file:
+                tier = convert(file, out, options)
+            return Result("converted", tier, text=out.getvalue())
+
+        digest = file_digest(path)
+        if known is not None and known[0] == digest and os.path.exists(target) \
+                and (target == path or file_digest(target) == known[1]):
+            return Result("unchanged", digests=known)
+
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        fd, tmp = mkstemp(dir=os.path.dirname(target) or ".", prefix=".tmp.")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as out, open(path, "rb") as file:
+                tier = convert(file, out, options)
+            os.chmod(tmp, os.stat(target if os.path.exists(target) else path).st_mode)
+            os.replace(tmp, target)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        out_digest = file_digest(target)
+        return Result("converted", tier, (out_digest if target == path else digest, out_digest))
+    except (OSError, ValueError, ImportError) as e:
+        # 未安装 json5 时 json 转 json5 为 ImportError, 同样只是这个文件失败
+        return Result("failed", text=str(e))
+
+
+# 输入的绝对路径: [选项, 输出的绝对路径, 输入 sha256, 输出 sha256]
+Manifest = dict[str, list]
+
+
+def load_manifest(cache_dir: str) -> Manifest:
+    try:
+        with open(os.path.join(cache_dir, f"manifest.v{MANIFEST_VERSION}.json"), "rb") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(cache_dir: str, manifest: Manifest) -> None:
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp = mkstemp(dir=cache_dir, prefix=".tmp.")
+        with os.fdopen(fd, "w") as file:
+            json.dump(manifest, file, separators=(",", ":"))
+        os.replace(tmp, os.path.join(cache_dir, f"manifest.v{MANIFEST_VERSION}.json"))
+    except OSError as e:
+        print(f"json25: write manifest failed: {e}", file=sys.stderr)
+
+
+def convert_files(
+        paths: list[str],
+        targets: list[Optional[str]],
+        options: Options,
+        jobs: int = 1,
+        cache_dir: Optional[str] = CACHE_DIR,
+        ) -> Iterator[tuple[str, Result]]:
+    """按输入顺序产出各文件的 (路径, 结果), jobs 大于 1 时在进程池中转换
+
+    有输出路径时, 输入与输出的哈希都与清单中上次的记录相同则跳过
+    """
+    manifest = load_manifest(cache_dir) if cache_dir is not None else {}
+    key = json.loads(json.dumps(options))  # 与从清单读出的相同, 元组为列表
+    knowns: list[Optional[tuple[str, str]]] = []
+    for path, target in zip(paths, targets):
+        entry = manifest.get(os.path.abspath(path))
+        if target is not None and entry is not None \
+                and entry[:2] == [key, os.path.abspath(target)]:
+            knowns.append((entry[2], entry[3]))
+        else:
+            knowns.append(None)
+
+    args = (paths, targets, repeat(options), knowns)
+    if jobs > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(jobs) as pool:
+            results = list(pool.map(
+                    convert_file, *args, chunksize=max(1, len(paths) // (jobs * 4))))
+    else:
+        results = map(convert_file, *args)  # type: ignore[assignment]
+
+    changed = False
+    for path, target, result in zip(paths, targets, results):
+        if target is not None and result.digests is not None:
+            entry = [key, os.path.abspath(target), *result.digests]
+            changed = changed or manifest.get(os.path.abspath(path)) != entry
+            manifest[os.path.abspath(path)] = entry
+        yield path, result
+    if changed and cache_dir is not None:
+        save_manifest(cache_dir, manifest)
+
+
+def bench(size_kb: int = 1024) -> None:
+    """各级解析在严格 JSON 与常见 JSON5 输入上的耗时"""
+    # pylint: disable=import-outside-toplevel
+    from random import Random
+    from time import perf_counter
+
+    rand = Random(0)
+    rows = []
+    while sum(map(len, map(str, rows))) < size_kb * 1024 // 2:
+        rows.append({"id": len(rows), "name": f"user{rand.getrandbits(24)}",
+                     "score": round(rand.random() * 100, 3), "tags": ["a", "b", "c"][:rand.randrange(4)],
+                     "url": "http://example.com/a//b", "active": rand.random() < 0.5})
+    strict = json.dumps(rows, indent=2)
+    # 注释与尾随逗号
+    commented = re.sub(r"\n(\s*)([]}])", r",\n\1\2", strict.replace("\n  {", "\n  // row\n  {"))
+    # 无引号的键与单引号字符串
+    unquoted = re.sub(r'"(\w+)":', r"\1:", commented).replace('"', "'")
+    # 十六进制数只有 json5 能解析
+    hexed = re.sub(r"id: (\d+)", lambda m: f"id: {int(m.group(1)):#x}", unquoted)
+
+    try:
+        import json5
+    except ImportError:
+        json5 = None
+    print(f"{len(strict) >> 10} KiB inputs")
+    for name, text in [("strict", strict), ("commented", commented),
+                       ("unquoted", unquoted), ("hex", hexed)]:
+        start = perf_counter()
+        try:
+            obj, tier = load_json5(StringIO(text))
+        except ValueError:
+            print(f"{name:<10} needs json5, not installed")
+            continue
+        elapsed = perf_counter() - start
+        assert obj == rows
+        line = f"{name:<10} {tier:<10} {len(text) / elapsed / 1e6:7.1f} MB/s"
+        if json5 is not None:
+            start = perf_counter()
+            json5.loads(text)
+            line += f", json5 only {len(text) / (perf_counter() - start) / 1e6:.1f} MB/s"
+        print(line)
+
+
+def main() -> None:
+    opts, args = getopt.getopt(
+            sys.argv[1:],
+            'rmi:tslj:o:Invh',
+            ["reverse", "minimal", "indent=", "tab", "stream", "lines", "jobs=",
+             "out-dir=", "in-place", "no-manifest", "verbose", "bench", "help"])
+
+    indent_ch = " "
+    reverse = False
+    indent_count: Optional[int] = 2
+    sep = None
+    stream = lines = verbose = in_place = False
+    jobs = 1
+    out_dir: Optional[str] = None
+    cache_dir: Optional[str] = CACHE_DIR
+
+    for opt, opt_value in opts:
+        match opt:
+            case '-h' | '--help':
+                print(end=help_msg)
+                sys.exit()
+            case '-m' | '--minimal':
+                indent_count = None
+                sep = ",", ":"
+            case '-i' | '--indent':
+                indent_count = int(opt_value)
+                assert indent_count >= 0, f"{indent_count=} by lessthan zero"
+            case '-t' | '--tab':
+                indent_ch = "\t"
+            case '-r' | '--reverse':
+                reverse = True
+            case '-s' | '--stream':
+                stream = True
+            case '-l' | '--lines':
+                stream = lines = True
+            case '-j' | '--jobs':
+                jobs = int(opt_value)
+            case '-o' | '--out-dir':
+                out_dir = opt_value
+            case '-I' | '--in-place':
+                in_place = True
+            case '-n' | '--no-manifest':
+                cache_dir = None
+            case '-v' | '--verbose':
+                verbose = True
+            case '--bench':
+                bench(*map(int, args))
+                sys.exit()
+
+    indent = None if indent_count is None else indent_ch * indent_count
+    # 与最初的脚本相同, 默认为 json 转 json5
+    options = Options(not reverse, indent, sep, stream, lines)
+    paths = expand_paths(args or ["-"], ".json" if options.to_json5 else ".json5")
+
+    targets: list[Optional[str]]
+    if out_dir is not None or in_place:
+        if "-" in paths or out_dir is not None and in_place:
+            print("json25: --out-dir and --in-place need FILE arguments, "
+                  "and cannot be used together", file=sys.stderr)
+            sys.exit(2)
+        targets = list(paths) if in_place else output_paths(
+                paths, out_dir, options.to_json5, filter(os.path.isdir, args))
+        if len(set(targets)) != len(targets):
+            print("json25: several inputs map to the same output", file=sys.stderr)
+            sys.exit(2)
+    elif jobs > 1 and "-" not in paths:
+        targets = [None] * len(paths)
+    else:
+        # 逐个直接写到标准输出, 流式转换时内存有界.
+        # 与 convert_files 相同, 失败的文件报告后继续, 最后以 1 退出
+        failed = False
+        for path in paths:
+            try:
+                if path == "-":
+                    tier = convert(sys.stdin, sys.stdout, options)
+                else:
+                    with open(path, "rb") as file:
+                        tier = convert(file, sys.stdout, options)
+            except (OSError, ValueError, ImportError) as e:
+                sys.stdout.flush()
+                print(f"json25: {path}: {e}", file=sys.stderr)
+                failed = True
+                continue
+            if verbose:
+                print(f"json25: {path}: {tier}", file=sys.stderr)
+        if failed:
+            sys.exit(1)
+        return
+
+    failed = False
+    for path, result in convert_files(paths, targets, options, jobs, cache_dir):
+        if result.status == "failed":
+            print(f"json25: {path}: {result.text}", file=sys.stderr)
+            failed = True
+            continue
+        if result.text:
+            sys.stdout.write(result.text)
+        if verbose:
+            print(f"json25: {path}: {result.status} {result.tier}".rstrip(), file=sys.stderr)
+    sys.stdout.flush()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
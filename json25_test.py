@@ -0,0 +1,243 @@
+#!/usr/bin/python3
+# -*- coding: utf-8; -*-
+"""test file"""
+
+import io
+import json
+import random
+import sys
+
+import pytest
+
+import json25
+from json25 import (Options, Tokens, convert_files, convert_stream, expand_paths, load_json5,
+                    normalise, output_paths)
+
+JSON5_TEXT = """\
+// comment
+{
+  unquoted: 'single \\'q\\' "d"',
+  "quoted": [1, 2.50, -0x1F, +3, .5, 5., 1e3, ],
+  /* block
+     comment */ nested: {a: {}, b: [], c: [{}],},
+  str: "line\\
+cont \\x41\u00e9 \\t\\u4e2d",
+  $dollar: null, t: true, f: false,
+}
+"""
+EXPECTED = {
+    "unquoted": "single 'q' \"d\"",
+    "quoted": [1, 2.5, -31, 3, 0.5, 5.0, 1000.0],
+    "nested": {"a": {}, "b": [], "c": [{}]},
+    "str": "linecont A\u00e9 \t\u4e2d",
+    "$dollar": None, "t": True, "f": False,
+}
+
+
+class Trickle(io.StringIO):
+    """每次只读出少量字符, 使记号跨越块边界"""
+    def __init__(self, text: str, size: int):
+        super().__init__(text)
+        self.size = size
+
+    def read(self, size=-1):
+        return super().read(min(size, self.size))
+
+
+def convert(text: str, size: int = 1 << 16, **kwargs) -> str:
+    out = io.StringIO()
+    convert_stream(Trickle(text, size), out, **kwargs)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1 << 16])
+@pytest.mark.parametrize("indent, sep", [("  ", None), (None, None), (None, (",", ":")), ("", None)])
+def test_json5_to_json(size, indent, sep):
+    expected = json.dumps(EXPECTED, indent=indent, separators=sep) + "\n"
+    assert convert(JSON5_TEXT, size, indent=indent, sep=sep) == expected
+
+
+def test_json_roundtrip():
+    rand = random.Random(0)
+
+    def value(depth: int):
+        match rand.randrange(6 if depth < 4 else 3):
+            case 0:
+                return rand.randint(-10**20, 10**20)
+            case 1:
+                return rand.uniform(-1e6, 1e6)
+            case 2:
+                return "".join(rand.choice("ab\"\\\n\u00e9\U0001f600") for _ in range(rand.randrange(5)))
+            case 3:
+                return [value(depth + 1) for _ in range(rand.randrange(4))]
+            case _:
+                return {str(i): value(depth + 1) for i in range(rand.randrange(4))}
+
+    for _ in range(200):
+        obj = value(0)
+        text = json.dumps(obj, indent=rand.choice([None, 2]), ensure_ascii=rand.random() < 0.5)
+        assert convert(text, rand.randint(1, 9), indent="\t") == json.dumps(obj, indent="\t") + "\n"
+
+
+def test_to_json5():
+    assert convert('{"a": [1, {}], "if": "x", "a b": []}', indent="  ", json5=True) == \
+        '{\n  a: [\n    1,\n    {},\n  ],\n  "if": "x",\n  "a b": [],\n}\n'
+
+
+def test_lines():
+    text = '{"a": 1}\n[1, 2,]\n// c\n"s"\n\n{b: {c: 2,},}\n'
+    assert convert(text, 3, indent="  ", lines=True) == '{"a": 1}\n[1, 2]\n"s"\n{"b": {"c": 2}}\n'
+    assert convert("", lines=True) == ""
+
+
+@pytest.mark.parametrize("text", [
+    "", "[1 2]", "{a 1}", "[1,,]", "[,]", "{,}", "{a:}", "[}", "1 2", "[1", "'abc", "/* x", "@",
+])
+def test_errors(text):
+    with pytest.raises(ValueError):
+        convert(text, 2)
+
+
+@pytest.mark.parametrize("text, message", [
+    ('["abc\n', "line 1 column 2: unterminated string"),
+    ("[1,\n 'a\\\nb\n", "line 2 column 2: unterminated string"),
+    ("/* " + "x" * 100, "token too long"),
+    ('"' + "x" * 100, "token too long"),
+])
+def test_partial_token_limit(text, message):
+    # 未闭合的记号之后还有很多输入, 应尽早报错而不是缓冲剩余部分
+    file = Trickle(text + "1, " * 100000, 16)
+    with pytest.raises(ValueError, match=message):
+        list(Tokens(file, 16, max_partial=50))
+    assert file.tell() < 1000
+
+
+@pytest.mark.parametrize("text, tier", [
+    ('{"a": [1, "//x", "/*y*/"], "b": {}}', "json"),
+    ('{"a": [1, "//x", "/*y*/",], // c\n "b": {/* c */},}', "normalised"),
+    ("{a: [1, '//x', '/*y*/', ], b: {\n},}", "normalised"),
+])
+def test_tiers(text, tier):
+    assert load_json5(io.StringIO(text)) == ({"a": [1, "//x", "/*y*/"], "b": {}}, tier)
+
+
+@pytest.mark.parametrize("text", [
+    "{1: 2}", "{a: 1, 2b: 3}", "{\u0663: 1}", "[,]", "{ /* c */ ,}", "[1,,]",
+    "['\\1']", "['\\01']", "['\\xZZ']", "['\\u12']",
+])
+def test_normalise_rejects(text):
+    # json5 同样拒绝这些输入, 未安装 json5 时报告 normalise 的错误
+    with pytest.raises(ValueError):
+        normalise(text)
+    with pytest.raises(ValueError):
+        load_json5(io.StringIO(text))
+
+
+@pytest.mark.parametrize("text", [
+    "1/*c*/1", "-/*c*/1", "1e5/*c*/01", "[1//c\n2]", "{a/*c*/b: 1}",
+])
+def test_normalise_comment_separates(text):
+    # 注释两侧的记号不能被拼接成合法的 JSON
+    with pytest.raises(ValueError):
+        json.loads(normalise(text))
+    with pytest.raises(ValueError):
+        load_json5(io.StringIO(text))
+
+
+def test_normalise_identifiers():
+    text = "{$a_1: '\\0\\x41', \u00e9: [1,], _: {},}"
+    assert load_json5(io.StringIO(text)) == \
+        ({"$a_1": "\0A", "\u00e9": [1], "_": {}}, "normalised")
+
+
+def test_json5_tier():
+    text = io.BytesIO(b"{a: 0x10, b: +1}")
+    try:
+        import json5  # pylint: disable=import-outside-toplevel,unused-import
+    except ImportError:
+        with pytest.raises(ValueError):
+            load_json5(text)
+    else:
+        assert load_json5(text) == ({"a": 16, "b": 1}, "json5")
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_convert_files(tmp_path, jobs):
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    for i in range(5):
+        (src / "sub" / f"{i}.json5").write_text(f"{{a: {i}, }}")
+    (src / "bad.json5").write_text("{a")
+    paths = expand_paths([str(src)], ".json5")
+    targets = output_paths(paths, str(tmp_path / "out"), False, [str(src)])
+    options = Options(indent=None)
+    cache = str(tmp_path / "cache")
+
+    def run() -> list[tuple[str, str]]:
+        return [(path, result.status) for path, result in
+                convert_files(paths, targets, options, jobs, cache)]
+
+    assert run() == [(paths[0], "failed")] + [(path, "converted") for path in paths[1:]]
+    assert (tmp_path / "out" / "sub" / "3.json").read_text() == '{"a": 3}\n'
+    assert run() == [(paths[0], "failed")] + [(path, "unchanged") for path in paths[1:]]
+    (src / "sub" / "1.json5").write_text("[1]")
+    (tmp_path / "out" / "sub" / "2.json").unlink()
+    assert [status for _, status in run()] == \
+        ["failed", "unchanged", "converted", "converted", "unchanged", "unchanged"]
+
+
+def test_in_place(tmp_path):
+    path = tmp_path / "a.json5"
+    path.write_text("{a: 'x', /* c */}")
+    cache = str(tmp_path / "cache")
+    for status in ["converted", "unchanged"]:
+        [(_, result)] = convert_files([str(path)], [str(path)], Options(indent=None), cache_dir=cache)
+        assert result.status == status
+    assert path.read_text() == '{"a": "x"}\n'
+    assert [p.name for p in tmp_path.iterdir() if p.name.startswith(".tmp")] == []
+
+
+def test_main_direction(tmp_path, monkeypatch, capsys):
+    # 与最初的脚本相同, 默认 json 转 json5, -r 为 json5 转 json
+    path = tmp_path / "a.json"
+    path.write_text('{"a": [1], "b c": {}}')
+    monkeypatch.setattr("sys.argv", ["json25", "-s", "-m", str(path)])
+    json25.main()
+    assert capsys.readouterr().out == '{a:[1],"b c":{}}\n'
+
+    path.write_text("{a: [1,], 'b c': {}}")
+    monkeypatch.setattr("sys.argv", ["json25", "-r", "-s", "-m", str(path)])
+    json25.main()
+    assert capsys.readouterr().out == '{"a":[1],"b c":{}}\n'
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_missing_json5(tmp_path, monkeypatch, jobs):
+    # 未安装 json5 时 json 转 json5 逐个文件失败, 流式转换不需要 json5
+    monkeypatch.setitem(sys.modules, "json5", None)
+    paths = []
+    for i in range(3):
+        paths.append(str(tmp_path / f"{i}.json"))
+        (tmp_path / f"{i}.json").write_text(f'{{"a": {i}}}')
+    targets = output_paths(paths, str(tmp_path / "out"), True)
+    for stream, status in [(False, "failed"), (True, "converted")]:
+        options = Options(to_json5=True, indent=None, stream=stream)
+        results = list(convert_files(paths, targets, options, jobs, None))
+        assert [result.status for _, result in results] == [status] * 3
+    assert (tmp_path / "out" / "2.json5").read_text() == "{a: 2}\n"
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_main_failures(tmp_path, monkeypatch, capsys, jobs):
+    # 失败的文件报告后继续, 输出与错误报告不依赖 -j
+    paths = [str(tmp_path / name) for name in ["a.json5", "bad.json5", "none.json5", "c.json5"]]
+    (tmp_path / "a.json5").write_text("{a: 1}")
+    (tmp_path / "bad.json5").write_text("{a")
+    (tmp_path / "c.json5").write_text("[2,]")
+    monkeypatch.setattr("sys.argv", ["json25", "-r", "-m", "-j", jobs, *paths])
+    with pytest.raises(SystemExit) as exc:
+        json25.main()
+    assert exc.value.code == 1
+    out, err = capsys.readouterr()
+    assert out == '{"a":1}\n[2]\n'
+    assert [line.split(":")[1].strip() for line in err.splitlines()] == [paths[1], paths[2]]
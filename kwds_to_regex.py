@@ -0,0 +1,648 @@
+#!/usr/bin/python3
+# -*- coding: utf-8; -*-
+"""关键字正则前缀树"""
+
+import os
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from mmap import mmap, ACCESS_READ
+from struct import Struct
+from tempfile import mkstemp
+from typing import NamedTuple, Optional
+
+
+def build(kwds: list[str]):
+    root = {}
+    for kwd in kwds:
+        node = root
+        for c in kwd:
+            node = node.setdefault(c, {})
+        node[""] = {}
+    return root
+
+
+def grouped(s: str) -> str:
+    if len(s) == 1 or s.startswith("(") and s.endswith(")"):
+        return s
+    return f"(?:{s})"
+
+
+def to_re(root) -> str:
+    """前缀树直接生成的正则, 不转义字符, 仅用于对比"""
+    if not root:
+        return ""
+
+    if len(root) == 1:
+        k, v = next(iter(root.items()))
+        return k + to_re(v)
+
+    if root.get("") is not None:
+        return grouped(to_re({k: v for k, v in root.items() if k})) + "?"
+
+    return grouped("|".join(map(
+        lambda item: item[0] + to_re(item[1]),
+        root.items()
+    )))
+
+
+class Dawg(NamedTuple):
+    """最小化的前缀树 (有向无环词图), 0 号为起始节点
+
+    edges[i] 为节点 i 的 {字符: 目标节点}, finals[i] 为节点 i 是否为关键字结尾
+    """
+    edges: list[dict[str, int]]
+    finals: list[bool]
+
+
+def build_dawg(kwds: Iterable[str]) -> Dawg:
+    """构建前缀树后自底向上合并等价的子树, 不使用递归"""
+    edges: list[dict[str, int]] = [{}]
+    finals = [False]
+    for kwd in kwds:
+        node = 0
+        for c in kwd:
+            child = edges[node].get(c)
+            if child is None:
+                child = edges[node][c] = len(edges)
+                edges.append({})
+                finals.append(False)
+            node = child
+        finals[node] = True
+
+    # 后序遍历, 子节点先被替换为其等价类的代表
+    register: dict[tuple, int] = {}
+    rep = [0] * len(edges)
+    new_edges: list[dict[str, int]] = []
+    new_finals: list[bool] = []
+    stack = [(0, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if not expanded:
+            stack.append((node, True))
+            stack.extend((child, False) for child in edges[node].values())
+            continue
+        out = {c: rep[child] for c, child in edges[node].items()}
+        key = (finals[node], tuple(sorted(out.items())))
+        if (same := register.get(key)) is None:
+            same = register[key] = len(new_edges)
+            new_edges.append(out)
+            new_finals.append(finals[node])
+        rep[node] = same
+
+    # 以逆后序重新编号, 使起始节点为 0 且父节点总在子节点之前
+    order: list[int] = []
+    visited = {rep[0]}
+    stack = [(rep[0], iter(new_edges[rep[0]].values()))]
+    while stack:
+        node, children = stack[-1]
+        for child in children:
+            if child not in visited:
+                visited.add(child)
+                stack.append((child, iter(new_edges[child].values())))
+                break
+        else:
+            order.append(node)
+            stack.pop()
+    order.reverse()
+    index = {node: i for i, node in enumerate(order)}
+    return Dawg(
+            [{c: index[child] for c, child in new_edges[node].items()} for node in order],
+            [new_finals[node] for node in order])
+
+
+def char_class(chars: list[str]) -> str:
+    """字符集合的正则, 连续的三个以上字符合并为范围"""
+    if len(chars) == 1:
+        return re.escape(chars[0])
+    chars = sorted(chars)
+    parts = []
+    i = 0
+    while i < len(chars):
+        j = i
+        while j + 1 < len(chars) and ord(chars[j + 1]) == ord(chars[j]) + 1:
+            j += 1
+        if j - i >= 2:
+            parts.append(f"{class_escape(chars[i])}-{class_escape(chars[j])}")
+        else:
+            parts.extend(map(class_escape, chars[i:j + 1]))
+        i = j + 1
+    return f"[{''.join(parts)}]"
+
+
+def class_escape(c: str) -> str:
+    return f"\\{c}" if c in "\\]^-[" else c
+
+
+def post_dominators(dawg: Dawg) -> list[Optional[int]]:
+    """各节点的直接后必经节点, 关键字结尾视为指向虚拟终点 len(edges) 的边
+
+    从终点出发的所有路径都经过直接后必经节点, 以此提取公共后缀
+    """
+    end = len(dawg.edges)
+    ipdom: list[Optional[int]] = [None] * (end + 1)
+    depth = [0] * (end + 1)
+
+    # 节点编号为拓扑序, 逆序处理时后继已完成
+    for node in range(end - 1, -1, -1):
+        succs = set(dawg.edges[node].values())
+        if dawg.finals[node]:
+            succs.add(end)
+        it = iter(succs)
+        common = next(it)
+        for other in it:
+            while common != other:
+                if depth[common] >= depth[other]:
+                    common = ipdom[common]  # type: ignore[assignment]
+                else:
+                    other = ipdom[other]  # type: ignore[assignment]
+        ipdom[node] = common
+        depth[node] = depth[common] + 1
+    return ipdom
+
+
+def dawg_to_regex(dawg: Dawg) -> str:
+    """将最小化的前缀树转换为正则, 不使用递归
+
+    节点 u 到其直接后必经节点 d 之间为一段, 段内按目标节点分组出边,
+    指向同一目标的字符合并为字符类; 到达终点的段中, 关键字结尾为可选.
+    每个位置匹配最长的关键字, 与 to_re 生成的正则相同
+    """
+    end = len(dawg.edges)
+    if end == 1 and not dawg.finals[0]:
+        return "(?!)"
+    ipdom = post_dominators(dawg)
+    memo: dict[tuple[int, int], str] = {}
+
+    # 栈中为 (节点, 终止节点), 所需的子段都已计算后才计算本段
+    stack = [(0, end)]
+    while stack:
+        node, stop = stack[-1]
+        if (node, stop) in memo:
+            stack.pop()
+            continue
+        missing = []
+        parts = []
+        cur = node
+        while cur != stop:
+            nxt = ipdom[cur]
+            assert nxt is not None
+            targets: dict[int, list[str]] = {}
+            for c, child in dawg.edges[cur].items():
+                targets.setdefault(child, []).append(c)
+            # 按子节点在 nxt 之前的最后一个后必经节点分组, 同组共享其后的部分
+            groups: dict[int, list[tuple[int, list[str]]]] = {}
+            for child, chars in targets.items():
+                tail = child
+                if child != nxt:
+                    while ipdom[tail] != nxt:
+                        tail = ipdom[tail]  # type: ignore[assignment]
+                groups.setdefault(tail, []).append((child, chars))
+            for tail, members in groups.items():
+                if tail == nxt:
+                    continue
+                if len(members) == 1:
+                    needed = [(members[0][0], nxt)]
+                else:
+                    needed = [(tail, nxt)]
+                    needed.extend((child, tail) for child, _ in members if child != tail)
+                missing.extend(key for key in needed if key not in memo)
+            if not missing:
+                alts = []
+                for tail, members in groups.items():
+                    if tail == nxt:
+                        alts.extend(char_class(chars) for _, chars in members)
+                    elif len(members) == 1:
+                        child, chars = members[0]
+                        alts.append(char_class(chars) + memo[child, nxt])
+                    else:
+                        inner = sorted(
+                                char_class(chars) + (memo[child, tail] if child != tail else "")
+                                for child, chars in members)
+                        alts.append(f"(?:{'|'.join(inner)})" + memo[tail, nxt])
+                alts.sort()
+                optional = dawg.finals[cur]
+                if not alts:
+                    pass
+                elif len(alts) == 1 and not optional:
+                    parts.append(alts[0])
+                elif len(alts) == 1 and is_atom(alts[0]):
+                    parts.append(alts[0] + "?")
+                elif len(alts) == 1:
+                    parts.append(f"(?:{alts[0]})?")
+                else:
+                    parts.append(f"(?:{'|'.join(alts)})" + ("?" if optional else ""))
+            cur = nxt
+        if missing:
+            stack.extend(missing)
+            continue
+        memo[node, stop] = "".join(parts)
+        stack.pop()
+    return memo[0, end]
+
+
+def is_atom(regex: str) -> bool:
+    """是否可直接加量词而不需要分组: 单个字符, 字符类或一个完整的分组"""
+    if len(regex) == 1 or regex.startswith("\\") and len(regex) == 2:
+        return True
+    if regex[0] not in "[(":
+        return False
+    # 找到与开头匹配的结尾, 跳过转义与字符类中的字符
+    depth, i, in_class = 0, 0, False
+    while i < len(regex):
+        c = regex[i]
+        if c == "\\":
+            i += 1
+        elif in_class:
+            in_class = c != "]"
+        elif c == "[":
+            in_class = True
+            if depth == 0 and regex[0] == "[":
+                depth = -1
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        if depth == 0 and not in_class or depth == -1 and not in_class and c == "]":
+            return i == len(regex) - 1
+        i += 1
+    return False
+
+
+def kwds_to_regex(kwds: Iterable[str]) -> str:
+    """匹配 kwds 中任一关键字 (优先最长) 的正则, 关键字中的字符会被转义
+
+    >>> kwds_to_regex(["walking", "talking", "walk", "talk", "ball", "bell"])
+    '(?:(?:[tw]alk(?:ing)?|b[ae]ll))'
+    >>> re.findall(kwds_to_regex(["a", "ab", "a.c"]), "abc a.c ac")
+    ['ab', 'a.c', 'a']
+    """
+    return f"(?:{dawg_to_regex(build_dawg(kwds))})"
+
+
+class Automaton(NamedTuple):
+    """由 build 的前缀树构造的 Aho-Corasick 自动机
+
+    关键字中出现的字符按 classes 编号为 1 起的类别, 其余字符为 0.
+    状态以其在 table 中的行首 (编号 * width) 表示, 0 为起始状态;
+    table[state + 类别] 为已合并失败链接的转移, 目标状态有关键字后缀时取负.
+    转移表过大时 table 为 SparseTable.
+    depth[编号] 为状态对应前缀的长度, out[编号] 为其最长的关键字后缀长度 (无则为 0)
+    """
+    classes: dict[str, int]
+    width: int
+    table: "Sequence[int] | SparseTable"
+    depth: Sequence[int]
+    out: Sequence[int]
+
+
+# 稠密转移表的最大项数 (状态数 * width), 超过时使用 SparseTable;
+# 也保证 int32 的状态偏移不会溢出
+DENSE_LIMIT = 1 << 24
+
+
+class SparseTable:
+    """只保存前缀树的边的转移表, 与稠密表同样以 state + 类别 索引
+
+    编号 i 的边为 labels 与 targets 的 [starts[i], starts[i + 1]) 部分, labels 升序,
+    targets 为目标编号 (有关键字后缀时取负); 没有的边沿 fail 回退.
+    用于字母表很大 (如 Unicode 关键字) 时, 稠密表的大小为状态数乘以字符数
+    """
+    __slots__ = ("width", "starts", "labels", "targets", "fail")
+
+    def __init__(self, width: int, starts: Sequence[int], labels: Sequence[int],
+                 targets: Sequence[int], fail: Sequence[int]):
+        self.width = width
+        self.starts = starts
+        self.labels = labels
+        self.targets = targets
+        self.fail = fail
+
+    def __getitem__(self, key: int) -> int:
+        index, cls = divmod(key, self.width)
+        starts, labels = self.starts, self.labels
+        while True:
+            lo, hi = starts[index], starts[index + 1]
+            i = bisect_left(labels, cls, lo, hi)
+            if i < hi and labels[i] == cls:
+                return self.targets[i] * self.width
+            if not index:
+                return 0
+            index = self.fail[index]
+
+
+def build_automaton(root: dict) -> Automaton:
+    """广度优先计算失败链接, 并将其合并到平坦的转移表中
+
+    >>> ac = build_automaton(build(["he", "she", "his", "hers"]))
+    >>> list(finditer(ac, "ushers"))
+    [(1, 4, 'she')]
+    """
+    if "" in root:
+        raise ValueError("empty keyword")
+    chars = set()
+    states = 1
+    for node in _trie_nodes(root):
+        for c in node:
+            if c:
+                chars.add(c)
+                states += 1
+    classes = {c: i for i, c in enumerate(sorted(chars), 1)}
+    width = len(chars) + 1
+    if states * width > DENSE_LIMIT:
+        return _build_sparse(root, classes, width)
+
+    table = array("i")
+    depth = array("i", [0])
+    out = array("i", [0])
+    fail = [0]
+    queue = [root]
+    for index, node in enumerate(queue):
+        # 先复制失败状态的转移, 再以前缀树的边覆盖
+        state = index * width
+        if index:
+            row = fail[index] * width
+            table.extend(table[row:row + width])
+        else:
+            table.extend([0] * width)
+        for c, child in node.items():
+            if not c:
+                continue
+            # 起始状态的子状态失败到起始状态, 其余为失败状态在同一字符上的转移
+            child_fail = abs(table[state + classes[c]]) // width if index else 0
+            target = len(queue)
+            queue.append(child)
+            fail.append(child_fail)
+            depth.append(depth[index] + 1)
+            out.append(depth[index] + 1 if "" in child else out[child_fail])
+            table[state + classes[c]] = -target * width if out[target] else target * width
+    return Automaton(classes, width, table, depth, out)
+
+
+def _build_sparse(root: dict, classes: dict[str, int], width: int) -> Automaton:
+    """同 build_automaton, 但转移表为 SparseTable"""
+    starts = array("i", [0])
+    labels = array("i")
+    targets = array("i")
+    fail = array("i", [0])
+    depth = array("i", [0])
+    out = array("i", [0])
+    table = SparseTable(width, starts, labels, targets, fail)
+    queue = [root]
+    for index, node in enumerate(queue):
+        edges = sorted(((classes[c], child) for c, child in node.items() if c),
+                       key=lambda edge: edge[0])
+        for cls, child in edges:
+            # 失败状态及其失败链上的状态都已处理完
+            child_fail = abs(table[fail[index] * width + cls]) // width if index else 0
+            target = len(queue)
+            queue.append(child)
+            fail.append(child_fail)
+            depth.append(depth[index] + 1)
+            out.append(depth[index] + 1 if "" in child else out[child_fail])
+            labels.append(cls)
+            targets.append(-target if out[target] else target)
+        starts.append(len(labels))
+    return Automaton(classes, width, table, depth, out)
+
+
+def _trie_nodes(root: dict) -> Iterator[dict]:
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node.values())
+
+
+def _class_encoder(classes: dict[str, int]) -> tuple[Callable[[str], bytes], str]:
+    """将文本转换为类别编号的数组及其 memoryview 格式, 均在 C 中完成"""
+    chars = "".join(sorted(classes, key=classes.__getitem__))
+    other = re.compile(f"[^{re.escape(chars)}]" if chars else "(?s:.)")
+    codes = str.maketrans(chars, "".join(map(chr, range(1, len(chars) + 1))))
+    if len(chars) >= 256:
+        return lambda text: other.sub("\0", text).translate(codes).encode(
+                "utf-32-le", "surrogatepass"), "I"
+
+    ascii_codes = bytes(classes.get(chr(c), 0) for c in range(128)).ljust(256, b"\0")
+
+    def encode(text: str) -> bytes:
+        if text.isascii():
+            return text.encode("ascii").translate(ascii_codes)
+        return other.sub("\0", text).translate(codes).encode("latin-1")
+    return encode, "B"
+
+
+CHUNK_SIZE = 1 << 20
+
+
+def finditer(automaton: Automaton, text: str) -> Iterator[tuple[int, int, str]]:
+    """查找 text 中不重叠的关键字, 生成 (开始, 结束, 关键字)
+
+    与 re.finditer(kwds_to_regex(kwds), text) 的结果相同: 最左优先, 同一位置取最长
+
+    >>> ac = build_automaton(build(["a", "ab", "a.c"]))
+    >>> [m for _, _, m in finditer(ac, "abc a.c ac")]
+    ['ab', 'a.c', 'a']
+    """
+    return finditer_chunks(automaton, (
+        text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)))
+
+
+def finditer_chunks(automaton: Automaton, chunks: Iterable[str]
+                    ) -> Iterator[tuple[int, int, str]]:
+    """同 finditer, 但文本分块读入, 位置为整个文本中的偏移, 关键字可跨块
+
+    只保留从可能的匹配开始处至今的文本, 不超过最长关键字加一块.
+    找到匹配后继续扫描直到不可能有更左或更长的匹配, 然后从匹配结尾重新扫描,
+    故每个字符通常只被扫描一次, 最坏时被重扫不超过最长关键字长度次
+    """
+    _, width, table, depth, out = automaton
+    encode, code_format = _class_encoder(automaton.classes)
+    code_size = 4 if code_format == "I" else 1
+    chunks = iter(chunks)
+    buf = ""
+    encoded = b""
+    ids = memoryview(encoded)
+    base = 0    # buf[0] 在整个文本中的偏移
+    i = 0       # 扫描位置, buf 中的下标
+    state = 0
+    best_start = best_end = -1  # 当前最左最长的匹配, buf 中的下标
+    while True:
+        if i == len(buf):
+            chunk = next(chunks, None)
+            if chunk is not None:
+                keep = i - depth[state // width]
+                if best_start >= 0:
+                    keep = min(keep, best_start)
+                    best_start -= keep
+                    best_end -= keep
+                buf = buf[keep:] + chunk
+                encoded = encoded[keep * code_size:] + encode(chunk)
+                ids = memoryview(encoded).cast(code_format)
+                base += keep
+                i -= keep
+                continue
+            if best_start < 0:
+                return
+            # 文本结束, 不会再有更长的匹配
+            yield base + best_start, base + best_end, buf[best_start:best_end]
+            i, state, best_start = best_end, 0, -1
+            continue
+
+        if best_start < 0:
+            # 尚无匹配时只需找到第一个有关键字后缀的状态
+            for pos, cls in enumerate(ids[i:], i):
+                state = table[state + cls]
+                if state < 0:
+                    break
+            else:
+                i = len(buf)
+                continue
+            state = -state
+            i = pos + 1
+            best_start, best_end = i - out[state // width], i
+            continue
+
+        for pos, cls in enumerate(ids[i:], i):
+            state = abs(table[state + cls])
+            index = state // width
+            if pos + 1 - depth[index] > best_start:
+                # 当前状态已不包含开始于 best_start 或更左的前缀
+                break
+            found = out[index]
+            if found and pos + 1 - found <= best_start:
+                best_start, best_end = pos + 1 - found, pos + 1
+        else:
+            i = len(buf)
+            continue
+        yield base + best_start, base + best_end, buf[best_start:best_end]
+        i, state, best_start = best_end, 0, -1
+
+
+_HEADER = Struct("=8sc3xiqq")
+_MAGIC = b"ACAUTv1\0"
+_SPARSE_MAGIC = b"ACSPRv1\0"
+
+
+def save_automaton(automaton: Automaton, path: str) -> None:
+    """保存为可被 load_automaton 内存映射的文件, 先写临时文件再替换"""
+    classes, width, table, depth, out = automaton
+    if isinstance(table, SparseTable):
+        magic = _SPARSE_MAGIC
+        columns = (table.starts, table.labels, table.targets, table.fail, depth, out)
+    else:
+        magic = _MAGIC
+        columns = (table, depth, out)
+    chars = "".join(sorted(classes, key=classes.__getitem__)).encode("utf-8", "surrogatepass")
+    header = _HEADER.pack(magic, sys.byteorder[0].encode(), width, len(depth), len(chars))
+    fd, tmp = mkstemp(dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(header)
+            file.write(chars.ljust((len(chars) + 3) & ~3, b"\0"))
+            for column in columns:
+                file.write(memoryview(column).cast("B"))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load_automaton(path: str) -> Automaton:
+    """只读内存映射 save_automaton 保存的文件, 无需重新构建"""
+    with open(path, "rb") as file:
+        mapped = mmap(file.fileno(), 0, access=ACCESS_READ)
+    view = memoryview(mapped)
+    magic, byteorder, width, states, size = _HEADER.unpack_from(view)
+    if magic == _MAGIC:
+        lengths: tuple[int, ...] = (states * width, states, states)
+    elif magic == _SPARSE_MAGIC:
+        # 前缀树的边数为状态数减一
+        lengths = (states + 1, states - 1, states - 1, states, states, states)
+    else:
+        lengths = ()
+    if not lengths or byteorder != sys.byteorder[0].encode():
+        raise ValueError(f"not an automaton file for this machine: {path!r}")
+    offset = _HEADER.size
+    chars = bytes(view[offset:offset + size]).decode("utf-8", "surrogatepass")
+    offset += (size + 3) & ~3
+    columns = []
+    for length in lengths:
+        columns.append(view[offset:offset + length*4].cast("i"))
+        offset += length * 4
+    if magic == _SPARSE_MAGIC:
+        columns[:4] = [SparseTable(width, *columns[:4])]
+    classes = {c: i for i, c in enumerate(chars, 1)}
+    return Automaton(classes, width, *columns)
+
+
+def bench(n: int = 100_000, text_size: int = 1 << 20) -> None:
+    """与前缀树直接生成的正则对比大小, 编译耗时与匹配吞吐量"""
+    # pylint: disable=import-outside-toplevel
+    from random import Random
+    from time import perf_counter
+
+    rand = Random(0)
+    stems = ["".join(rand.choice("abcdefghijklmnopqrstuvwxyz")
+                     for _ in range(rand.randint(3, 8))) for _ in range(n // 3)]
+    # 每个词干取一组词尾, 如同词典中的词形变化
+    paradigms = [["", "s", "ed", "ing"], ["", "s", "er", "ers"], ["", "tion", "tions"],
+                 ["", "able", "ably"], ["", "ly", "ness"], [""]]
+    kwds = list(dict.fromkeys(
+            stem + suffix for stem in stems for suffix in rand.choice(paradigms)))[:n]
+    text = " ".join(rand.choice(kwds) if rand.random() < 0.3 else
+                    "".join(rand.choice("abcdefghijklmnopqrstuvwxyz ") for _ in range(8))
+                    for _ in range(text_size // 8))
+
+    def measure(name: str, make) -> list[str]:
+        start = perf_counter()
+        regex = make()
+        built = perf_counter() - start
+        start = perf_counter()
+        pattern = re.compile(regex)
+        compiled = perf_counter() - start
+        start = perf_counter()
+        found = pattern.findall(text)
+        matched = perf_counter() - start
+        print(f"{name:<8} {len(regex):>9} chars, build {built:.2f}s, "
+              f"compile {compiled:.2f}s, match {len(text) / matched / 1e6:.1f} MB/s")
+        return found
+
+    print(f"{len(kwds)} keywords, {len(text) >> 10} KiB text")
+    old = measure("trie", lambda: grouped(to_re(build(kwds))))
+    new = measure("dawg", lambda: kwds_to_regex(kwds))
+    assert old == new
+
+    start = perf_counter()
+    automaton = build_automaton(build(kwds))
+    built = perf_counter() - start
+    fd, path = mkstemp()
+    os.close(fd)
+    try:
+        save_automaton(automaton, path)
+        start = perf_counter()
+        automaton = load_automaton(path)
+        loaded = perf_counter() - start
+        start = perf_counter()
+        found = [m for _, _, m in finditer(automaton, text)]
+        matched = perf_counter() - start
+    finally:
+        os.unlink(path)
+    print(f"{'ac':<8} {len(automaton.depth):>9} states, build {built:.2f}s, "
+          f"load {loaded * 1e3:.1f}ms, match {len(text) / matched / 1e6:.1f} MB/s")
+    assert found == new
+
+
+def main() -> None:
+    if sys.argv[1:] == ["--bench"]:
+        bench()
+        return
+    text = sys.stdin.read()
+    kwds = text.strip().split("\n")
+    print(kwds_to_regex(kwds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+# -*- coding: utf-8; -*-
+"""test file"""
+
+import random
+import re
+
+import pytest
+
+from kwds_to_regex import (SparseTable, build, build_automaton, finditer,
+                           finditer_chunks, kwds_to_regex, load_automaton,
+                           save_automaton)
+
+
+@pytest.fixture(params=["dense", "sparse"])
+def table_kind(request, monkeypatch):
+    """以稠密或稀疏转移表运行"""
+    if request.param == "sparse":
+        monkeypatch.setattr("kwds_to_regex.DENSE_LIMIT", 0)
+    return request.param
+
+
+def random_case(rand: random.Random) -> tuple[list[str], str]:
+    alpha = rand.choice(["ab", "abc", "abcd", "a.c(", "xyz01"])
+    kwds = list({"".join(rand.choice(alpha) for _ in range(rand.randint(1, 6)))
+                 for _ in range(rand.randint(1, 25))})
+    text = "".join(rand.choice(alpha + " ") for _ in range(rand.randint(0, 80)))
+    return kwds, text
+
+
+def brute_force(kwds: list[str], text: str) -> list[tuple[int, int, str]]:
+    """逐位置尝试所有关键字, 最左优先, 同一位置取最长, 不重叠"""
+    result = []
+    i = 0
+    while i < len(text):
+        found = max((kwd for kwd in kwds if text.startswith(kwd, i)),
+                    key=len, default=None)
+        if found is None:
+            i += 1
+            continue
+        result.append((i, i + len(found), found))
+        i += len(found)
+    return result
+
+
+@pytest.mark.parametrize("alpha", ["ab", "abcdef", "a.c(", "-]^\\[", "xyz01"])
+def test_dawg_regex_brute_force(alpha):
+    rand = random.Random(alpha)
+    for _ in range(500):
+        kwds = list({"".join(rand.choices(alpha, k=rand.randint(1, 6)))
+                     for _ in range(rand.randint(1, 25))})
+        text = "".join(rand.choices(alpha + " ", k=rand.randint(0, 80)))
+        regex = kwds_to_regex(kwds)
+        assert [(m.start(), m.end(), m.group())
+                for m in re.finditer(regex, text)] \
+            == brute_force(kwds, text), (kwds, text, regex)
+
+
+def test_matches_regex(table_kind):
+    rand = random.Random(0)
+    for _ in range(2000):
+        kwds, text = random_case(rand)
+        expected = [(m.start(), m.end(), m.group())
+                    for m in re.finditer(kwds_to_regex(kwds), text)]
+        automaton = build_automaton(build(kwds))
+        assert isinstance(automaton.table, SparseTable) == (table_kind == "sparse")
+        assert list(finditer(automaton, text)) == expected, (kwds, text)
+        cuts = sorted(rand.sample(range(len(text) + 1), min(len(text) + 1, 4)))
+        chunks = [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+        assert list(finditer_chunks(automaton, chunks)) == expected, (kwds, chunks)
+
+
+def test_save_load(tmp_path, table_kind):
+    kwds = ["警告", "error", "err", "fail"]
+    automaton = build_automaton(build(kwds))
+    path = str(tmp_path / "kwds.ac")
+    save_automaton(automaton, path)
+    loaded = load_automaton(path)
+    assert isinstance(loaded.table, SparseTable) == (table_kind == "sparse")
+    text = "error: 警告 failed, err"
+    assert list(finditer(loaded, text)) == list(finditer(automaton, text))
+    assert [m for _, _, m in finditer(loaded, text)] == ["error", "警告", "fail", "err"]
+
+
+def test_empty_keyword():
+    with pytest.raises(ValueError):
+        build_automaton(build(["a", ""]))
+
+
+def test_wide_alphabet(table_kind):
+    rand = random.Random(1)
+    alpha = [chr(0x4e00 + i) for i in range(300)]
+    kwds = list({"".join(rand.choices(alpha[:rand.choice((3, 300))], k=rand.randint(1, 4)))
+                 for _ in range(2000)})
+    text = "".join(rand.choices(alpha[:3] + [" "], k=5000))
+    expected = [(m.start(), m.end(), m.group())
+                for m in re.finditer(kwds_to_regex(kwds), text)]
+    assert list(finditer(build_automaton(build(kwds)), text)) == expected
+
+
+def test_unicode_alphabet():
+    # 稠密表将有约 9000 * 3001 项, 应自动使用稀疏表
+    rand = random.Random(2)
+    alpha = [chr(0x4e00 + i) for i in range(3000)]
+    kwds = list({"".join(rand.choices(alpha, k=3)) for _ in range(3000)})
+    automaton = build_automaton(build(kwds))
+    assert isinstance(automaton.table, SparseTable)
+    assert len(automaton.table.labels) == len(automaton.depth) - 1
+    text = "".join(rand.choice(kwds) if rand.random() < 0.3 else rand.choice(alpha)
+                   for _ in range(3000))
+    expected = [(m.start(), m.end(), m.group())
+                for m in re.finditer(kwds_to_regex(kwds), text)]
+    assert list(finditer(automaton, text)) == expected
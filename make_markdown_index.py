@@ -2,79 +2,460 @@
 # -*- coding: utf-8; -*-
 """构建markdown的目录"""
 
+import os
+import pickle
 import re
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from getopt import gnu_getopt, GetoptError
+from glob import glob, has_magic
+from hashlib import sha256
+from locale import getpreferredencoding
 from sys import argv, stdin, stderr
+from tempfile import mkstemp
 from typing import Generator, Optional
 
+HEADING_REGEX = re.compile(r"^\s*(#+)\s+(\S+(?:\s\S+)*)\s*$")
+UNDERLINE_REGEX = re.compile(r"^\s*(?:(={3,})|(?:-{3,}))\s*$")
+# 开始的围栏, 结束的围栏需为同一字符且不短于开始
+FENCE_REGEX = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+TOC_START_REGEX = re.compile(r"^\s*<!--\s*toc(?:\s+hash=([0-9a-f]*))?\s*-->\s*$")
+TOC_STOP_REGEX = re.compile(r"^\s*<!--\s*tocstop\s*-->\s*$")
+FILTER_REGEX = re.compile(r"""[!"#$%&'()*+,./:;<=>?@\[\\\]^`{|}~]""")
 
-def usage() -> str:
-    return f"{argv[0]} <FILE>"
-
-def read() -> str:
-    match argv:
-        case _, "-h" | "--help":
-            print(usage())
-            print("build markdown index")
-            exit()
-        case _, "-":
-            return stdin.read()
-        case _, name:
-            with open(name, "r") as file:
-                return file.read()
-        case _, *args:
-            print(
-                    f"Input Args Invalid. ({args!r})",
-                    usage(),
-                    file=stderr,
-                    sep="\n",
-            )
-            exit(2)
-        case _:
-            raise RuntimeError()
+
+HELP_MSG = f"""\
+Usage: {argv[0]} [Options] <FILE|DIR|GLOB|->...
+       {argv[0]} --bench [MiB]
+build markdown index
+
+With one FILE (or -) print its index, otherwise print the index of each
+markdown file under the given directories and globs.
+
+Options:
+    -c, --combined      print one index linking into every file
+    -i, --in-place      regenerate the region between <!-- toc --> and
+                        <!-- tocstop --> in each file, skipping files whose
+                        index hash in the marker is unchanged
+    -j, --jobs=<N>      parse files in N processes, default 1
+    -n, --no-cache      do not use the heading tree cache
+    -h, --help          show this help
+"""
+MARKDOWN_SUFFIXES = (".md", ".markdown")
+CACHE_VERSION = 2
+CACHE_DIR = os.path.join(
+        os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+        "make_markdown_index")
+# 标题树, 每项为 (标题, 子树), 同级的重复标题各自保留
+Tree = list[tuple[str, "Tree"]]
+# 路径: (mtime_ns, size, sha256, 标题树)
+CacheEntry = tuple[int, int, bytes, Tree]
 
 
 def generate_index(
-        root: dict,
+        root: Tree,
         prefix: Optional[str] = None,
         insert_prefix: str = "- ",
+        link_prefix: str = "",
         ) -> Generator[str, None, None]:
-    filter_list = r"""[!"#$%&'()*+,./:;<=>?@\[\\\]^`{|}~]"""
-    if root:
-        if prefix is None:
-            prefix = insert_prefix
-        for title, elems in root.items():
-            linked_title = re.sub(filter_list, "", title.replace(" ", "-"))
+    """以显式栈遍历标题树, 重复的锚点依次加上 -1, -2 ... 后缀"""
+    if prefix is None:
+        prefix = insert_prefix
+    seen: dict[str, int] = {}
+    stack = [(prefix, iter(root))]
+    while stack:
+        prefix, items = stack[-1]
+        for title, elems in items:
+            linked_title = FILTER_REGEX.sub("", title.replace(" ", "-"))
+            if linked_title in seen:
+                while True:
+                    seen[linked_title] += 1
+                    unique = f"{linked_title}-{seen[linked_title]}"
+                    if unique not in seen:
+                        break
+                linked_title = unique
+            seen[linked_title] = 0
+
+            yield f"{prefix}[{title}]({link_prefix}#{linked_title})"
+            stack.append((f"{insert_prefix}{prefix}", iter(elems)))
+            break
+        else:
+            stack.pop()
+
 
-            yield f"{prefix}[{title}](#{linked_title})"
-            yield from generate_index(elems, prefix=f"{insert_prefix}{prefix}")
+def unfenced(lines: Iterable[str]) -> Iterator[tuple[int, str]]:
+    """产出代码围栏外的 (行号, 行), 开始围栏的行产出为空行, 围栏内的行跳过"""
+    fence: Optional[str] = None
+    fence_match = FENCE_REGEX.match
+    for lineno, line in enumerate(lines):
+        if fence is not None:
+            if line.lstrip(" ").startswith(fence) \
+                    and not line.strip().lstrip(fence[0]):
+                fence = None
+            continue
+        if (opening := fence_match(line)) is not None:
+            fence = opening[1]
+            yield lineno, ""
+            continue
+        yield lineno, line
 
 
-def build_tree(lines: list[str]) -> dict:
+def build_tree(lines: Iterable[str]) -> Tree:
+    """逐行构建标题树, 跳过代码围栏内的行, lines 可为打开的文件"""
     prev: str = ""
-    stack = [{}]
+    stack: list[Tree] = [[]]
 
     def add(level: int, title: str):
         while len(stack) > level:
             stack.pop()
-        last = stack[-1]
-        new_root = {}
-        last[title] = new_root
+        new_root: Tree = []
+        stack[-1].append((title, new_root))
         stack.append(new_root)
 
-    for line in lines:
-        if (title := re.match(r"^\s*(#+)\s+(\S+(?:\s?\S+)*)\s*$", line)) is not None:
+    heading_match = HEADING_REGEX.match
+    underline_match = UNDERLINE_REGEX.match
+    for _, line in unfenced(lines):
+        if (title := heading_match(line)) is not None:
             add(len(title[1]), title[2])
-        elif (title := re.match(r"^\s*(\S+(?:\s+\S+)*)\s*$", prev))\
-                and (floor := re.match(r"^\s*(?:(={3,})|(?:-{3,}))\s*$", line)):
-            add(int(floor[1] is None) + 1, title[1])
+        elif (floor := underline_match(line)) is not None \
+                and (stripped := prev.strip()):
+            add(int(floor[1] is None) + 1, stripped)
         prev = line
 
     return stack[0]
 
 
+def bench(size_mb: int = 1024) -> None:
+    """在临时生成的 size_mb MiB 文档上测量 build_tree 的耗时与内存峰值"""
+    # pylint: disable=import-outside-toplevel
+    from resource import RUSAGE_SELF, getrusage
+    from tempfile import TemporaryFile
+    from time import perf_counter
+
+    section = (
+            "# Chapter {0}\n\nSome text with `code` and a [link](#x).\n"
+            "\n## Section {0}\n\n```sh\n# not a heading\n```\n\n"
+            "Title {0}\n---\n\n"
+            + ("Lorem ipsum dolor sit amet. " * 4 + "\n") * 200 + "\n")
+    with TemporaryFile("w+") as file:
+        written, i = 0, 0
+        while written < size_mb << 20:
+            written += file.write(section.format(i))
+            i += 1
+        file.seek(0)
+        base_rss = getrusage(RUSAGE_SELF).ru_maxrss
+        start = perf_counter()
+        tree = build_tree(file)
+        elapsed = perf_counter() - start
+    rss = getrusage(RUSAGE_SELF).ru_maxrss
+    print(f"{written >> 20} MiB, {i} chapters: {elapsed:.2f}s, "
+          f"{(written >> 20) / elapsed:.0f} MiB/s, "
+          f"max rss +{(rss - base_rss) >> 10} MiB (tree {len(tree)} roots)")
+
+
+def expand_paths(args: list[str]) -> list[str]:
+    """展开目录 (递归查找 markdown 文件) 与通配符, 去重并保持顺序"""
+    paths: dict[str, None] = {}
+    for arg in args:
+        for path in sorted(glob(arg, recursive=True)) if has_magic(arg) else [arg]:
+            if not os.path.isdir(path):
+                paths[path] = None
+                continue
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith(MARKDOWN_SUFFIXES):
+                        paths[os.path.join(root, name)] = None
+    return list(paths)
+
+
+def file_digest(path: str) -> bytes:
+    with open(path, "rb") as file:
+        digest = sha256()
+        while chunk := file.read(1 << 20):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def parse_file(path: str, digest: Optional[bytes] = None) -> tuple[bytes, Optional[Tree]]:
+    """返回文件的 (sha256, 标题树), 与 digest 相同时不解析, 标题树为 None
+
+    没有旧的 digest 时在解析的同时计算哈希, 只读一遍文件
+    """
+    if digest is not None and file_digest(path) == digest:
+        return digest, None
+    new_digest = sha256()
+    encoding = getpreferredencoding(False)
+    with open(path, "rb") as file:
+        def lines() -> Iterator[str]:
+            for line in file:
+                new_digest.update(line)
+                yield line.decode(encoding)
+        tree = build_tree(lines())
+    return new_digest.digest(), tree
+
+
+def load_cache(cache_dir: str) -> dict[str, CacheEntry]:
+    try:
+        with open(os.path.join(cache_dir, f"trees.v{CACHE_VERSION}.pickle"), "rb") as file:
+            return pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return {}
+
+
+def save_cache(cache_dir: str, cache: dict[str, CacheEntry]) -> None:
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp = mkstemp(dir=cache_dir, prefix=".tmp.")
+        with os.fdopen(fd, "wb") as file:
+            pickle.dump(cache, file)
+        os.replace(tmp, os.path.join(cache_dir, f"trees.v{CACHE_VERSION}.pickle"))
+    except OSError as e:
+        print(f"make_markdown_index: write cache failed: {e}", file=stderr)
+
+
+def report_error(path: str, error: Exception) -> None:
+    """输出一个文件的错误, OSError 本身已包含路径"""
+    if isinstance(error, OSError):
+        print(f"make_markdown_index: {error}", file=stderr)
+    else:
+        print(f"make_markdown_index: {path}: {error}", file=stderr)
+
+
+def parse_file_safe(
+        path: str,
+        digest: Optional[bytes] = None,
+        ) -> tuple[bytes, Optional[Tree]] | OSError | ValueError:
+    """同 parse_file, 读取或解码失败时返回异常, 避免一个文件中止整个进程池"""
+    try:
+        return parse_file(path, digest)
+    except (OSError, ValueError) as e:
+        return e
+
+
+def build_trees(
+        paths: list[str],
+        jobs: int = 1,
+        cache_dir: Optional[str] = CACHE_DIR,
+        ) -> Iterator[tuple[str, Tree]]:
+    """按输入顺序产出各文件的 (路径, 标题树)
+
+    mtime 与 size 均未变的文件直接使用缓存, 否则重新计算哈希,
+    哈希也未变时只更新缓存的 mtime 与 size, 其余文件在进程池中解析
+    无法读取或解码的文件输出错误后跳过, 写回缓存时移除已不存在的文件
+    """
+    cache = load_cache(cache_dir) if cache_dir is not None else {}
+    trees: dict[str, Tree] = {}
+    todo: list[tuple[str, str, os.stat_result, Optional[bytes]]] = []
+    dirty = False
+    for path in paths:
+        if path == "-":
+            trees[path] = build_tree(stdin)
+            continue
+        key = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            print(f"make_markdown_index: {e}", file=stderr)
+            dirty |= cache.pop(key, None) is not None
+            continue
+        entry = cache.get(key)
+        if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+            trees[path] = entry[3]
+        else:
+            todo.append((path, key, stat, entry and entry[2]))
+
+    if todo:
+        dirty = True
+        args = ([path for path, *_ in todo], [digest for *_, digest in todo])
+        if jobs > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(jobs) as pool:
+                results = list(pool.map(
+                        parse_file_safe, *args, chunksize=max(1, len(todo) // (jobs * 4))))
+        else:
+            results = list(map(parse_file_safe, *args))
+        for (path, key, stat, _), result in zip(todo, results):
+            if isinstance(result, (OSError, ValueError)):
+                report_error(path, result)
+                cache.pop(key, None)
+                continue
+            digest, tree = result
+            if tree is None:
+                tree = cache[key][3]
+            cache[key] = (stat.st_mtime_ns, stat.st_size, digest, tree)
+            trees[path] = tree
+    if cache_dir is not None and dirty:
+        for key in [key for key in cache if not os.path.exists(key)]:
+            del cache[key]
+        save_cache(cache_dir, cache)
+
+    for path in paths:
+        if path in trees:
+            yield path, trees[path]
+
+
+def combined_index(trees: Iterable[tuple[str, Tree]], insert_prefix: str = "- ") -> Iterator[str]:
+    """跨文件的目录, 每个文件一项, 其下为链接到该文件内标题的目录"""
+    for path, tree in trees:
+        yield f"{insert_prefix}[{path}]({path})"
+        yield from generate_index(tree, insert_prefix * 2, insert_prefix, path)
+
+
+def find_toc(lines: Iterable[str]) -> tuple[Tree, Optional[tuple[int, int, str]]]:
+    """一遍读取, 返回 (标题树, 目录区域), 目录区域为 (开始标记行号, 结束标记行号, 标记中的哈希)
+
+    只识别代码围栏外的第一对标记
+    """
+    region: list = []
+
+    def scan() -> Iterator[str]:
+        start = stored = None
+        for lineno, line in unfenced(lines):
+            if len(region) == 0 and (marker := TOC_START_REGEX.match(line)):
+                start, stored = lineno, marker[1] or ""
+            elif start is not None and len(region) == 0 and TOC_STOP_REGEX.match(line):
+                region.extend((start, lineno, stored))
+            yield line
+
+    tree = build_tree(scan())
+    return tree, (region[0], region[1], region[2]) if region else None
+
+
+def toc_hash(index: list[str]) -> str:
+    return sha256("\n".join(index).encode()).hexdigest()[:16]
+
+
+def update_toc(path: str) -> str:
+    """重新生成 path 中标记的目录区域, 返回 updated, unchanged 或 no marker
+
+    目录的哈希与标记中记录的相同时不写入, 否则写入同目录的临时文件后原子替换
+    """
+    with open(path, "r", newline="") as file:
+        tree, region = find_toc(file)
+    if region is None:
+        return "no marker"
+    start, stop, stored = region
+    index = list(generate_index(tree))
+    digest = toc_hash(index)
+    if digest == stored:
+        return "unchanged"
+
+    fd, tmp = mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp.")
+    try:
+        with os.fdopen(fd, "w", newline="") as out, \
+                open(path, "r", newline="") as file:
+            for lineno, line in enumerate(file):
+                if lineno < start or lineno > stop:
+                    out.write(line)
+                elif lineno == start:
+                    newline = line[len(line.rstrip("\r\n")):] or "\n"
+                    out.write(f"<!-- toc hash={digest} -->{newline}")
+                    for item in index:
+                        out.write(f"{item}{newline}")
+                elif lineno == stop:
+                    out.write(line)
+        os.chmod(tmp, os.stat(path).st_mode)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return "updated"
+
+
+def update_toc_safe(path: str) -> str | OSError | ValueError:
+    """同 update_toc, 失败时返回异常, 避免一个文件中止其余文件"""
+    try:
+        return update_toc(path)
+    except (OSError, ValueError) as e:
+        return e
+
+
+def main() -> None:
+    try:
+        opts, args = gnu_getopt(argv[1:], "cij:nh", longopts=[
+            "combined",
+            "in-place",
+            "jobs=",
+            "no-cache",
+            "bench",
+            "help",
+        ])
+    except GetoptError as e:
+        print(f"ParseArg: {e}", file=stderr)
+        exit(2)
+
+    combined = in_place = False
+    jobs = 1
+    cache_dir: Optional[str] = CACHE_DIR
+    for opt, value in opts:
+        match opt:
+            case "-h" | "--help":
+                print(end=HELP_MSG)
+                exit()
+            case "--bench":
+                bench(*map(int, args))
+                exit()
+            case "-c" | "--combined":
+                combined = True
+            case "-i" | "--in-place":
+                in_place = True
+            case "-j" | "--jobs":
+                jobs = int(value)
+            case "-n" | "--no-cache":
+                cache_dir = None
+
+    if not args:
+        print("Input Args Invalid. (no FILE)", HELP_MSG, file=stderr, sep="\n")
+        exit(2)
+
+    paths = expand_paths(args)
+    if in_place:
+        if "-" in paths:
+            print("Input Args Invalid. (--in-place with -)", file=stderr)
+            exit(2)
+        if jobs > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(jobs) as pool:
+                results = list(pool.map(update_toc_safe, paths))
+        else:
+            results = list(map(update_toc_safe, paths))
+        failed = False
+        for path, result in zip(paths, results):
+            if isinstance(result, Exception):
+                report_error(path, result)
+                failed = True
+            elif result != "unchanged":
+                print(f"{path}: {result}", file=stderr)
+        if failed:
+            exit(1)
+        return
+
+    single = len(args) == 1 and not has_magic(args[0]) and not os.path.isdir(args[0])
+    if single and not combined:
+        if paths[0] == "-":
+            tree = build_tree(stdin)
+        else:
+            try:
+                with open(paths[0], "r") as file:
+                    tree = build_tree(file)
+            except (OSError, ValueError) as e:
+                report_error(paths[0], e)
+                exit(1)
+        for line in generate_index(tree):
+            print(line)
+        return
+
+    trees = list(build_trees(paths, jobs, cache_dir))
+    if combined:
+        for line in combined_index(trees):
+            print(line)
+    else:
+        for path, tree in trees:
+            print(f"<!-- {path} -->")
+            for line in generate_index(tree):
+                print(line)
+    if len(trees) < len(paths):
+        exit(1)
+
+
 if __name__ == '__main__':
-    text = read()
-    lines = text.splitlines()
-    tree = build_tree(lines)
-    for line in generate_index(tree):
-        print(line)
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+# -*- coding: utf-8; -*-
+"""test file"""
+
+import io
+import os
+
+import pytest
+
+import make_markdown_index
+from make_markdown_index import build_tree, build_trees, generate_index, load_cache, update_toc
+
+DOC = """\
+# A
+```sh
+# not a heading
+~~~
+still code
+````
+Text
+---
+  ~~~~ python
+## not either
+~~~
+~~~~~
+## B
+Title
+=====
+    ```
+# C
+"""
+
+
+def test_build_tree_skips_fences():
+    # 结束围栏需为同一字符且不短于开始围栏, 缩进 4 格的不是围栏
+    lines = iter(DOC.splitlines(keepends=True))
+    assert build_tree(lines) == [
+        ("A", [("Text", []), ("B", [])]),
+        ("Title", []),
+        ("C", []),
+    ]
+
+
+def test_build_tree_unclosed_fence():
+    # 未闭合的围栏延续到文件末尾
+    assert build_tree(["# A\n", "```\n", "# B\n"]) == [("A", [])]
+    assert build_tree(["Title\n", "```\n", "---\n"]) == []
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_build_trees_cache(tmp_path, jobs, monkeypatch):
+    cache = str(tmp_path / "cache")
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"{i}.md"
+        path.write_text(f"# T{i}\n")
+        paths.append(str(path))
+
+    def run(paths=paths) -> list:
+        return [tree for _, tree in build_trees(paths, jobs, cache)]
+
+    assert run() == [[(f"T{i}", [])] for i in range(4)]
+    # mtime 与 size 未变时不读取文件, 所以得到的是缓存的旧标题树
+    stat = os.stat(paths[0])
+    (tmp_path / "0.md").write_text("# X0\n")
+    os.utime(paths[0], ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert run()[0] == [("T0", [])]
+    # mtime 改变后重新计算哈希并解析
+    os.utime(paths[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    (tmp_path / "1.md").write_text("# T1\n## Sub\n")
+    assert run()[:2] == [[("X0", [])], [("T1", [("Sub", [])])]]
+    assert load_cache(cache)[paths[0]][0] == stat.st_mtime_ns + 10**9
+
+    # 不存在的路径报告后跳过, 已删除文件的缓存项被移除
+    err = io.StringIO()
+    monkeypatch.setattr(make_markdown_index, "stderr", err)
+    os.unlink(paths[3])
+    assert [path for path, _ in build_trees(paths + [str(tmp_path / "none.md")], jobs, cache)] \
+        == paths[:3]
+    assert "none.md" in err.getvalue() and "3.md" in err.getvalue()
+    assert sorted(load_cache(cache)) == sorted(paths[:3])
+
+
+def test_generate_index_dedup():
+    tree = [("A", [("A", []), ("A-1", [])]), ("A", []), ("B c?", [("A", [])])]
+    assert list(generate_index(tree)) == [
+        "- [A](#A)",
+        "- - [A](#A-1)",
+        "- - [A-1](#A-1-1)",
+        "- [A](#A-2)",
+        "- [B c?](#B-c)",
+        "- - [A](#A-3)",
+    ]
+
+
+def test_generate_index_deep():
+    depth = 5000
+    tree: list = []
+    node = tree
+    for i in range(depth):
+        node.append((f"H{i}", []))
+        node = node[0][1]
+    index = list(generate_index(tree, insert_prefix="*"))
+    assert len(index) == depth and index[-1] == "*" * depth + f"[H{depth - 1}](#H{depth - 1})"
+
+
+def test_update_toc(tmp_path):
+    path = tmp_path / "a.md"
+    path.write_bytes(b"# T\r\n<!-- toc -->\r\nold\r\n<!-- tocstop -->\r\n"
+                     b"```\r\n<!-- toc -->\r\n```\r\n## S\r\n")
+    assert update_toc(str(path)) == "updated"
+    text = path.read_bytes().decode()
+    assert text.startswith("# T\r\n<!-- toc hash=")
+    assert text.endswith("-->\r\n- [T](#T)\r\n- - [S](#S)\r\n<!-- tocstop -->\r\n"
+                         "```\r\n<!-- toc -->\r\n```\r\n## S\r\n")
+    stat = os.stat(path)
+    assert update_toc(str(path)) == "unchanged"
+    assert os.stat(path).st_mtime_ns == stat.st_mtime_ns
+
+    path.write_text(text.replace("## S", "## U"))
+    assert update_toc(str(path)) == "updated"
+    assert "- - [U](#U)" in path.read_text() and "[S]" not in path.read_text()
+    (tmp_path / "b.md").write_text("# T\n")
+    assert update_toc(str(tmp_path / "b.md")) == "no marker"
+    assert sorted(os.listdir(tmp_path)) == ["a.md", "b.md"]
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_undecodable_file(tmp_path, jobs, monkeypatch):
+    # 无法解码的文件报告后跳过, 不中止其余文件
+    paths = [str(tmp_path / name) for name in ["a.md", "bad.md", "c.md"]]
+    (tmp_path / "a.md").write_text("# A\n<!-- toc -->\n<!-- tocstop -->\n")
+    (tmp_path / "bad.md").write_bytes(b"# \xff\xfe\n<!-- toc -->\n<!-- tocstop -->\n")
+    (tmp_path / "c.md").write_text("# C\n<!-- toc -->\n<!-- tocstop -->\n")
+    err = io.StringIO()
+    monkeypatch.setattr(make_markdown_index, "stderr", err)
+    assert [path for path, _ in build_trees(paths, jobs, None)] == [paths[0], paths[2]]
+    assert f"{paths[1]}: 'utf-8' codec can't decode" in err.getvalue()
+
+    monkeypatch.setattr(make_markdown_index, "argv", ["make_markdown_index", "-i", "-j", str(jobs),
+                                                       *paths])
+    with pytest.raises(SystemExit) as exc:
+        make_markdown_index.main()
+    assert exc.value.code == 1
+    assert "- [A](#A)" in (tmp_path / "a.md").read_text()
+    assert "- [C](#C)" in (tmp_path / "c.md").read_text()
+    assert err.getvalue().count(f"{paths[1]}: 'utf-8' codec") == 2